@@ -0,0 +1,62 @@
+"""
+Cache des configurations d'agents pour les workers partagés (multi-tenant).
+L'API écrit une configuration JSON par agent dans AGENT_CONFIG_DIR; le worker
+la relit seulement lorsque le fichier a changé.
+"""
+
+import os
+import re
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger("voice_agent.agent_config")
+
+# Même contrôle que l'API: l'identifiant ne doit pas sortir du répertoire des configurations
+AGENT_ID_PATTERN = re.compile(r"[\w-]{1,128}")
+
+class AgentConfigCache:
+    """
+    Cache LRU des configurations d'agents, indexé par agent_id
+    """
+
+    def __init__(self, config_dir: str, max_entries: int = 1000):
+        self.config_dir = config_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retourne la configuration de l'agent, rechargée si le fichier a été modifié
+        """
+        if not AGENT_ID_PATTERN.fullmatch(agent_id):
+            logger.warning(f"Identifiant d'agent invalide: {agent_id!r}")
+            return None
+        path = os.path.join(self.config_dir, f"{agent_id}.json")
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._entries.pop(agent_id, None)
+            logger.warning(f"Configuration introuvable pour l'agent {agent_id}: {path}")
+            return None
+
+        entry = self._entries.get(agent_id)
+        if entry and entry["mtime"] == mtime:
+            self._entries.move_to_end(agent_id)
+            return entry["config"]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Impossible de lire la configuration de l'agent {agent_id}: {e}")
+            return entry["config"] if entry else None
+
+        self._entries[agent_id] = {"mtime": mtime, "config": config}
+        self._entries.move_to_end(agent_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        logger.info(f"Configuration de l'agent {agent_id} chargée")
+        return config
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Signalement des événements d'un appel (décroché, agent qui parle, raccroché, échec)
+à l'API, qui les diffuse en SSE / WebSocket et les transmet à Xano.
+Le service fournit AGENT_CALL_EVENTS_URL et AGENT_CALL_EVENTS_KEY.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+import aiohttp
+
+logger = logging.getLogger("voice_agent.call_events")
+
+class CallEventReporter:
+    """
+    Envoie les événements d'un appel en arrière-plan, sans jamais bloquer l'agent:
+    au-delà de max_pending événements en attente, les nouveaux sont abandonnés.
+    """
+
+    def __init__(self, call_id: Optional[str], url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_pending: int = 100, timeout: float = 5.0):
+        self.call_id = call_id
+        self.url = url or os.getenv("AGENT_CALL_EVENTS_URL")
+        self.api_key = api_key or os.getenv("AGENT_CALL_EVENTS_KEY", "")
+        self.timeout = timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.call_id and self.url)
+
+    def report(self, event: str, **data: Any) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait({"event": event, "data": data})
+        except asyncio.QueueFull:
+            logger.warning(f"File des événements d'appel pleine, événement {event} abandonné")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        self._session = aiohttp.ClientSession(
+            headers={"X-API-Key": self.api_key},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        endpoint = f"{self.url.rstrip('/')}/{self.call_id}/events"
+        while True:
+            payload = await self._queue.get()
+            try:
+                async with self._session.post(endpoint, json=payload) as response:
+                    if response.status >= 400:
+                        logger.warning(f"Événement {payload['event']} refusé par l'API: HTTP {response.status}")
+            except Exception as e:
+                logger.warning(f"Impossible de signaler l'événement {payload['event']}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def aclose(self, timeout: float = 2.0) -> None:
+        """
+        Laisse partir les derniers événements (raccroché) puis arrête l'envoi
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} événements d'appel non envoyés à l'arrêt")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+def watch_answered(room, participant, reporter: CallEventReporter) -> None:
+    """
+    Signale "answered" quand le participant SIP décroche (sip.callStatus == "active")
+    """
+    answered = {"reported": False}
+
+    def report_answered():
+        if not answered["reported"]:
+            answered["reported"] = True
+            reporter.report("answered", participant_identity=participant.identity)
+            room.off("participant_attributes_changed", on_attributes_changed)
+
+    def on_attributes_changed(changed_attributes: Dict[str, str], remote_participant):
+        if remote_participant.identity == participant.identity and changed_attributes.get("sip.callStatus") == "active":
+            report_answered()
+
+    room.on("participant_attributes_changed", on_attributes_changed)
+    if participant.attributes.get("sip.callStatus") == "active":
+        report_answered()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Contexte LLM borné pour les appels longs. Le prompt système et les derniers tours
+sont envoyés tels quels; les tours plus anciens sont remplacés par un résumé glissant,
+produit en arrière-plan par le LLM. Le nombre de tokens de chaque message n'est
+calculé qu'une fois, ce qui rend la vérification du budget quasi gratuite à chaque tour.
+
+Paramètres: AGENT_CONTEXT_MAX_TOKENS, AGENT_CONTEXT_KEEP_TURNS, AGENT_CONTEXT_SUMMARY_TOKENS.
+"""
+
+import os
+import bisect
+import asyncio
+import logging
+from typing import List, Optional
+from livekit.agents import lbm
+
+logger = logging.getLogger("voice_agent.chat_context")
+
+# Tokens ajoutés par message (rôle, séparateurs)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """
+Tu résumes le début d'une conversation téléphonique entre un assistant et un appelant.
+Conserve les faits utiles pour la suite de l'appel: identité et demandes de l'appelant,
+informations données, décisions et engagements pris. Réponds en français, en {max_words}
+mots au plus, sans reformuler le ton de la conversation.
+"""
+
+def count_tokens(text: str) -> int:
+    # Approximation sans tokenizer (environ 4 caractères par token), suffisante pour un budget
+    return (len(text) + 3) // 4
+
+def message_text(message: lbm.ChatMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(part for part in content if isinstance(part, str))
+    return str(content or "")
+
+def message_tokens(message: lbm.ChatMessage) -> int:
+    return count_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+class BoundedChatContext:
+    """
+    À brancher comme before_llm_cb du VoicePipelineAgent: réécrit la copie du contexte
+    envoyée au LLM sans modifier la transcription complète de l'agent.
+
+    Le contexte de l'agent ne fait que croître: les tokens sont mémorisés par position
+    et seuls les nouveaux messages sont comptés à chaque tour. Les positions sont
+    celles du contexte de l'agent (prompt système compris).
+    """
+
+    def __init__(self, llm: lbm.LLM, max_tokens: Optional[int] = None, keep_turns: Optional[int] = None,
+                 summary_tokens: Optional[int] = None):
+        self.llm = llm
+        self.max_tokens = max_tokens or int(os.getenv("AGENT_CONTEXT_MAX_TOKENS", "3000"))
+        self.keep_turns = keep_turns or int(os.getenv("AGENT_CONTEXT_KEEP_TURNS", "4"))
+        self.summary_tokens = summary_tokens or int(os.getenv("AGENT_CONTEXT_SUMMARY_TOKENS", "300"))
+        # Sommes cumulées des tokens par position: le total d'une plage se lit en O(1)
+        self._cumulative_tokens: List[int] = [0]
+        self._user_indexes: List[int] = []
+        self._summary: Optional[lbm.ChatMessage] = None
+        self._summary_token_count = 0
+        # Position du premier message non résumé
+        self._summarized_upto = 0
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def _update_counts(self, messages: List[lbm.ChatMessage]) -> None:
+        counted = len(self._cumulative_tokens) - 1
+        if len(messages) < counted:
+            # Contexte remplacé: tout recompter
+            self._cumulative_tokens = [0]
+            self._user_indexes = []
+            self._summarized_upto = 0
+            self._summary = None
+            self._summary_token_count = 0
+            counted = 0
+        for index in range(counted, len(messages)):
+            self._cumulative_tokens.append(self._cumulative_tokens[-1] + message_tokens(messages[index]))
+            if messages[index].role == "user":
+                self._user_indexes.append(index)
+
+    def _tokens(self, start: int, end: int) -> int:
+        return self._cumulative_tokens[end] - self._cumulative_tokens[start]
+
+    def _next_user_index(self, index: int) -> Optional[int]:
+        """
+        Premier message utilisateur après index (ne pas couper un tour ni un appel de fonction)
+        """
+        position = bisect.bisect_right(self._user_indexes, index)
+        return self._user_indexes[position] if position < len(self._user_indexes) else None
+
+    def before_llm(self, agent, chat_ctx: lbm.ChatContext) -> None:
+        messages = chat_ctx.messages
+        self._update_counts(messages)
+
+        prefix_length = 0
+        while prefix_length < len(messages) and messages[prefix_length].role == "system":
+            prefix_length += 1
+        self._summarized_upto = max(self._summarized_upto, prefix_length)
+
+        budget = self.max_tokens - self._tokens(0, prefix_length) - self._summary_token_count
+        start = self._summarized_upto
+
+        # Au-delà du budget, garder les tours les plus récents qui tiennent (les plus
+        # anciens seront couverts par le prochain résumé)
+        while self._tokens(start, len(messages)) > budget:
+            next_start = self._next_user_index(start)
+            if next_start is None:
+                break
+            start = next_start
+
+        if start > self._summarized_upto:
+            logger.info(f"Contexte LLM au-delà du budget, {start - self._summarized_upto} messages en attente de résumé omis")
+
+        self._maybe_summarize(messages)
+
+        kept = list(messages[:prefix_length])
+        if self._summary is not None:
+            kept.append(self._summary)
+        kept.extend(messages[start:])
+        chat_ctx.messages[:] = kept
+
+    def _maybe_summarize(self, messages: List[lbm.ChatMessage]) -> None:
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+
+        # Les keep_turns derniers tours utilisateur restent tels quels
+        if len(self._user_indexes) <= self.keep_turns:
+            return
+        cut = self._user_indexes[-self.keep_turns]
+        if cut <= self._summarized_upto:
+            return
+
+        # Résumer quand la partie non résumée occupe la moitié du budget, et par blocs
+        # d'au moins un quart du budget pour ne pas relancer le LLM à chaque tour
+        if (self._tokens(self._summarized_upto, len(messages)) < self.max_tokens // 2
+                or self._tokens(self._summarized_upto, cut) < self.max_tokens // 4):
+            return
+
+        self._summary_task = asyncio.create_task(self._summarize(messages[self._summarized_upto:cut], cut))
+
+    async def _summarize(self, messages: List[lbm.ChatMessage], cut: int) -> None:
+        transcript = "\n".join(f"{message.role}: {message_text(message)}" for message in messages if message_text(message))
+        if self._summary is not None:
+            transcript = f"Résumé précédent: {message_text(self._summary)}\n\n{transcript}"
+
+        summary_ctx = lbm.ChatContext().append(role="system", text=SUMMARY_PROMPT.format(max_words=self.summary_tokens * 3 // 4))
+        summary_ctx.append(role="user", text=transcript)
+        try:
+            stream = self.llm.chat(chat_ctx=summary_ctx)
+            parts = []
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+            finally:
+                await stream.aclose()
+        except Exception as e:
+            logger.error(f"Échec du résumé du contexte: {e}")
+            return
+
+        summary_text = "".join(parts).strip()
+        if not summary_text:
+            return
+        # Borner le résumé même si le LLM dépasse la longueur demandée
+        summary_text = summary_text[:self.summary_tokens * 4]
+
+        self._summary = lbm.ChatMessage.create(text=f"Résumé du début de l'appel: {summary_text}", role="system")
+        self._summary_token_count = message_tokens(self._summary)
+        logger.info(f"Contexte résumé: {cut - self._summarized_upto} messages -> {self._summary_token_count} tokens")
+        self._summarized_upto = cut
+
+    async def aclose(self) -> None:
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Lanceur des processus d'agents (forkserver), activé côté service par AGENT_FORKSERVER=1.
+
+Les modules lourds (livekit, plugins STT/LLM/TTS, onnxruntime) sont importés et le
+modèle VAD de Silero chargé une seule fois dans ce processus. Chaque agent est ensuite
+un fork du lanceur qui exécute voice_agent.py: ces pages mémoire sont partagées en
+copie sur écriture au lieu d'être rechargées par chaque agent.
+
+Protocole, une connexion au socket Unix par agent:
+    - le service envoie un octet accompagné des descripteurs stdout et stderr de
+      l'agent, puis une ligne JSON {"script": ..., "args": [...], "env": {...}};
+    - le lanceur répond {"pid": ...} (ou {"error": ...}), puis
+      {"pid": ..., "returncode": ...} sur la même connexion quand l'agent se termine.
+
+Le lanceur n'a ni thread ni boucle asyncio: un fork ne peut pas hériter d'un verrou
+pris par un autre thread. Il s'arrête avec le service qui l'a lancé; les agents
+déjà lancés continuent de fonctionner.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import runpy
+import select
+import signal
+import socket
+import logging
+import argparse
+import traceback
+from typing import Dict, List
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger("agent_forkserver")
+
+# Taille maximale d'une demande de lancement (environnement et prompt compris)
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+def preload() -> None:
+    """
+    Importe les modules communs à tous les agents et charge le VAD
+    """
+    start_time = time.time()
+    import numpy  # noqa: F401
+    import aiohttp  # noqa: F401
+    from livekit.agents import cli, lbm  # noqa: F401
+    from livekit.agents.pipeline import VoicePipelineAgent  # noqa: F401
+    from livekit.plugins import openai, deepgram, silero  # noqa: F401
+    import preloaded
+
+    preloaded.set_vad(silero.VAD.vad())
+
+    gc.collect()
+    # Les objets préchargés ne sont plus parcourus par le ramasse-miettes: une collecte
+    # dans un agent écrirait sinon dans leurs pages et annulerait le partage
+    gc.freeze()
+    logger.info(f"Modules et VAD préchargés en {time.time() - start_time:.1f}s ({gc.get_freeze_count()} objets gelés)")
+
+def read_request(conn: socket.socket):
+    """
+    Lit une demande de lancement: descripteurs stdout/stderr puis ligne JSON
+    """
+    marker, fds, _, _ = socket.recv_fds(conn, 1, 2)
+    if not marker and not fds:
+        # Connexion de test du service (attente de la disponibilité du lanceur)
+        return None, []
+    if len(fds) != 2:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("Descripteurs stdout/stderr manquants")
+
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk or len(data) > MAX_REQUEST_BYTES:
+            for fd in fds:
+                os.close(fd)
+            raise ValueError("Demande de lancement incomplète")
+        data += chunk
+    return json.loads(data), fds
+
+def run_agent(request: Dict, fds: List[int]) -> None:
+    """
+    Exécuté dans le fork: devient le processus d'agent puis se termine
+    """
+    code = 1
+    try:
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+
+        os.environ.clear()
+        os.environ.update(request["env"])
+
+        script = request["script"]
+        sys.argv = [script] + list(request.get("args", []))
+        sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+        runpy.run_path(script, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+class Forkserver:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.parent_pid = os.getppid()
+        # Connexion du service par agent lancé, pour lui transmettre le code de sortie
+        self.children: Dict[int, socket.socket] = {}
+        self.running = True
+
+    def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        self.server.listen(64)
+
+        # SIGCHLD réveille la boucle pour récupérer les codes de sortie sans attendre
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_w, False)
+        signal.set_wakeup_fd(self.wakeup_w)
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        logger.info(f"Lanceur d'agents en écoute: {self.socket_path}")
+        try:
+            while self.running:
+                try:
+                    readable, _, _ = select.select([self.server, self.wakeup_r], [], [], 1.0)
+                except InterruptedError:
+                    continue
+                if self.wakeup_r in readable:
+                    os.read(self.wakeup_r, 4096)
+                if self.server in readable:
+                    self._accept()
+                self._reap()
+                if os.getppid() != self.parent_pid:
+                    logger.info("Service arrêté, arrêt du lanceur d'agents")
+                    break
+        finally:
+            self.server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _stop(self, *_) -> None:
+        self.running = False
+
+    def _accept(self) -> None:
+        conn, _ = self.server.accept()
+        conn.settimeout(5)
+        try:
+            request, fds = read_request(conn)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Demande de lancement invalide: {e}")
+            self._send(conn, {"error": str(e)})
+            conn.close()
+            return
+        if request is None:
+            conn.close()
+            return
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            pid = os.fork()
+        except OSError as e:
+            for fd in fds:
+                os.close(fd)
+            self._send(conn, {"error": f"fork impossible: {e}"})
+            conn.close()
+            return
+
+        if pid == 0:
+            # Le processus d'agent ne garde rien du lanceur
+            signal.set_wakeup_fd(-1)
+            for signum in (signal.SIGCHLD, signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+            self.server.close()
+            conn.close()
+            for child_conn in self.children.values():
+                child_conn.close()
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            run_agent(request, fds)
+
+        for fd in fds:
+            os.close(fd)
+        logger.info(f"Agent lancé: pid={pid}")
+        if self._send(conn, {"pid": pid}):
+            self.children[pid] = conn
+        else:
+            conn.close()
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            returncode = os.waitstatus_to_exitcode(status)
+            logger.info(f"Agent pid={pid} terminé (code {returncode})")
+            conn = self.children.pop(pid, None)
+            if conn is not None:
+                self._send(conn, {"pid": pid, "returncode": returncode})
+                conn.close()
+
+    def _send(self, conn: socket.socket, message: Dict) -> bool:
+        try:
+            conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+            return True
+        except OSError:
+            # Le service n'attend plus ce processus
+            return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Lanceur des processus d'agents vocaux (fork)")
+    parser.add_argument("--socket", type=str, required=True, help="Socket Unix des demandes de lancement")
+    args = parser.parse_args()
+
+    preload()
+    Forkserver(args.socket).serve()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Plugins STT, LLM et TTS simulés pour les tests de charge de l'agent vocal.
+Les délais sont fixes et les transcriptions/réponses proviennent de listes prédéfinies,
+ce qui rend les sessions reproductibles sans appeler Deepgram ni OpenAI.
+
+Activés par AGENT_MOCK_PLUGINS=1. Paramètres (millisecondes):
+    MOCK_STT_DELAY_MS, MOCK_LLM_TTFT_MS, MOCK_LLM_TOKEN_MS, MOCK_TTS_TTFB_MS
+et MOCK_TRANSCRIPTS (fichier texte, une transcription par ligne).
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+import itertools
+from typing import List, Optional
+import numpy as np
+from livekit import rtc
+from livekit.agents import stt, tts, lbm
+
+logger = logging.getLogger("voice_agent.mock_plugins")
+
+DEFAULT_TRANSCRIPTS = [
+    "Bonjour, je voudrais des informations sur mon contrat.",
+    "Est-ce que vous pouvez me rappeler demain matin?",
+    "Quel est le montant de ma dernière facture?",
+    "Merci, ce sera tout pour aujourd'hui.",
+]
+
+DEFAULT_REPLIES = [
+    "Bien sûr, je peux vous aider. Pouvez-vous me donner votre numéro de client?",
+    "Très bien, je note un rappel pour demain matin entre neuf heures et midi.",
+    "Votre dernière facture s'élève à quarante-deux euros, payée le cinq du mois.",
+    "Merci de votre appel, je vous souhaite une excellente journée.",
+]
+
+FRAME_DURATION_MS = 20
+
+def _delay(name: str, default_ms: float) -> float:
+    return float(os.getenv(name, str(default_ms))) / 1000
+
+def _load_lines(path: Optional[str], default: List[str]) -> List[str]:
+    if not path:
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return lines or default
+
+class MockSTT(stt.STT):
+    """
+    STT non streaming: l'agent le combine avec le VAD. Chaque segment de parole
+    reçoit la transcription suivante de la liste, après un délai fixe.
+    """
+
+    def __init__(self, transcripts: Optional[List[str]] = None, delay: Optional[float] = None):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=False, interim_results=False))
+        self.transcripts = transcripts or _load_lines(os.getenv("MOCK_TRANSCRIPTS"), DEFAULT_TRANSCRIPTS)
+        self.delay = delay if delay is not None else _delay("MOCK_STT_DELAY_MS", 150)
+        self._next = itertools.cycle(self.transcripts)
+
+    async def _recognize_impl(self, buffer, *, language: Optional[str] = None) -> stt.SpeechEvent:
+        await asyncio.sleep(self.delay)
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            alternatives=[stt.SpeechData(language=language or "fr", text=next(self._next))]
+        )
+
+class MockLLMStream(lbm.LLMStream):
+    def __init__(self, llm: "MockLLM", *, chat_ctx: lbm.ChatContext, fnc_ctx, reply: str):
+        super().__init__(llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx)
+        self._reply = reply
+
+    async def _main_task(self) -> None:
+        request_id = uuid.uuid4().hex
+        await asyncio.sleep(self._llm.ttft)
+        for index, word in enumerate(self._reply.split()):
+            if index:
+                await asyncio.sleep(self._llm.token_delay)
+            self._event_ch.send_nowait(lbm.ChatChunk(
+                request_id=request_id,
+                choices=[lbm.Choice(delta=lbm.ChoiceDelta(role="assistant", content=word + " "))]
+            ))
+
+class MockLLM(lbm.LLM):
+    """
+    Répond par une phrase prédéfinie, choisie à partir du dernier message utilisateur,
+    avec un délai avant le premier token puis un délai fixe par mot.
+    """
+
+    def __init__(self, replies: Optional[List[str]] = None, ttft: Optional[float] = None, token_delay: Optional[float] = None):
+        super().__init__()
+        self.replies = replies or DEFAULT_REPLIES
+        self.ttft = ttft if ttft is not None else _delay("MOCK_LLM_TTFT_MS", 300)
+        self.token_delay = token_delay if token_delay is not None else _delay("MOCK_LLM_TOKEN_MS", 20)
+
+    def chat(self, *, chat_ctx: lbm.ChatContext, fnc_ctx=None, temperature=None, n=None, parallel_tool_calls=None) -> MockLLMStream:
+        user_messages = [message for message in chat_ctx.messages if message.role == "user"]
+        last_text = str(user_messages[-1].content) if user_messages else ""
+        # Choix déterministe: même transcription, même réponse
+        reply = self.replies[sum(last_text.encode("utf-8")) % len(self.replies)]
+        return MockLLMStream(self, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, reply=reply)
+
+class MockChunkedStream(tts.ChunkedStream):
+    def __init__(self, tts_plugin: "MockTTS", text: str):
+        super().__init__(tts=tts_plugin, input_text=text)
+        self._mock = tts_plugin
+
+    async def _main_task(self) -> None:
+        request_id = uuid.uuid4().hex
+        await asyncio.sleep(self._mock.ttfb)
+        for frame in self._mock.render_frames(self._input_text):
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+
+class MockTTS(tts.TTS):
+    """
+    Produit un signal audio dont la durée est proportionnelle au texte (environ 60ms
+    par caractère), après un délai fixe avant le premier octet.
+    """
+
+    def __init__(self, sample_rate: int = 24000, ttfb: Optional[float] = None, ms_per_char: float = 60.0):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=sample_rate, num_channels=1)
+        self.ttfb = ttfb if ttfb is not None else _delay("MOCK_TTS_TTFB_MS", 200)
+        self.ms_per_char = ms_per_char
+
+    def synthesize(self, text: str) -> MockChunkedStream:
+        return MockChunkedStream(self, text)
+
+    def render_frames(self, text: str) -> List[rtc.AudioFrame]:
+        samples_per_frame = self.sample_rate * FRAME_DURATION_MS // 1000
+        frame_count = max(1, int(len(text) * self.ms_per_char / FRAME_DURATION_MS))
+        t = np.arange(samples_per_frame * frame_count) / self.sample_rate
+        pcm = (0.1 * 32767 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+        return [
+            rtc.AudioFrame(
+                data=pcm[i * samples_per_frame:(i + 1) * samples_per_frame].tobytes(),
+                sample_rate=self.sample_rate,
+                num_channels=1,
+                samples_per_channel=samples_per_frame
+            )
+            for i in range(frame_count)
+        ]
+
+def create_mock_plugins():
+    logger.info("Utilisation des plugins STT/LLM/TTS simulés")
+    return MockSTT(), MockLLM(), MockTTS()
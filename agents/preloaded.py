@@ -0,0 +1,16 @@
+"""
+Modèles chargés une seule fois par le lanceur d'agents (forkserver.py) avant de créer
+les processus d'agents: un agent issu d'un fork les réutilise au lieu de les recharger.
+Dans un agent lancé directement, rien n'est préchargé.
+"""
+
+from typing import Any, Optional
+
+_vad: Optional[Any] = None
+
+def set_vad(vad: Any) -> None:
+    global _vad
+    _vad = vad
+
+def get_vad() -> Optional[Any]:
+    return _vad
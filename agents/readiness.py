@@ -0,0 +1,29 @@
+"""
+Signalement de l'état de préparation de l'agent au service qui l'a lancé.
+Le service fournit AGENT_READY_SOCKET (socket Unix) et AGENT_READY_TOKEN.
+"""
+
+import os
+import json
+import socket
+import logging
+
+logger = logging.getLogger("voice_agent.readiness")
+
+def notify(event: str) -> None:
+    """
+    Envoie une étape de préparation ("prewarmed", "registered") au service parent
+    """
+    socket_path = os.getenv("AGENT_READY_SOCKET")
+    token = os.getenv("AGENT_READY_TOKEN")
+    if not socket_path or not token:
+        return
+
+    message = json.dumps({"token": token, "event": event, "pid": os.getpid()}) + "\n"
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(socket_path)
+            sock.sendall(message.encode("utf-8"))
+    except OSError as e:
+        logger.warning(f"Impossible de signaler l'étape {event}: {e}")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Cache des réponses du LLM aux questions récurrentes (horaires, adresse, tarifs).
+Une réponse n'est réutilisée que pour un tour sans autre contexte (première question
+de l'appel): la clé est la transcription normalisée et l'empreinte du prompt de l'agent.
+Par défaut, seule une transcription identique après normalisation réutilise la réponse.
+Un agent peut accepter les transcriptions proches en fixant "response_cache_similarity"
+(inférieur à 1.0) dans sa configuration; une transcription proche dont les nombres
+diffèrent n'est jamais servie depuis le cache. L'audio TTS de la réponse est restitué
+depuis le cache TTS, en mémoire seulement (AGENT_TTS_CACHE_RECORDED_SIZE phrases au plus).
+
+Activé par AGENT_RESPONSE_CACHE=1. Paramètres: AGENT_RESPONSE_CACHE_SIZE,
+AGENT_RESPONSE_CACHE_TTL, AGENT_RESPONSE_CACHE_SIMILARITY (1.0 par défaut, surchargé
+par "response_cache_similarity" dans la configuration d'un agent).
+"""
+
+import os
+import re
+import time
+import uuid
+import difflib
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from livekit.agents import lbm
+
+logger = logging.getLogger("voice_agent.response_cache")
+
+def normalize_transcript(text: str) -> str:
+    """
+    Minuscules, sans accents ni ponctuation, espaces réduits
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+# Nombres écrits en toutes lettres (après normalisation, sans accents)
+NUMBER_WORDS = {
+    "zero", "un", "une", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf",
+    "dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "vingt", "vingts",
+    "trente", "quarante", "cinquante", "soixante", "cent", "cents", "mille", "premier",
+    "premiere", "second", "seconde", "deuxieme", "troisieme", "demi", "demie",
+}
+
+def number_tokens(text: str) -> Tuple[str, ...]:
+    """
+    Nombres d'une transcription normalisée, dans l'ordre (chiffres ou en lettres)
+    """
+    return tuple(token for token in text.split() if token.isdigit() or token in NUMBER_WORDS
+                 or any(char.isdigit() for char in token))
+
+def prompt_hash(chat_ctx: lbm.ChatContext) -> str:
+    system_text = "\n".join(str(message.content) for message in chat_ctx.messages if message.role == "system")
+    return hashlib.sha256(system_text.encode("utf-8")).hexdigest()[:16]
+
+def cacheable_question(chat_ctx: lbm.ChatContext) -> Optional[str]:
+    """
+    Texte de la question si le tour ne dépend d'aucun autre contexte: uniquement le
+    prompt système, d'éventuels messages de l'assistant (accueil) et la question
+    """
+    messages = chat_ctx.messages
+    if not messages or messages[-1].role != "user" or not isinstance(messages[-1].content, str):
+        return None
+    for message in messages[:-1]:
+        if message.role not in ("system", "assistant") or getattr(message, "tool_calls", None):
+            return None
+    return messages[-1].content
+
+class ResponseCache:
+    """
+    Cache LRU avec expiration, partagé par les appels du processus
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("AGENT_RESPONSE_CACHE_SIZE", "500"))
+        self.ttl = ttl or float(os.getenv("AGENT_RESPONSE_CACHE_TTL", "3600"))
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # Textes des réponses en cache: leur audio TTS mérite d'être conservé
+        self._reply_texts: Dict[str, int] = {}
+        # Réponses en cours de génération (le TTS commence avant la fin du LLM)
+        self._recording: Dict[int, List[str]] = {}
+        self.stats = {"hits": 0, "misses": 0, "saved_ms": 0.0}
+
+    def lookup(self, prompt_key: str, question: str, similarity: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = self._entries.get((prompt_key, question))
+        if entry is None and similarity < 1.0:
+            entry = self._closest(prompt_key, question, similarity, now)
+        if entry is not None and entry["expires_at"] <= now:
+            self._remove(entry["key"])
+            entry = None
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(entry["key"])
+        self.stats["hits"] += 1
+        self.stats["saved_ms"] += entry["llm_ms"]
+        return entry
+
+    def _closest(self, prompt_key: str, question: str, similarity: float, now: float) -> Optional[Dict[str, Any]]:
+        best, best_ratio = None, similarity
+        numbers = number_tokens(question)
+        for (entry_prompt, entry_question), entry in self._entries.items():
+            if entry_prompt != prompt_key or entry["expires_at"] <= now:
+                continue
+            # "formule à 20 euros" et "formule à 30 euros" n'appellent pas la même réponse
+            if number_tokens(entry_question) != numbers:
+                continue
+            matcher = difflib.SequenceMatcher(None, question, entry_question)
+            # Bornes supérieures rapides avant le calcul complet
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = entry, ratio
+        return best
+
+    def store(self, prompt_key: str, question: str, reply: str, llm_ms: float) -> None:
+        key = (prompt_key, question)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {"key": key, "reply": reply, "llm_ms": llm_ms, "expires_at": time.time() + self.ttl}
+        self._reply_texts[reply] = self._reply_texts.get(reply, 0) + 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        count = self._reply_texts.get(entry["reply"], 0) - 1
+        if count > 0:
+            self._reply_texts[entry["reply"]] = count
+        else:
+            self._reply_texts.pop(entry["reply"], None)
+
+    def is_cached_reply_text(self, text: str) -> bool:
+        """
+        Indique si le texte fait partie d'une réponse en cache (phrase ou réponse entière)
+        """
+        text = text.strip()
+        if not text:
+            return False
+        return (any(text in reply for reply in self._reply_texts)
+                or any(text in "".join(parts) for parts in self._recording.values()))
+
+    def begin_recording(self, parts: List[str]) -> None:
+        self._recording[id(parts)] = parts
+
+    def end_recording(self, parts: List[str]) -> None:
+        self._recording.pop(id(parts), None)
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (f"{len(self._entries)} réponses, taux de succès {hit_rate:.0%} "
+                f"sur {lookups} questions, {self.stats['saved_ms'] / 1000:.1f}s de LLM économisées")
+
+class CachedLLMStream(lbm.LLMStream):
+    """
+    Restitue une réponse en cache comme un flux LLM
+    """
+
+    def __init__(self, llm: lbm.LLM, *, chat_ctx: lbm.ChatContext, fnc_ctx, reply: str):
+        super().__init__(llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx)
+        self._reply = reply
+
+    async def _main_task(self) -> None:
+        self._event_ch.send_nowait(lbm.ChatChunk(
+            request_id=uuid.uuid4().hex,
+            choices=[lbm.Choice(delta=lbm.ChoiceDelta(role="assistant", content=self._reply))]
+        ))
+
+class RecordingLLMStream(lbm.LLMStream):
+    """
+    Relaie le flux du LLM et met la réponse complète en cache si elle ne contient
+    que du texte (pas d'appel de fonction)
+    """
+
+    def __init__(self, llm: lbm.LLM, *, chat_ctx: lbm.ChatContext, fnc_ctx, cache: ResponseCache,
+                 prompt_key: str, question: str):
+        super().__init__(llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx)
+        self._cache = cache
+        self._prompt_key = prompt_key
+        self._question = question
+
+    async def _main_task(self) -> None:
+        start_time = time.perf_counter()
+        parts = []
+        cacheable = True
+        stream = self._llm.chat(chat_ctx=self._chat_ctx, fnc_ctx=self._fnc_ctx)
+        self._cache.begin_recording(parts)
+        try:
+            async for chunk in stream:
+                for choice in chunk.choices:
+                    if getattr(choice.delta, "tool_calls", None):
+                        cacheable = False
+                    if choice.delta.content:
+                        parts.append(choice.delta.content)
+                self._event_ch.send_nowait(chunk)
+        finally:
+            self._cache.end_recording(parts)
+            await stream.aclose()
+
+        reply = "".join(parts).strip()
+        if cacheable and reply:
+            self._cache.store(self._prompt_key, self._question, reply, (time.perf_counter() - start_time) * 1000)
+
+class ResponseCacheSession:
+    """
+    Branchement du cache pour un appel: à appeler depuis le before_llm_cb de l'agent.
+    Retourne un flux LLM (réponse en cache ou réponse enregistrée) pour les tours
+    éligibles, None sinon.
+    """
+
+    def __init__(self, cache: ResponseCache, llm: lbm.LLM, similarity: float):
+        self.cache = cache
+        self.llm = llm
+        self.similarity = similarity
+
+    def before_llm(self, agent, chat_ctx: lbm.ChatContext) -> Optional[lbm.LLMStream]:
+        question = cacheable_question(chat_ctx)
+        if question is None:
+            return None
+        normalized = normalize_transcript(question)
+        if not normalized:
+            return None
+
+        prompt_key = prompt_hash(chat_ctx)
+        fnc_ctx = getattr(agent, "fnc_ctx", None)
+        entry = self.cache.lookup(prompt_key, normalized, self.similarity)
+        if entry is not None:
+            logger.info(f"Réponse en cache (~{int(entry['llm_ms'])}ms de LLM économisées; {self.cache.summary()}): {question[:60]!r}")
+            return CachedLLMStream(self.llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, reply=entry["reply"])
+
+        logger.info(f"Réponse absente du cache ({self.cache.summary()}): {question[:60]!r}")
+        return RecordingLLMStream(self.llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, cache=self.cache,
+                                  prompt_key=prompt_key, question=normalized)
+
+def response_cache_similarity(agent_config: Optional[Dict[str, Any]]) -> float:
+    """
+    Seuil de similarité de l'agent (1.0: transcription identique après normalisation).
+    Un seuil bas sert des réponses à des questions différentes ("ouverts dimanche" et
+    "ouverts demain" sont similaires à 0.92): à abaisser agent par agent.
+    """
+    if agent_config and agent_config.get("response_cache_similarity") is not None:
+        return float(agent_config["response_cache_similarity"])
+    return float(os.getenv("AGENT_RESPONSE_CACHE_SIMILARITY", "1.0"))
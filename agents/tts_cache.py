@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Cache de l'audio TTS pré-synthétisé pour les phrases fixes (message de bienvenue, etc.).
+L'audio est indexé par texte, voix et modèle, conservé en mémoire et persisté sur disque.
+L'audio des réponses enregistré pendant les appels (réponses en cache) reste en mémoire,
+dans un cache borné: les réponses du LLM changent, le répertoire ne grossit pas avec elles.
+
+Pré-rendu d'une liste de phrases (une par ligne):
+    python agents/tts_cache.py --phrases phrases.txt --voice alloy --model tts-1
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+from collections import OrderedDict
+from typing import Callable, List, Optional, Set
+from dotenv import load_dotenv
+from livekit import rtc
+from livekit.agents import tts
+
+logger = logging.getLogger("voice_agent.tts_cache")
+
+# Durée des trames publiées dans la salle
+FRAME_DURATION_MS = 20
+
+# Répertoire par défaut du cache (AGENT_TTS_CACHE_DIR), commun à l'agent et au pré-rendu
+# quel que soit le répertoire courant
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_audio_cache")
+
+class CachedAudio:
+    """
+    Audio PCM 16 bits déjà encodé pour une phrase
+    """
+
+    def __init__(self, text: str, pcm: bytes, sample_rate: int, num_channels: int):
+        self.text = text
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / (2 * self.num_channels * self.sample_rate)
+
+    def frames(self) -> List[rtc.AudioFrame]:
+        samples_per_frame = self.sample_rate * FRAME_DURATION_MS // 1000
+        frame_bytes = samples_per_frame * self.num_channels * 2
+        frames = []
+        for offset in range(0, len(self.pcm), frame_bytes):
+            chunk = self.pcm[offset:offset + frame_bytes]
+            if len(chunk) < frame_bytes:
+                chunk = chunk + b"\x00" * (frame_bytes - len(chunk))
+            frames.append(rtc.AudioFrame(
+                data=chunk,
+                sample_rate=self.sample_rate,
+                num_channels=self.num_channels,
+                samples_per_channel=samples_per_frame
+            ))
+        return frames
+
+class TTSCache:
+    """
+    Cache mémoire + disque de l'audio synthétisé, indexé par (texte, voix, modèle).
+    Les phrases pré-rendues sont sur disque; les réponses enregistrées pendant les
+    appels sont gardées en mémoire seulement (max_recorded phrases au plus).
+    """
+
+    def __init__(self, cache_dir: str, voice: str, model: str, max_entries: int = 256, max_recorded: int = 256):
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.model = model
+        self.max_entries = max_entries
+        self.max_recorded = max_recorded
+        self._entries = OrderedDict()
+        self._recorded = OrderedDict()
+        # Phrases pré-rendues présentes sur disque: les seules relues hors de la mémoire
+        self._disk_keys: Set[str] = set()
+        self.stats = {"hits": 0, "misses": 0, "rendered": 0}
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}|{self.voice}|{text.strip()}".encode("utf-8")).hexdigest()
+
+    def load(self) -> int:
+        """
+        Charge en mémoire l'audio déjà rendu sur disque pour cette voix et ce modèle
+        """
+        start_time = time.time()
+        if not os.path.isdir(self.cache_dir):
+            logger.info(f"Cache TTS vide (répertoire absent: {self.cache_dir})")
+            return 0
+
+        loaded = 0
+        for filename in sorted(os.listdir(self.cache_dir)):
+            if not filename.endswith(".json"):
+                continue
+            key = filename[:-len(".json")]
+            self._disk_keys.add(key)
+            if loaded >= self.max_entries:
+                continue
+            audio = self._read_entry(key)
+            if audio and self.key(audio.text) == key:
+                self._entries[key] = audio
+                loaded += 1
+
+        logger.info(
+            f"Cache TTS chargé: {loaded} phrase(s) pour voix={self.voice}, modèle={self.model} "
+            f"en {int((time.time() - start_time) * 1000)}ms"
+        )
+        return loaded
+
+    def get(self, text: str, log: bool = True) -> Optional[CachedAudio]:
+        audio = self._lookup(self.key(text))
+        if audio is None:
+            self.stats["misses"] += 1
+            if log:
+                logger.info(f"Cache TTS manqué ({self._summary()}): {text[:60]!r}")
+            return None
+
+        self.stats["hits"] += 1
+        if log:
+            logger.info(f"Cache TTS utilisé ({self._summary()}): {audio.duration:.1f}s d'audio")
+        return audio
+
+    async def render(self, tts, text: str) -> CachedAudio:
+        """
+        Synthétise une phrase avec le plugin TTS et l'enregistre dans le cache
+        """
+        pcm = bytearray()
+        sample_rate, num_channels = tts.sample_rate, tts.num_channels
+
+        stream = tts.synthesize(text)
+        try:
+            async for audio in stream:
+                pcm.extend(audio.frame.data.tobytes())
+                sample_rate, num_channels = audio.frame.sample_rate, audio.frame.num_channels
+        finally:
+            await stream.aclose()
+
+        cached = CachedAudio(text.strip(), bytes(pcm), sample_rate, num_channels)
+        await self.save(cached)
+        self.stats["rendered"] += 1
+        return cached
+
+    async def save(self, audio: CachedAudio) -> None:
+        """
+        Écrit l'audio sur disque hors de la boucle d'événements, puis le garde en mémoire
+        """
+        key = self.key(audio.text)
+        await asyncio.get_running_loop().run_in_executor(None, self._write_entry, key, audio)
+        self._disk_keys.add(key)
+        self._remember(key, audio)
+
+    def record(self, audio: CachedAudio) -> None:
+        """
+        Garde en mémoire seulement l'audio d'une réponse (les plus anciennes sont oubliées)
+        """
+        key = self.key(audio.text)
+        self._recorded[key] = audio
+        self._recorded.move_to_end(key)
+        while len(self._recorded) > self.max_recorded:
+            self._recorded.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[CachedAudio]:
+        for entries in (self._entries, self._recorded):
+            audio = entries.get(key)
+            if audio is not None:
+                entries.move_to_end(key)
+                return audio
+        # Lecture disque (sur la boucle) réservée aux phrases pré-rendues non chargées en mémoire
+        if key in self._disk_keys:
+            audio = self._read_entry(key)
+            if audio is not None:
+                self._remember(key, audio)
+            return audio
+        return None
+
+    def _write_entry(self, key: str, audio: CachedAudio) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        base_path = os.path.join(self.cache_dir, key)
+        # Fichiers temporaires propres à chaque écriture: deux sessions peuvent enregistrer la même phrase
+        suffix = uuid.uuid4().hex
+
+        # Écrire l'audio avant les métadonnées: un .json présent implique un .pcm complet
+        with open(f"{base_path}.pcm.{suffix}.tmp", "wb") as f:
+            f.write(audio.pcm)
+        os.replace(f"{base_path}.pcm.{suffix}.tmp", f"{base_path}.pcm")
+        with open(f"{base_path}.json.{suffix}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "text": audio.text,
+                "voice": self.voice,
+                "model": self.model,
+                "sample_rate": audio.sample_rate,
+                "num_channels": audio.num_channels,
+            }, f, ensure_ascii=False)
+        os.replace(f"{base_path}.json.{suffix}.tmp", f"{base_path}.json")
+
+    def _remember(self, key: str, audio: CachedAudio) -> None:
+        self._entries[key] = audio
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_entry(self, key: str) -> Optional[CachedAudio]:
+        base_path = os.path.join(self.cache_dir, key)
+        try:
+            with open(f"{base_path}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(f"{base_path}.pcm", "rb") as f:
+                pcm = f.read()
+        except (OSError, json.JSONDecodeError):
+            return None
+        return CachedAudio(meta["text"], pcm, meta["sample_rate"], meta["num_channels"])
+
+    def _summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return f"{len(self._entries)} phrase(s) pré-rendue(s) et {len(self._recorded)} réponse(s) en mémoire, taux de succès {hit_rate:.0%}"
+
+class CachedChunkedStream(tts.ChunkedStream):
+    """
+    Restitue l'audio en cache d'une phrase, sans appel au TTS
+    """
+
+    def __init__(self, tts_plugin: "CachingTTS", text: str, audio: CachedAudio):
+        super().__init__(tts=tts_plugin, input_text=text)
+        self._audio = audio
+
+    async def _main_task(self) -> None:
+        request_id = uuid.uuid4().hex
+        for frame in self._audio.frames():
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+
+class RecordingChunkedStream(tts.ChunkedStream):
+    """
+    Synthétise une phrase avec le TTS et enregistre l'audio produit dans le cache,
+    sur disque si persist est demandé, sinon en mémoire seulement
+    """
+
+    def __init__(self, tts_plugin: "CachingTTS", text: str, persist: bool):
+        super().__init__(tts=tts_plugin, input_text=text)
+        self._caching = tts_plugin
+        self._persist = persist
+
+    async def _main_task(self) -> None:
+        pcm = bytearray()
+        sample_rate, num_channels = self._caching.sample_rate, self._caching.num_channels
+        stream = self._caching.inner.synthesize(self._input_text)
+        try:
+            async for audio in stream:
+                pcm.extend(audio.frame.data.tobytes())
+                sample_rate, num_channels = audio.frame.sample_rate, audio.frame.num_channels
+                self._event_ch.send_nowait(audio)
+        finally:
+            await stream.aclose()
+        if not pcm:
+            return
+        audio = CachedAudio(self._input_text.strip(), bytes(pcm), sample_rate, num_channels)
+        if not self._persist:
+            self._caching.cache.record(audio)
+            return
+        try:
+            await self._caching.cache.save(audio)
+        except OSError as e:
+            # L'audio a déjà été restitué: seul l'enregistrement dans le cache est perdu
+            logger.error(f"Impossible d'enregistrer l'audio dans le cache TTS: {e}")
+
+class CachingTTS(tts.TTS):
+    """
+    Enveloppe un plugin TTS non streaming: une phrase déjà présente dans le cache est
+    restituée telle quelle. Les phrases ne sont enregistrées que si should_persist(texte)
+    (phrases fixes, sur disque) ou should_record(texte) (réponses mises en cache, en
+    mémoire) l'autorise, pour ne pas remplir le cache de phrases uniques.
+    """
+
+    def __init__(self, inner: tts.TTS, cache: TTSCache, should_record: Callable[[str], bool],
+                 should_persist: Optional[Callable[[str], bool]] = None):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False),
+                         sample_rate=inner.sample_rate, num_channels=inner.num_channels)
+        self.inner = inner
+        self.cache = cache
+        self.should_record = should_record
+        self.should_persist = should_persist
+
+    def synthesize(self, text: str) -> tts.ChunkedStream:
+        audio = self.cache.get(text, log=False)
+        if audio is not None:
+            return CachedChunkedStream(self, text, audio)
+        if self.should_persist and self.should_persist(text):
+            return RecordingChunkedStream(self, text, persist=True)
+        if self.should_record(text):
+            return RecordingChunkedStream(self, text, persist=False)
+        return self.inner.synthesize(text)
+
+async def render_phrases(phrases: List[str], cache: TTSCache) -> None:
+    from livekit.plugins import openai
+
+    tts = openai.TTS(model=cache.model, voice=cache.voice)
+    for phrase in phrases:
+        if cache.get(phrase):
+            continue
+        start_time = time.time()
+        audio = await cache.render(tts, phrase)
+        logger.info(f"Phrase rendue en {int((time.time() - start_time) * 1000)}ms ({audio.duration:.1f}s): {phrase[:60]!r}")
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Pré-rendre des phrases dans le cache TTS")
+    parser.add_argument("--phrases", type=str, required=True, help="Fichier texte, une phrase par ligne")
+    parser.add_argument("--voice", type=str, default=os.getenv("AGENT_TTS_VOICE", "alloy"), help="Voix TTS")
+    parser.add_argument("--model", type=str, default=os.getenv("AGENT_TTS_MODEL", "tts-1"), help="Modèle TTS")
+    parser.add_argument("--cache-dir", type=str, default=os.getenv("AGENT_TTS_CACHE_DIR", DEFAULT_CACHE_DIR), help="Répertoire du cache")
+
+    args = parser.parse_args()
+
+    with open(args.phrases, "r", encoding="utf-8") as f:
+        phrases = [line.strip() for line in f if line.strip()]
+
+    cache = TTSCache(args.cache_dir, voice=args.voice, model=args.model, max_entries=max(len(phrases), 1))
+    asyncio.run(render_phrases(phrases, cache))
+
+if __name__ == "__main__":
+    main()
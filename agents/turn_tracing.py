@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Mesure de la latence de chaque tour de conversation dans le pipeline vocal.
+Pour chaque tour on enregistre, à partir de la fin de parole de l'utilisateur (VAD):
+la transcription finale (stt_final_ms) et le début de la lecture (playout_start_ms).
+Le premier token LLM (llm_request_ttft_ms) et le premier octet TTS (tts_request_ttfb_ms)
+sont ceux rapportés par les plugins: ils sont mesurés depuis l'envoi de leur requête,
+pas depuis la fin de parole. Les enregistrements sont écrits par lots dans un fichier JSONL.
+
+Résumé des percentiles par agent à partir des fichiers:
+    python agents/turn_tracing.py traces/*.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger("voice_agent.turn_tracing")
+
+# Durées suivies pour chaque tour (en millisecondes)
+TURN_METRICS = ["stt_final_ms", "llm_request_ttft_ms", "tts_request_ttfb_ms", "playout_start_ms"]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+class JsonlTraceSink:
+    """
+    Écrit les enregistrements par lots dans un fichier JSONL, hors de la boucle d'événements
+    """
+
+    def __init__(self, path: str, batch_size: int = 50, flush_interval: float = 5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+    def start(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._closing = False
+            self._flush_task = asyncio.create_task(self._run())
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._buffer.append(record)
+        # Un lot complet réveille la tâche d'écriture: une seule écriture à la fois
+        if len(self._buffer) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+        except OSError as e:
+            logger.error(f"Impossible d'écrire les traces de tours: {e}")
+
+    async def close(self) -> None:
+        if self._flush_task:
+            # La tâche d'écriture termine son écriture en cours puis vide le buffer
+            self._closing = True
+            self._wakeup.set()
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def _append(self, lines: str) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+class TurnStatsAggregator:
+    """
+    Conserve les dernières mesures par agent et calcule les percentiles
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._values = defaultdict(lambda: defaultdict(lambda: deque(maxlen=self.window)))
+
+    def add(self, record: Dict[str, Any]) -> None:
+        if record.get("type", "turn") != "turn":
+            return
+        agent_values = self._values[record.get("agent_id") or "unknown"]
+        for metric in TURN_METRICS:
+            if record.get(metric) is not None:
+                agent_values[metric].append(record[metric])
+
+    def summary(self, agent_id: Optional[str] = None) -> Dict[str, Any]:
+        agent_ids = [agent_id] if agent_id is not None else list(self._values)
+        result = {}
+        for current_id in agent_ids:
+            metrics = {}
+            for metric, values in self._values.get(current_id, {}).items():
+                sorted_values = sorted(values)
+                metrics[metric] = {
+                    "count": len(sorted_values),
+                    "p50": round(percentile(sorted_values, 0.50), 1),
+                    "p90": round(percentile(sorted_values, 0.90), 1),
+                    "p99": round(percentile(sorted_values, 0.99), 1),
+                }
+            result[current_id] = metrics
+        return result
+
+class TurnTracer:
+    """
+    S'abonne aux événements du VoicePipelineAgent et produit un enregistrement par tour
+    """
+
+    def __init__(self, agent, agent_id: Optional[str], call_id: Optional[str],
+                 sink: Optional[JsonlTraceSink], stats: Optional[TurnStatsAggregator]):
+        self.agent = agent
+        self.agent_id = agent_id
+        self.call_id = call_id
+        self.sink = sink
+        self.stats = stats
+        self.turn_index = 0
+        self._turn: Optional[Dict[str, Any]] = None
+        self._handlers = {
+            "user_stopped_speaking": self._on_user_stopped_speaking,
+            "user_speech_committed": self._on_user_speech_committed,
+            "agent_started_speaking": self._on_agent_started_speaking,
+            "agent_stopped_speaking": self._on_agent_stopped_speaking,
+            "metrics_collected": self._on_metrics_collected,
+        }
+
+    def attach(self) -> None:
+        for event, handler in self._handlers.items():
+            self.agent.on(event, handler)
+
+    def close(self) -> None:
+        self._finish_turn()
+        for event, handler in self._handlers.items():
+            self.agent.off(event, handler)
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._turn["start"]) * 1000, 1)
+
+    def _on_user_stopped_speaking(self, *_):
+        # Un nouveau tour commence: clore le précédent s'il est resté ouvert
+        self._finish_turn()
+        self.turn_index += 1
+        self._turn = {"start": time.perf_counter(), "timestamp": time.time()}
+
+    def _on_user_speech_committed(self, *_):
+        if self._turn is not None and "stt_final_ms" not in self._turn:
+            self._turn["stt_final_ms"] = self._elapsed_ms()
+
+    def _on_agent_started_speaking(self, *_):
+        if self._turn is not None and "playout_start_ms" not in self._turn:
+            self._turn["playout_start_ms"] = self._elapsed_ms()
+
+    def _on_agent_stopped_speaking(self, *_):
+        # Les métriques LLM/TTS arrivent au plus tard à la fin de la réponse
+        if self._turn is not None and "playout_start_ms" in self._turn:
+            self._finish_turn()
+
+    def _on_metrics_collected(self, metrics):
+        # Durées relatives au début de la requête du plugin (et non à la fin de parole)
+        if self._turn is None:
+            return
+        if hasattr(metrics, "ttft") and "llm_request_ttft_ms" not in self._turn:
+            self._turn["llm_request_ttft_ms"] = round(metrics.ttft * 1000, 1)
+        elif hasattr(metrics, "ttfb") and "tts_request_ttfb_ms" not in self._turn:
+            self._turn["tts_request_ttfb_ms"] = round(metrics.ttfb * 1000, 1)
+
+    def _finish_turn(self) -> None:
+        if self._turn is None:
+            return
+        turn, self._turn = self._turn, None
+
+        record = {
+            "type": "turn",
+            "timestamp": turn["timestamp"],
+            "agent_id": self.agent_id,
+            "call_id": self.call_id,
+            "turn": self.turn_index,
+        }
+        for metric in TURN_METRICS:
+            record[metric] = turn.get(metric)
+
+        if self.sink:
+            self.sink.write(record)
+        if self.stats:
+            self.stats.add(record)
+        logger.debug(f"Tour {self.turn_index}: {record}")
+
+class LoopLagMonitor:
+    """
+    Mesure le retard de la boucle d'événements du processus: un timer est armé à
+    intervalle régulier et on enregistre l'écart entre le réveil prévu et le réveil réel.
+    Un enregistrement "loop_lag" est écrit par fenêtre de report_interval secondes.
+    """
+
+    def __init__(self, sink: Optional[JsonlTraceSink], interval: float = 0.1, report_interval: float = 5.0):
+        self.sink = sink
+        self.interval = interval
+        self.report_interval = report_interval
+        self._samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._report()
+
+    async def _run(self) -> None:
+        window_start = time.perf_counter()
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(0.0, (time.perf_counter() - expected) * 1000))
+            if time.perf_counter() - window_start >= self.report_interval:
+                self._report()
+                window_start = time.perf_counter()
+
+    def _report(self) -> None:
+        if not self._samples:
+            return
+        samples, self._samples = sorted(self._samples), []
+        record = {
+            "type": "loop_lag",
+            "timestamp": time.time(),
+            "pid": os.getpid(),
+            "samples": len(samples),
+            "mean_ms": round(sum(samples) / len(samples), 2),
+            "p99_ms": round(percentile(samples, 0.99), 2),
+            "max_ms": round(samples[-1], 2),
+        }
+        if self.sink:
+            self.sink.write(record)
+        if record["max_ms"] > 100:
+            logger.warning(f"Boucle d'événements bloquée jusqu'à {record['max_ms']}ms")
+
+def summarize_files(paths: List[str]) -> Dict[str, Any]:
+    stats = TurnStatsAggregator(window=sys.maxsize)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    stats.add(json.loads(line))
+    return stats.summary()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python agents/turn_tracing.py FICHIER.jsonl [...]")
+        sys.exit(1)
+    print(json.dumps(summarize_files(sys.argv[1:]), indent=2))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Pré-filtre d'énergie devant le VAD de Silero. Sur un appel téléphonique, la plupart
+des trames reçues sont du silence ou du bruit de ligne: seules les régions candidates
+(énergie au-dessus du bruit de fond, taux de passages par zéro compatible avec la voix)
+sont transmises à Silero. Un pré-roll évite de couper l'attaque de la parole, et une
+prolongation (hangover) laisse Silero observer le silence qui termine un tour: la
+détection de fin de parole n'est donc pas retardée.
+
+Les trames sont analysées par fenêtres de 10ms, en un seul calcul NumPy par bloc de
+trames tant que la porte est fermée, puis trame par trame quand elle est ouverte.
+
+Activé par AGENT_VAD_GATE=1. Paramètres: AGENT_VAD_GATE_THRESHOLD_DB,
+AGENT_VAD_GATE_HANGOVER_MS (à garder au-dessus du silence minimal de fin de parole
+de Silero), AGENT_VAD_GATE_PREROLL_MS, AGENT_VAD_GATE_BLOCK_MS.
+"""
+
+import os
+import math
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import numpy as np
+from livekit import rtc
+from livekit.agents import vad
+
+WINDOW_MS = 10
+# Niveau minimal d'une région candidate (-60 dBFS), quel que soit le bruit de fond
+MIN_RMS = 32768 * 10 ** (-60 / 20)
+# Passages par zéro par seconde au-delà desquels le souffle l'emporte sur la voix voisée
+ZCR_MAX_PER_SECOND = 3500
+# Une fenêtre plus forte que ce multiple du seuil est candidate même bruitée (fricatives)
+LOUD_RATIO = 4.0
+# Fenêtres candidates nécessaires pour ouvrir la porte (un clic isolé ne suffit pas)
+MIN_OPEN_WINDOWS = 2
+# Constantes de temps du bruit de fond: baisse rapide, hausse lente pendant la parole
+FLOOR_FALL_SECONDS = 0.1
+FLOOR_RISE_SECONDS = 3.0
+
+def frame_samples(frame: rtc.AudioFrame) -> np.ndarray:
+    samples = np.frombuffer(frame.data, dtype=np.int16)
+    if frame.num_channels > 1:
+        samples = samples.reshape(-1, frame.num_channels).mean(axis=1)
+    return samples
+
+def window_features(samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    RMS et passages par zéro par seconde de chaque fenêtre de 10ms
+    """
+    window = min(max(1, sample_rate * WINDOW_MS // 1000), len(samples))
+    if window == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    count = len(samples) // window
+    windows = samples[:count * window].reshape(count, window).astype(np.float32)
+    rms = np.sqrt(np.mean(windows * windows, axis=1))
+    crossings = np.count_nonzero(np.diff(np.signbit(windows), axis=1), axis=1)
+    return rms, crossings * (sample_rate / window)
+
+class EnergyGate:
+    """
+    Décide, trame par trame, lesquelles transmettre au VAD. process() retourne les
+    trames à transmettre (éventuellement précédées du pré-roll à l'ouverture).
+    """
+
+    def __init__(self, threshold_db: Optional[float] = None, hangover_ms: Optional[float] = None,
+                 preroll_ms: Optional[float] = None, block_ms: Optional[float] = None,
+                 stats: Optional[Dict[str, int]] = None):
+        if threshold_db is None:
+            threshold_db = float(os.getenv("AGENT_VAD_GATE_THRESHOLD_DB", "9"))
+        if hangover_ms is None:
+            hangover_ms = float(os.getenv("AGENT_VAD_GATE_HANGOVER_MS", "800"))
+        if preroll_ms is None:
+            preroll_ms = float(os.getenv("AGENT_VAD_GATE_PREROLL_MS", "200"))
+        if block_ms is None:
+            block_ms = float(os.getenv("AGENT_VAD_GATE_BLOCK_MS", "40"))
+        self.threshold_ratio = 10 ** (threshold_db / 20)
+        self.hangover = hangover_ms / 1000
+        self.preroll = preroll_ms / 1000
+        self.block = block_ms / 1000
+        self.noise_floor = MIN_RMS
+        self.open = False
+        self._hangover_left = 0.0
+        # Trames du bloc en cours d'accumulation (porte fermée)
+        self._pending: List[rtc.AudioFrame] = []
+        self._pending_duration = 0.0
+        self._preroll: Deque[Tuple[rtc.AudioFrame, float]] = deque()
+        self._preroll_duration = 0.0
+        self.stats = stats if stats is not None else {"frames": 0, "forwarded": 0, "openings": 0}
+
+    def process(self, frame: rtc.AudioFrame) -> List[rtc.AudioFrame]:
+        self.stats["frames"] += 1
+        duration = frame.samples_per_channel / frame.sample_rate
+
+        if self.open:
+            if self._analyze([frame], frame.sample_rate, min_windows=1):
+                self._hangover_left = self.hangover
+            else:
+                self._hangover_left -= duration
+                self.open = self._hangover_left > 0
+            self.stats["forwarded"] += 1
+            return [frame]
+
+        self._pending.append(frame)
+        self._pending_duration += duration
+        if self._pending_duration < self.block:
+            return []
+
+        block, self._pending, self._pending_duration = self._pending, [], 0.0
+        if self._analyze(block, frame.sample_rate, min_windows=MIN_OPEN_WINDOWS):
+            self.open = True
+            self._hangover_left = self.hangover
+            self.stats["openings"] += 1
+            forwarded = [preroll_frame for preroll_frame, _ in self._preroll] + block
+            self._preroll.clear()
+            self._preroll_duration = 0.0
+            self.stats["forwarded"] += len(forwarded)
+            return forwarded
+
+        for block_frame in block:
+            block_duration = block_frame.samples_per_channel / block_frame.sample_rate
+            self._preroll.append((block_frame, block_duration))
+            self._preroll_duration += block_duration
+        while self._preroll and self._preroll_duration - self._preroll[0][1] >= self.preroll:
+            self._preroll_duration -= self._preroll.popleft()[1]
+        return []
+
+    def _analyze(self, frames: List[rtc.AudioFrame], sample_rate: int, min_windows: int) -> bool:
+        samples = frame_samples(frames[0]) if len(frames) == 1 else np.concatenate([frame_samples(f) for f in frames])
+        rms, zcr = window_features(samples, sample_rate)
+        if not len(rms):
+            return False
+
+        threshold = max(self.noise_floor * self.threshold_ratio, MIN_RMS)
+        candidates = (rms > threshold) & ((zcr < ZCR_MAX_PER_SECOND) | (rms > threshold * LOUD_RATIO))
+        self._update_floor(float(rms.min()), len(samples) / sample_rate)
+        return int(np.count_nonzero(candidates)) >= min(min_windows, len(rms))
+
+    def _update_floor(self, level: float, duration: float) -> None:
+        # Minimum du bloc: pendant la parole, les pauses entre syllabes tirent le bruit de fond vers le bas
+        time_constant = FLOOR_FALL_SECONDS if level < self.noise_floor else FLOOR_RISE_SECONDS
+        self.noise_floor += (1 - math.exp(-duration / time_constant)) * (level - self.noise_floor)
+
+def gate_summary(stats: Dict[str, int]) -> str:
+    skipped = stats["frames"] - stats["forwarded"]
+    ratio = skipped / stats["frames"] if stats["frames"] else 0.0
+    return f"{skipped}/{stats['frames']} trames non transmises au VAD ({ratio:.0%}), {stats['openings']} ouvertures"
+
+class GatedVADStream(vad.VADStream):
+    """
+    Flux VAD qui ne transmet au flux Silero que les trames retenues par le pré-filtre.
+    Les positions d'échantillons des événements de Silero ne comptent que l'audio
+    transmis; les durées de parole et de silence restent exactes.
+    """
+
+    def __init__(self, gated_vad: "GatedVAD", inner: vad.VADStream, gate: EnergyGate):
+        super().__init__(gated_vad)
+        self._inner = inner
+        self._gate = gate
+
+    async def _main_task(self) -> None:
+        forward_task = asyncio.create_task(self._forward_events())
+        try:
+            async for item in self._input_ch:
+                if isinstance(item, self._FlushSentinel):
+                    self._inner.flush()
+                    continue
+                for frame in self._gate.process(item):
+                    self._inner.push_frame(frame)
+            self._inner.end_input()
+            await forward_task
+        finally:
+            forward_task.cancel()
+            await asyncio.gather(forward_task, return_exceptions=True)
+            await self._inner.aclose()
+
+    async def _forward_events(self) -> None:
+        async for event in self._inner:
+            self._event_ch.send_nowait(event)
+
+class GatedVAD(vad.VAD):
+    """
+    Enveloppe le VAD préchargé pour un appel; les statistiques couvrent tous les flux
+    de l'appel
+    """
+
+    def __init__(self, inner: vad.VAD):
+        super().__init__(capabilities=inner.capabilities)
+        self._inner = inner
+        self.stats: Dict[str, int] = {"frames": 0, "forwarded": 0, "openings": 0}
+
+    def stream(self) -> GatedVADStream:
+        return GatedVADStream(self, self._inner.stream(), EnergyGate(stats=self.stats))
+
+    def summary(self) -> str:
+        return gate_summary(self.stats)
@@ -15,6 +15,15 @@ from livekit.agents import cli, WorkerDefinition, AutoSubscribe
 from livekit.agents.pipeline import VoicePipelineAgent
 from livekit.plugins import openai, deepgram, silero
 from livekit.agents import lbm
+from agent_config import AgentConfigCache
+import readiness
+import preloaded
+from tts_cache import TTSCache, CachingTTS, DEFAULT_CACHE_DIR
+from turn_tracing import JsonlTraceSink, LoopLagMonitor, TurnStatsAggregator, TurnTracer
+from call_events import CallEventReporter, watch_answered
+from chat_context import BoundedChatContext
+from response_cache import ResponseCache, ResponseCacheSession, response_cache_similarity
+from vad_gate import GatedVAD
 
 # Configuration du logging
 logging.basicConfig(
@@ -54,11 +63,15 @@ async def entrypoint(ctx: lbm.JobContext):
     # Contexte initial pour l'LLM
     initial_ctx = lbm.ChatContext().append(
         role="system",
-        content=ctx.proc.userdata.get("prompt_template") or DEFAULT_PROMPT
+        content=resolve_prompt(ctx.proc, metadata_dict)
     )
     
     # Se connecter à la salle
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+    
+    # Événements de l'appel signalés à l'API (flux SSE / WebSocket, Xano)
+    call_events = CallEventReporter(call_id)
+    ctx.add_shutdown_callback(call_events.aclose)
 # Attendre le premier participant à rejoindre
     try:
         participant = await ctx.wait_for_participant(timeout=60)
@@ -106,26 +119,97 @@ async def entrypoint(ctx: lbm.JobContext):
             logger.info(f"Participant connecté: {participant.identity}")
         except asyncio.TimeoutError:
             logger.error("Aucun participant n'a rejoint après 2 minutes, arrêt de l'agent")
+            call_events.report("failed", reason="no_participant")
+            await call_events.aclose()
             return
     
+    watch_answered(ctx.room, participant, call_events)
+    
     # Initialiser l'agent vocal
+    stt_plugin, llm_plugin, tts_plugin = create_pipeline_plugins()
+    # Contexte envoyé au LLM borné en tokens (résumé glissant des anciens tours)
+    bounded_ctx = BoundedChatContext(llm_plugin)
+    ctx.add_shutdown_callback(bounded_ctx.aclose)
+    
+    # Message de bienvenue
+    welcome_message = "Bonjour, comment puis-je vous aider aujourd'hui?"
+    if phone_number:
+        welcome_message = "Bonjour, je suis votre assistant IA. Comment puis-je vous aider aujourd'hui?"
+    
+    # Réponses en cache pour les questions récurrentes
+    response_cache = ctx.proc.userdata.get("response_cache")
+    cache_session = None
+    if response_cache:
+        similarity = response_cache_similarity(resolve_agent_config(ctx.proc, metadata_dict))
+        cache_session = ResponseCacheSession(response_cache, llm_plugin, similarity)
+    
+    # Audio TTS en cache (bienvenue, réponses en cache), restitué par le pipeline de l'agent:
+    # il reste interruptible comme une phrase synthétisée
+    tts_cache = ctx.proc.userdata.get("tts_cache")
+    if tts_cache:
+        def should_persist(text: str) -> bool:
+            # Phrase fixe: gardée sur disque pour les appels suivants
+            return bool(text.strip()) and text.strip() in welcome_message
+        
+        def should_record(text: str) -> bool:
+            # Réponse en cache: gardée en mémoire tant qu'elle est servie
+            return bool(response_cache and response_cache.is_cached_reply_text(text))
+        
+        tts_plugin = CachingTTS(tts_plugin, tts_cache, should_record, should_persist)
+    
+    # Pré-filtre d'énergie: le silence et le bruit de ligne ne passent pas par Silero
+    vad_plugin = ctx.proc.userdata.get("vad")
+    if os.getenv("AGENT_VAD_GATE", "").lower() in ("true", "1", "t") and vad_plugin is not None:
+        vad_plugin = GatedVAD(vad_plugin)
+        
+        async def log_vad_gate():
+            logger.info(f"Pré-filtre VAD: {vad_plugin.summary()}")
+        
+        ctx.add_shutdown_callback(log_vad_gate)
+    
+    def before_llm(agent, chat_ctx):
+        if cache_session:
+            stream = cache_session.before_llm(agent, chat_ctx)
+            if stream is not None:
+                return stream
+        return bounded_ctx.before_llm(agent, chat_ctx)
+    
     agent = VoicePipelineAgent(
-        vad=ctx.proc.userdata.get("vad"),
-        stt=deepgram.STT(),
-        llm=openai.LLM(model="gpt-4o-mini"),
-        tts=openai.TTS(),
+        vad=vad_plugin,
+        stt=stt_plugin,
+        llm=llm_plugin,
+        tts=tts_plugin,
         chat_ctx=initial_ctx,
         allow_interruptions=True,
+        before_llm_cb=before_llm,
     )
     
+    # Mesurer la latence de chaque tour de conversation
+    trace_sink = ctx.proc.userdata.get("turn_trace_sink")
+    turn_stats = ctx.proc.userdata.get("turn_stats")
+    if trace_sink:
+        trace_sink.start()
+    loop_lag = ctx.proc.userdata.get("loop_lag")
+    if loop_lag:
+        loop_lag.start()
+    agent_id = metadata_dict.get("agent_id") or os.getenv("AGENT_NAME")
+    turn_tracer = TurnTracer(agent, agent_id, call_id, trace_sink, turn_stats)
+    turn_tracer.attach()
+    agent.on("agent_started_speaking", lambda *_: call_events.report("agent_speaking"))
+    
+    async def close_turn_tracing():
+        turn_tracer.close()
+        if trace_sink:
+            await trace_sink.flush()
+        if turn_stats:
+            logger.info(f"Latence des tours pour l'agent {agent_id}: {turn_stats.summary(agent_id)}")
+    
+    ctx.add_shutdown_callback(close_turn_tracing)
+    
     # Démarrer l'agent pour le participant spécifique
     agent.start(ctx.room, participant)
     
-    # Message de bienvenue
-    welcome_message = "Bonjour, comment puis-je vous aider aujourd'hui?"
-    if phone_number:
-        welcome_message = "Bonjour, je suis votre assistant IA. Comment puis-je vous aider aujourd'hui?"
-    
+    # Audio pré-synthétisé s'il est en cache; sinon synthétisé et enregistré pour les appels suivants
     await agent.say(welcome_message, allow_interruptions=True)
     
     # L'agent continuera à fonctionner automatiquement et traitera
@@ -134,41 +218,132 @@ async def entrypoint(ctx: lbm.JobContext):
     
     # Surveiller l'état de l'appel téléphonique
     if phone_number:
-        # Boucle de surveillance de l'état de l'appel
-        start_time = asyncio.get_event_loop().time()
-        while True:
-            # Vérifier si le participant est toujours connecté
-            if not participant.is_connected:
-                logger.info("Le participant a raccroché, fin de l'appel")
-                break
-                
-            # Vérifier l'état de l'appel via les attributs du participant
-            call_status = participant.attributes.get("sip.callStatus")
-            if call_status == "hangup":
-                logger.info("L'appel a été terminé")
-                break
-                
-            # Timeout de sécurité (30 minutes maximum)
-            if asyncio.get_event_loop().time() - start_time > 1800:  # 30 minutes
-                logger.warning("Timeout de l'appel après 30 minutes")
-                break
-                
-            await asyncio.sleep(5)  # Vérifier toutes les 5 secondes
+        end_reason = await wait_for_call_end(ctx, participant, MAX_CALL_DURATION)
+        logger.info(f"Fin de l'appel: {end_reason}")
+        call_events.report("hangup", reason=end_reason)
+        # Libérer le job immédiatement (STT, contexte LLM, emplacement du worker)
+        ctx.shutdown(reason=end_reason)
     
     logger.info("Session agent terminée")
 
+async def wait_for_call_end(ctx: lbm.JobContext, participant, max_duration: float) -> str:
+    """
+    Attend la fin de l'appel à partir des événements de la salle et du participant,
+    avec un seul timer pour la durée maximale.
+    """
+    call_ended = asyncio.Event()
+    end_reason = {"reason": "timeout"}
+    
+    def end_call(reason: str):
+        if not call_ended.is_set():
+            end_reason["reason"] = reason
+            call_ended.set()
+    
+    def on_participant_disconnected(remote_participant):
+        if remote_participant.identity == participant.identity:
+            logger.info("Le participant a raccroché, fin de l'appel")
+            end_call("participant_disconnected")
+    
+    def on_attributes_changed(changed_attributes, remote_participant):
+        if remote_participant.identity == participant.identity and changed_attributes.get("sip.callStatus") == "hangup":
+            logger.info("L'appel a été terminé")
+            end_call("hangup")
+    
+    def on_room_disconnected(*_):
+        end_call("room_disconnected")
+    
+    ctx.room.on("participant_disconnected", on_participant_disconnected)
+    ctx.room.on("participant_attributes_changed", on_attributes_changed)
+    ctx.room.on("disconnected", on_room_disconnected)
+    
+    try:
+        # L'appel a pu se terminer avant l'enregistrement des gestionnaires
+        if not participant.is_connected:
+            end_call("participant_disconnected")
+        elif participant.attributes.get("sip.callStatus") == "hangup":
+            end_call("hangup")
+        
+        try:
+            await asyncio.wait_for(call_ended.wait(), timeout=max_duration)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout de l'appel après {int(max_duration)} secondes")
+    finally:
+        ctx.room.off("participant_disconnected", on_participant_disconnected)
+        ctx.room.off("participant_attributes_changed", on_attributes_changed)
+        ctx.room.off("disconnected", on_room_disconnected)
+    
+    return end_reason["reason"]
+
+def create_pipeline_plugins():
+    """
+    Crée les plugins STT, LLM et TTS du pipeline (simulés pour les tests de charge)
+    """
+    if os.getenv("AGENT_MOCK_PLUGINS"):
+        from mock_plugins import create_mock_plugins
+        return create_mock_plugins()
+    return deepgram.STT(), openai.LLM(model="gpt-4o-mini"), openai.TTS(model=TTS_MODEL, voice=TTS_VOICE)
+
+def resolve_prompt(proc: lbm.JobProcess, metadata_dict: dict) -> str:
+    """
+    Détermine le prompt de l'agent pour ce job.
+    En mode multi-tenant, la configuration est retrouvée à partir de l'agent_id du dispatch.
+    """
+    if metadata_dict.get("prompt_template"):
+        return metadata_dict["prompt_template"]
+    
+    config = resolve_agent_config(proc, metadata_dict)
+    if config and config.get("prompt_template"):
+        return config["prompt_template"]
+    if proc.userdata.get("agent_configs") and metadata_dict.get("agent_id"):
+        logger.warning(f"Aucun prompt configuré pour l'agent {metadata_dict['agent_id']}, utilisation du prompt par défaut")
+    
+    return proc.userdata.get("prompt_template") or DEFAULT_PROMPT
+
+def resolve_agent_config(proc: lbm.JobProcess, metadata_dict: dict):
+    """
+    Configuration de l'agent du job en mode multi-tenant (None pour un agent dédié)
+    """
+    agent_configs = proc.userdata.get("agent_configs")
+    agent_id = metadata_dict.get("agent_id")
+    if agent_configs and agent_id:
+        return agent_configs.get(str(agent_id))
+    return None
+
 def prewarm_func(proc: lbm.JobProcess):
     """
     Fonction de préchauffage pour charger les modèles nécessaires.
     """
     logger.info("Préchauffage de l'agent vocal...")
-    # Charger le modèle VAD de Silero
-    proc.userdata["vad"] = silero.VAD.vad()
+    # Charger le modèle VAD de Silero (déjà chargé si l'agent est issu du lanceur)
+    proc.userdata["vad"] = preloaded.get_vad() or silero.VAD.vad()
     # Stocker le template de prompt s'il est fourni
     prompt_template = os.getenv("AGENT_PROMPT_TEMPLATE")
     if prompt_template:
         proc.userdata["prompt_template"] = prompt_template
+    # En mode multi-tenant, les configurations des agents sont lues à la demande
+    if os.getenv("AGENT_MULTI_TENANT"):
+        proc.userdata["agent_configs"] = AgentConfigCache(
+            os.getenv("AGENT_CONFIG_DIR", "agent_configs"),
+            max_entries=int(os.getenv("AGENT_CONFIG_CACHE_SIZE", "1000"))
+        )
+    # Charger l'audio TTS pré-synthétisé (message de bienvenue, phrases fixes)
+    tts_cache = TTSCache(TTS_CACHE_DIR, voice=TTS_VOICE, model=TTS_MODEL,
+                         max_recorded=int(os.getenv("AGENT_TTS_CACHE_RECORDED_SIZE", "256")))
+    tts_cache.load()
+    proc.userdata["tts_cache"] = tts_cache
+    # Réponses du LLM aux questions récurrentes, partagées par les appels du processus
+    if os.getenv("AGENT_RESPONSE_CACHE", "").lower() in ("true", "1", "t"):
+        proc.userdata["response_cache"] = ResponseCache()
+    # Traces de latence par tour (un fichier par processus) et percentiles par agent
+    proc.userdata["turn_stats"] = TurnStatsAggregator()
+    if TURN_TRACE_DIR:
+        proc.userdata["turn_trace_sink"] = JsonlTraceSink(
+            os.path.join(TURN_TRACE_DIR, f"turns-{os.getpid()}.jsonl")
+        )
+    # Retard de la boucle d'événements du processus, écrit dans les mêmes traces
+    proc.userdata["loop_lag"] = LoopLagMonitor(proc.userdata.get("turn_trace_sink"))
     logger.info("Préchauffage terminé.")
+    readiness.notify("prewarmed")
 
 async def request_func(req: lbm.JobRequest):
     """
@@ -180,12 +355,32 @@ async def request_func(req: lbm.JobRequest):
     agent_name = os.getenv("AGENT_NAME", "voice-assistant")
     agent_identity = os.getenv("AGENT_IDENTITY", "ai-assistant")
     
+    # En mode multi-tenant, l'identité dépend de l'agent indiqué dans le dispatch
+    if os.getenv("AGENT_MULTI_TENANT") and req.metadata:
+        try:
+            agent_id = json.loads(req.metadata).get("agent_id")
+            if agent_id:
+                agent_identity = f"agent-id-{agent_id}"
+        except json.JSONDecodeError:
+            logger.warning(f"Impossible de décoder les métadonnées: {req.metadata}")
+    
     # Accepter la requête avec le nom d'agent configuré
     await req.accept(
         name=agent_name,
         identity=agent_identity,
     )
 
+# Voix et modèle TTS (utilisés aussi comme clé du cache audio)
+TTS_VOICE = os.getenv("AGENT_TTS_VOICE", "alloy")
+TTS_MODEL = os.getenv("AGENT_TTS_MODEL", "tts-1")
+TTS_CACHE_DIR = os.getenv("AGENT_TTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+# Répertoire des traces de latence par tour (vide pour désactiver l'écriture)
+TURN_TRACE_DIR = os.getenv("AGENT_TURN_TRACE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces"))
+
+# Durée maximale d'un appel (30 minutes par défaut)
+MAX_CALL_DURATION = float(os.getenv("AGENT_MAX_CALL_DURATION", "1800"))
+
 # Prompt par défaut pour l'agent
 DEFAULT_PROMPT = """
 Tu es un assistant téléphonique IA sophistiqué. Ta mission est d'aider l'utilisateur de manière efficace et professionnelle.
@@ -200,6 +395,7 @@ def main():
     parser.add_argument("--agent-id", type=str, help="ID unique de l'agent")
     parser.add_argument("--agent-name", type=str, help="Nom de l'agent")
     parser.add_argument("--prompt-template", type=str, help="Template de prompt pour l'agent")
+    parser.add_argument("--multi-tenant", action="store_true", help="Servir tous les agents à partir des métadonnées de dispatch")
     
     args = parser.parse_args()
     
@@ -213,6 +409,9 @@ def main():
     if args.prompt_template:
         os.environ["AGENT_PROMPT_TEMPLATE"] = args.prompt_template
     
+    if args.multi_tenant:
+        os.environ["AGENT_MULTI_TENANT"] = "1"
+    
     # Configuration de l'agent
     worker = WorkerDefinition(
         entrypoint_run=entrypoint,
@@ -221,6 +420,9 @@ def main():
         agent_name=os.getenv("AGENT_NAME", "voice-assistant"),
     )
     
+    # Signaler au service parent que le worker est enregistré auprès de LiveKit
+    worker.on("worker_registered", lambda *_: readiness.notify("registered"))
+    
     logger.info(f"Démarrage de l'agent: {os.getenv('AGENT_NAME', 'voice-assistant')}")
     
     # Démarrer l'agent
@@ -5,6 +5,7 @@ import logging
 
 from app.core.config import settings
 from app.core.security import verify_api_key, verify_token
+from app.services.livekit_client import livekit_client
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,19 @@ async def get_current_user(auth_result: Dict[str, Any] = Depends(verify_token))
     
     return auth_result
 
+async def get_livekit_api():
+    """
+    Dépendance pour obtenir le client LiveKit partagé.
+    
+    Toutes les routes et tous les services utilisent le même client, et donc
+    le même pool de connexions keep-alive vers le serveur LiveKit. Le client
+    est fermé à l'arrêt de l'application.
+    
+    Returns:
+        Le client LiveKitAPI partagé
+    """
+    return livekit_client.api
+
 async def xano_webhook_auth(x_api_key: Optional[str] = Header(None)) -> bool:
     """
     Dépendance pour authentifier les webhooks provenant de Xano.
@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, Body, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, Body, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Optional
 import logging
-from app.core.security import verify_token
+import asyncio
+import json
+from app.core.config import settings
+from app.core.security import verify_token, verify_stream_token, connection_api_key
 from app.services.livekit_service import livekit_service
 from app.services.sip_service import sip_service
-from app.services.agent_service import agent_service
+from app.services.agent_service import agent_service, valid_agent_id
+from app.services.call_service import call_service
+from app.services.xano_outbox import xano_outbox
+from app.services.dial_scheduler import dial_scheduler
+from app.services.call_events import call_events, AGENT_EVENTS, TERMINAL_EVENTS
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Échecs de numérotation dus aux limites du trunk
+DIAL_RETRYABLE_ERRORS = ("dial_queue_full", "dial_queue_timeout", "trunk_rate_limited")
+
 @router.post("/agents/deploy", response_model=Dict[str, Any])
 async def deploy_agent(
     agent_data: Dict[str, Any] = Body(...),
@@ -25,6 +36,9 @@ async def deploy_agent(
     if not agent_id:
         logger.error("Agent ID manquant dans la requête")
         raise HTTPException(status_code=400, detail="Agent ID is required")
+    if not valid_agent_id(str(agent_id)):
+        logger.error(f"Agent ID invalide: {agent_id!r}")
+        raise HTTPException(status_code=400, detail="Agent ID may only contain letters, digits, '_' and '-'")
     
     # Déployer l'agent à l'aide du service
     try:
@@ -45,6 +59,30 @@ async def deploy_agent(
         logger.error(f"Erreur lors du déploiement de l'agent: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to deploy agent: {str(e)}")
 
+@router.get("/agents/{agent_id}/logs", response_model=Dict[str, Any])
+async def get_agent_logs(
+    agent_id: str,
+    lines: int = 100,
+    stream: Optional[str] = None,
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Retourne les dernières lignes de sortie des processus d'un agent"""
+    if stream not in (None, "stdout", "stderr"):
+        raise HTTPException(status_code=400, detail="stream must be 'stdout' or 'stderr'")
+    
+    logs = agent_service.get_agent_logs(agent_id, lines=min(max(lines, 0), settings.agent_log_buffer_lines), stream=stream)
+    if logs is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    return logs
+
+@router.get("/agents/memory", response_model=Dict[str, Any])
+async def get_agent_memory(
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Mémoire (RSS, PSS, USS) des processus d'agents de ce worker et du lanceur"""
+    return await agent_service.get_memory_stats()
+
 @router.post("/calls/initiate", response_model=Dict[str, Any])
 async def initiate_call(
     call_data: Dict[str, Any] = Body(...),
@@ -54,67 +92,220 @@ async def initiate_call(
     logger.info(f"Initialisation d'un appel sortant: {call_data}")
     
     # Valider les données requises
-    agent_id = call_data.get("agent_id")
-    phone_number = call_data.get("phone_number")
-    trunk_id = call_data.get("trunk_id")
-    call_id = call_data.get("call_id")
-    
-    if not all([agent_id, phone_number, trunk_id, call_id]):
-        missing_fields = [field for field in ["agent_id", "phone_number", "trunk_id", "call_id"] 
-                         if not call_data.get(field)]
+    missing_fields = call_service.get_missing_fields(call_data)
+    if missing_fields:
         logger.error(f"Champs manquants: {missing_fields}")
         raise HTTPException(status_code=400, detail=f"Missing required fields: {', '.join(missing_fields)}")
     
-    # Vérifier si l'agent est déjà déployé ou le déployer
-    worker_id = f"agent-{agent_id}"
-    agent_status = await agent_service.get_agent_status(agent_id)
+    result = await call_service.initiate_call(call_data)
+    if result.get("status") == "error":
+        # Trunk saturé: le client peut réessayer plus tard avec le même call_id
+        if result.get("error_code") in DIAL_RETRYABLE_ERRORS:
+            raise HTTPException(status_code=503, detail=result.get("error"), headers={"Retry-After": "1"})
+        if result.get("error_code") == "trunk_not_found":
+            raise HTTPException(status_code=400, detail=result.get("error"))
+        # LiveKit injoignable pendant la recherche du trunk
+        if result.get("error_code") == "trunk_registry_unavailable":
+            raise HTTPException(status_code=503, detail=result.get("error"), headers={"Retry-After": "1"})
+        # Même call_id en cours de mise en place sur un autre worker
+        if result.get("error_code") == "call_in_progress":
+            raise HTTPException(status_code=409, detail=result.get("error"))
+        raise HTTPException(status_code=500, detail=result.get("error"))
     
-    if agent_status.get("status") != "running":
-        logger.warning(f"L'agent {agent_id} n'est pas en cours d'exécution, tentative de déploiement")
-        deploy_result = await agent_service.deploy_agent(
-            agent_id=str(agent_id),
-            name=f"agent-{agent_id}",
-            prompt_template=call_data.get("prompt_template", "")
-        )
-        worker_id = deploy_result.get("worker_id")
+    return result
+
+@router.get("/calls/{call_id}", response_model=Dict[str, Any])
+async def get_call(
+    call_id: str,
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Récupère l'état de la mise en place d'un appel"""
+    call = await call_service.get_call(call_id)
+    if not call:
+        raise HTTPException(status_code=404, detail="Call not found")
     
-    # Créer une salle LiveKit pour l'appel
-    room_name = f"call-{call_id}"
-    logger.info(f"Création de la salle pour l'appel: {room_name}")
+    return call
+
+@router.post("/calls/{call_id}/events", response_model=Dict[str, Any])
+async def report_call_event(
+    call_id: str,
+    event_data: Dict[str, Any] = Body(...),
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Reçoit un événement d'appel signalé par un agent (décroché, parole, raccroché, échec)"""
+    event = event_data.get("event")
+    data = event_data.get("data") or {}
+    
+    if event not in AGENT_EVENTS:
+        raise HTTPException(status_code=400, detail=f"Unknown event, expected one of: {', '.join(sorted(AGENT_EVENTS))}")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="'data' must be an object")
     
-    room_result = await livekit_service.create_room(room_name)
-    if room_result.get("status") not in ["created", "existing"]:
-        logger.error(f"Échec de création de la salle: {room_result}")
-        raise HTTPException(status_code=500, detail="Failed to create room")
+    message = call_events.publish(call_id, event, data, source="agent")
+    
+    # Xano suit aussi la progression de l'appel (la parole de l'agent est trop fréquente)
+    if event != "agent_speaking":
+        payload = {"call_id": call_id, "status": event, "field_value": "1"}
+        for field in ("reason", "error"):
+            if data.get(field):
+                payload[field] = data[field]
+        xano_outbox.enqueue(payload)
+    
+    return {"status": "accepted", "id": message["id"]}
+
+def format_sse(message: Dict[str, Any]) -> str:
+    lines = [f"id: {message['id']}"] if "id" in message else []
+    lines.append(f"event: {message['event']}")
+    lines.append(f"data: {json.dumps(message)}")
+    return "\n".join(lines) + "\n\n"
+
+@router.get("/calls/{call_id}/events")
+async def stream_call_events(
+    call_id: str,
+    request: Request,
+    token_payload: Dict[str, Any] = Depends(verify_stream_token)
+):
+    """
+    Diffuse les événements d'un appel en Server-Sent Events, jusqu'à la fin de l'appel.
+    Clé API en en-tête X-API-Key ou en paramètre api_key (EventSource).
+    """
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    after_id = int(last_event_id) if last_event_id.isdigit() else 0
     
-    # Dispatcher l'agent dans la salle
-    logger.info(f"Dispatching de l'agent {worker_id} dans la salle {room_name}")
+    # S'abonner avant de relire l'historique pour ne manquer aucun événement
+    subscription = call_events.subscribe([call_id])
+    history = call_events.get_history(call_id, after_id)
     
-    # Définir le metadata avec le numéro de téléphone pour que l'agent sache qui appeler
-    metadata = f'{{"phone_number": "{phone_number}", "call_id": "{call_id}"}}'
+    async def event_stream():
+        try:
+            last_id = after_id
+            for message in history:
+                last_id = message["id"]
+                yield format_sse(message)
+            if history and history[-1]["event"] in TERMINAL_EVENTS:
+                return
+            
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=settings.call_events_heartbeat)
+                if message is None:
+                    # Commentaire SSE: garde la connexion ouverte à travers les proxies
+                    yield ": ping\n\n"
+                    continue
+                if message.get("id", last_id + 1) <= last_id:
+                    continue
+                last_id = message.get("id", last_id)
+                yield format_sse(message)
+                if message["event"] in TERMINAL_EVENTS:
+                    break
+        finally:
+            subscription.close()
     
-    dispatch_result = await livekit_service.create_agent_dispatch(worker_id, room_name, metadata)
-    if dispatch_result.get("status") != "dispatched":
-        logger.error(f"Échec du dispatch de l'agent: {dispatch_result}")
-        raise HTTPException(status_code=500, detail="Failed to dispatch agent")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/calls/events/ws")
+async def call_events_websocket(websocket: WebSocket):
+    """
+    Flux multiplexé des événements de plusieurs appels. Le client envoie
+    {"action": "subscribe" | "unsubscribe", "call_ids": [...]} ("*" pour tous les appels).
+    """
+    if connection_api_key(websocket) != settings.api_secret_key:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     
-    # Initier l'appel téléphonique
-    logger.info(f"Initiation de l'appel: trunk={trunk_id}, téléphone={phone_number}")
+    await websocket.accept()
+    subscription = call_events.subscribe([])
     
-    call_result = await sip_service.make_outbound_call(trunk_id, phone_number, room_name, call_id)
-    if call_result.get("status") == "error":
-        logger.error(f"Échec de l'appel: {call_result}")
-        raise HTTPException(status_code=500, detail=call_result.get("error"))
+    async def receive_commands():
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                subscription.put({"event": "error", "error": "Invalid JSON"})
+                continue
+            call_ids = command.get("call_ids") if isinstance(command, dict) else None
+            if not isinstance(call_ids, list):
+                subscription.put({"event": "error", "error": "'call_ids' must be a list"})
+                continue
+            call_ids = [str(call_id) for call_id in call_ids]
+            if command.get("action") == "subscribe":
+                subscription.add(call_ids)
+                # Rattraper les événements déjà publiés pour ces appels
+                for call_id in call_ids:
+                    for message in call_events.get_history(call_id):
+                        subscription.put(message)
+            elif command.get("action") == "unsubscribe":
+                subscription.discard(call_ids)
+            else:
+                subscription.put({"event": "error", "error": "'action' must be 'subscribe' or 'unsubscribe'"})
     
-    logger.info(f"Appel initié: participant_id={call_result.get('participant_id')}")
+    async def send_events():
+        while True:
+            message = await subscription.get(timeout=settings.call_events_heartbeat)
+            await websocket.send_json(message if message is not None else {"event": "ping"})
     
-    return {
-        "call_id": call_id,
-        "participant_id": call_result.get("participant_id"),
-        "room_name": room_name,
-        "status": call_result.get("status"),
-        "agent_id": agent_id
-    }
+    tasks = [asyncio.create_task(receive_commands()), asyncio.create_task(send_events())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.warning(f"Flux WebSocket d'événements interrompu: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        subscription.close()
+
+@router.post("/calls/batch")
+async def initiate_call_batch(
+    batch_data: Dict[str, Any] = Body(...),
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Initie un lot d'appels sortants et renvoie les résultats au fil de l'eau (NDJSON)"""
+    calls = batch_data.get("calls")
+    
+    if not isinstance(calls, list) or not calls:
+        logger.error("Liste d'appels manquante ou vide dans la requête")
+        raise HTTPException(status_code=400, detail="A non-empty 'calls' list is required")
+    
+    if len(calls) > settings.batch_call_max_size:
+        raise HTTPException(status_code=400, detail=f"Too many calls in batch (max {settings.batch_call_max_size})")
+    
+    if not all(isinstance(call, dict) for call in calls):
+        raise HTTPException(status_code=400, detail="Each call must be an object")
+    
+    concurrency = batch_data.get("concurrency")
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        raise HTTPException(status_code=400, detail="'concurrency' must be a positive integer")
+    
+    job = await call_service.start_batch(calls, concurrency)
+    
+    if not batch_data.get("stream", True):
+        return job
+    
+    async def result_lines():
+        yield json.dumps({"event": "job", **job}) + "\n"
+        async for result in call_service.stream_batch_results(job["job_id"]):
+            yield json.dumps({"event": "result", **result}) + "\n"
+        yield json.dumps({"event": "done", **call_service.get_batch_status(job["job_id"], include_results=False)}) + "\n"
+    
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@router.get("/calls/batch/{job_id}", response_model=Dict[str, Any])
+async def get_call_batch_status(
+    job_id: str,
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Récupère l'état et les résultats d'un lot d'appels"""
+    job = call_service.get_batch_status(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    return job
 
 @router.post("/trunks/create", response_model=Dict[str, Any])
 async def create_trunk(
@@ -139,8 +330,47 @@ async def create_trunk(
     
     if trunk_result.get("status") == "error":
         logger.error(f"Échec de création du trunk: {trunk_result}")
+        if trunk_result.get("error_code") == "trunk_conflict":
+            raise HTTPException(status_code=409, detail=trunk_result.get("error"))
+        if trunk_result.get("error_code") == "trunk_registry_unavailable":
+            raise HTTPException(status_code=503, detail=trunk_result.get("error"), headers={"Retry-After": "1"})
         raise HTTPException(status_code=500, detail=trunk_result.get("error"))
     
-    logger.info(f"Trunk créé avec succès: trunk_id={trunk_result.get('trunk_id')}")
+    logger.info(f"Trunk {trunk_result.get('status')}: trunk_id={trunk_result.get('trunk_id')}")
     
     return trunk_result
+
+@router.get("/xano/outbox", response_model=Dict[str, Any])
+async def get_xano_outbox_status(
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Retourne la profondeur de la file d'événements Xano et ses compteurs"""
+    return xano_outbox.get_stats()
+
+@router.get("/rooms/stats", response_model=Dict[str, Any])
+async def get_room_stats(
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Retourne les compteurs du cache de salles et l'état du pool de salles"""
+    return {
+        "cache": livekit_service.get_room_cache_stats(),
+        "pool": livekit_service.get_room_pool_stats()
+    }
+
+@router.get("/trunks", response_model=Dict[str, Any])
+async def list_trunks(
+    refresh: bool = False,
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Liste les trunks SIP sortants connus (registre chargé depuis LiveKit)"""
+    if refresh and not await sip_service.load_trunks():
+        raise HTTPException(status_code=502, detail="Failed to load SIP trunks from LiveKit")
+    
+    return {"trunks": sip_service.list_trunks()}
+
+@router.get("/trunks/dial-queue", response_model=Dict[str, Any])
+async def get_dial_queue(
+    token_payload: Dict[str, Any] = Depends(verify_token)
+):
+    """Retourne l'état des files de numérotation par trunk (attente, appels en cours)"""
+    return dial_scheduler.get_stats()
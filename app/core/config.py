@@ -1,4 +1,5 @@
 import os
+import tempfile
 from typing import List
 from pydantic import BaseSettings
 from dotenv import load_dotenv
@@ -10,6 +11,22 @@ class Settings(BaseSettings):
     livekit_url: str = os.getenv("LIVEKIT_URL", "")
     livekit_api_key: str = os.getenv("LIVEKIT_API_KEY", "")
     livekit_api_secret: str = os.getenv("LIVEKIT_API_SECRET", "")
+    livekit_pool_size: int = int(os.getenv("LIVEKIT_POOL_SIZE", "100"))
+    livekit_keepalive_timeout: float = float(os.getenv("LIVEKIT_KEEPALIVE_TIMEOUT", "30"))
+    livekit_request_timeout: float = float(os.getenv("LIVEKIT_REQUEST_TIMEOUT", "10"))
+    
+    # Cache des salles connues et stratégie de création
+    room_cache_size: int = int(os.getenv("ROOM_CACHE_SIZE", "10000"))
+    room_cache_ttl: float = float(os.getenv("ROOM_CACHE_TTL", "300"))
+    room_create_first: bool = os.getenv("ROOM_CREATE_FIRST", "").lower() in ("true", "1", "t")
+    # Dispatcher l'agent dans la requête de création de salle (CreateRoomRequest.agents)
+    room_dispatch_on_create: bool = os.getenv("ROOM_DISPATCH_ON_CREATE", "").lower() in ("true", "1", "t")
+    
+    # Pool de salles pré-créées (0 pour désactiver)
+    room_pool_size: int = int(os.getenv("ROOM_POOL_SIZE", "0"))
+    room_pool_empty_timeout: int = int(os.getenv("ROOM_POOL_EMPTY_TIMEOUT", "600"))
+    room_pool_max_age_ratio: float = float(os.getenv("ROOM_POOL_MAX_AGE_RATIO", "0.8"))
+    room_pool_refill_concurrency: int = int(os.getenv("ROOM_POOL_REFILL_CONCURRENCY", "5"))
     
     # Configuration API
     api_secret_key: str = os.getenv("API_SECRET_KEY", "")
@@ -17,12 +34,103 @@ class Settings(BaseSettings):
     # Configuration Xano
     xano_webhook_url: str = os.getenv("XANO_WEBHOOK_URL", "")
     xano_api_key: str = os.getenv("XANO_API_KEY", "")
+    # Envoi par lots: au-delà d'un événement, le payload est {"events": [...]}
+    xano_batch_webhook_url: str = os.getenv("XANO_BATCH_WEBHOOK_URL", "")
+    xano_batch_max_events: int = int(os.getenv("XANO_BATCH_MAX_EVENTS", "1"))
+    xano_batch_linger_ms: int = int(os.getenv("XANO_BATCH_LINGER_MS", "50"))
+    xano_outbox_max_size: int = int(os.getenv("XANO_OUTBOX_MAX_SIZE", "10000"))
+    xano_max_retries: int = int(os.getenv("XANO_MAX_RETRIES", "5"))
+    xano_retry_base_delay: float = float(os.getenv("XANO_RETRY_BASE_DELAY", "0.5"))
+    xano_retry_max_delay: float = float(os.getenv("XANO_RETRY_MAX_DELAY", "30"))
+    xano_max_connections: int = int(os.getenv("XANO_MAX_CONNECTIONS", "10"))
+    xano_request_timeout: float = float(os.getenv("XANO_REQUEST_TIMEOUT", "10"))
     
     # Configuration Twilio
     twilio_account_sid: str = os.getenv("TWILIO_ACCOUNT_SID", "")
     twilio_auth_token: str = os.getenv("TWILIO_AUTH_TOKEN", "")
     twilio_phone_number: str = os.getenv("TWILIO_PHONE_NUMBER", "")
     twilio_sip_trunk_id: str = os.getenv("TWILIO_SIP_TRUNK_ID", "")
+    # Intervalle minimal entre deux rechargements du registre des trunks sur un numéro inconnu
+    sip_trunk_reload_interval: float = float(os.getenv("SIP_TRUNK_RELOAD_INTERVAL", "30"))
+    
+    # Ordonnancement des numérotations par trunk (appels par seconde, appels simultanés, 0 = sans limite).
+    # Sans limite par défaut: fixer DIAL_DEFAULT_CPS ou DIAL_TRUNK_LIMITS selon le contrat de l'opérateur
+    dial_default_cps: float = float(os.getenv("DIAL_DEFAULT_CPS", "0"))
+    dial_default_max_concurrent: int = int(os.getenv("DIAL_DEFAULT_MAX_CONCURRENT", "0"))
+    # Limites propres à certains trunks: "trunk_id:cps:max_concurrent,..."
+    dial_trunk_limits: str = os.getenv("DIAL_TRUNK_LIMITS", "")
+    dial_burst: float = float(os.getenv("DIAL_BURST", "1"))
+    dial_queue_max_size: int = int(os.getenv("DIAL_QUEUE_MAX_SIZE", "1000"))
+    dial_queue_timeout: float = float(os.getenv("DIAL_QUEUE_TIMEOUT", "60"))
+    # Durée maximale d'occupation d'un créneau par un appel dont la fin n'est pas signalée
+    # (au-delà de la durée maximale d'un appel côté agent, AGENT_MAX_CALL_DURATION)
+    dial_slot_max_hold: float = float(os.getenv("DIAL_SLOT_MAX_HOLD", "2100"))
+    # Priorité par défaut des appels de campagne (les appels unitaires ont la priorité 0)
+    dial_batch_priority: int = int(os.getenv("DIAL_BATCH_PRIORITY", "-1"))
+    
+    # Idempotence des demandes d'appel: résultats conservés par call_id pour les nouvelles tentatives
+    call_result_ttl: float = float(os.getenv("CALL_RESULT_TTL", "600"))
+    call_result_cache_size: int = int(os.getenv("CALL_RESULT_CACHE_SIZE", "10000"))
+    # Bail du verrou de mise en place, prolongé tant que la mise en place dure: borne
+    # seulement le blocage laissé par un worker arrêté en cours de mise en place
+    call_setup_lock_ttl: float = float(os.getenv("CALL_SETUP_LOCK_TTL", "90"))
+    # Attente d'une mise en place en cours sur un autre worker (0: pire cas de la mise en
+    # place, calculé à partir de l'attente de numérotation, du démarrage d'un agent et de LiveKit)
+    call_setup_wait_timeout: float = float(os.getenv("CALL_SETUP_WAIT_TIMEOUT", "0"))
+    
+    # Flux d'événements d'appels (SSE / WebSocket)
+    call_events_subscriber_buffer: int = int(os.getenv("CALL_EVENTS_SUBSCRIBER_BUFFER", "256"))
+    call_events_history_size: int = int(os.getenv("CALL_EVENTS_HISTORY_SIZE", "100"))
+    call_events_max_calls: int = int(os.getenv("CALL_EVENTS_MAX_CALLS", "10000"))
+    call_events_heartbeat: float = float(os.getenv("CALL_EVENTS_HEARTBEAT", "15"))
+    # URL à laquelle les agents signalent les événements d'appels (vide: API locale)
+    call_events_url: str = os.getenv("CALL_EVENTS_URL", "")
+    
+    # Configuration des lots d'appels (campagnes)
+    batch_call_concurrency: int = int(os.getenv("BATCH_CALL_CONCURRENCY", "10"))
+    batch_call_max_concurrency: int = int(os.getenv("BATCH_CALL_MAX_CONCURRENCY", "100"))
+    batch_call_max_size: int = int(os.getenv("BATCH_CALL_MAX_SIZE", "5000"))
+    batch_job_retention: int = int(os.getenv("BATCH_JOB_RETENTION", "100"))
+
+    # Configuration des workers d'agents
+    # "dedicated": un processus par agent, "shared": un nombre fixe de workers pour tous les agents
+    agent_worker_mode: str = os.getenv("AGENT_WORKER_MODE", "dedicated")
+    # Script lancé pour chaque processus d'agent (agents/voice_agent.py par défaut)
+    agent_script_path: str = os.getenv("AGENT_SCRIPT_PATH", "")
+    shared_worker_count: int = int(os.getenv("SHARED_WORKER_COUNT", "2"))
+    shared_worker_name: str = os.getenv("SHARED_WORKER_NAME", "agent-shared")
+    agent_config_dir: str = os.getenv("AGENT_CONFIG_DIR", os.path.join(os.getcwd(), "agent_configs"))
+    # Processus préchauffés en attente d'affectation (mode dédié, 0 pour désactiver)
+    agent_pool_size: int = int(os.getenv("AGENT_POOL_SIZE", "0"))
+    agent_ready_timeout: float = float(os.getenv("AGENT_READY_TIMEOUT", "30"))
+    agent_ready_socket: str = os.getenv(
+        "AGENT_READY_SOCKET", os.path.join(tempfile.gettempdir(), f"agent-ready-{os.getpid()}.sock")
+    )
+    # Lancement des agents par fork d'un processus où modules et VAD sont préchargés
+    # (pages partagées en copie sur écriture entre les agents, Linux/macOS)
+    agent_forkserver: bool = os.getenv("AGENT_FORKSERVER", "").lower() in ("true", "1", "t")
+    agent_forkserver_socket: str = os.getenv(
+        "AGENT_FORKSERVER_SOCKET", os.path.join(tempfile.gettempdir(), f"agent-forkserver-{os.getpid()}.sock")
+    )
+    
+    # Redémarrage automatique des processus d'agents arrêtés (backoff exponentiel)
+    agent_restart_base_delay: float = float(os.getenv("AGENT_RESTART_BASE_DELAY", "1"))
+    agent_restart_max_delay: float = float(os.getenv("AGENT_RESTART_MAX_DELAY", "60"))
+    agent_restart_max_attempts: int = int(os.getenv("AGENT_RESTART_MAX_ATTEMPTS", "10"))
+    # Durée de fonctionnement après laquelle le compteur de tentatives repart à zéro
+    agent_restart_reset_after: float = float(os.getenv("AGENT_RESTART_RESET_AFTER", "300"))
+    
+    # État partagé entre les workers de l'API: "memory" (un seul worker) ou "sqlite" (WAL, une machine)
+    state_backend: str = os.getenv("STATE_BACKEND", "memory")
+    state_sqlite_path: str = os.getenv("STATE_SQLITE_PATH", os.path.join(os.getcwd(), "state.db"))
+    state_call_retention: int = int(os.getenv("STATE_CALL_RETENTION", "10000"))
+    
+    # Sorties des processus d'agents (buffer circulaire, fichiers avec rotation si un répertoire est défini)
+    agent_log_buffer_lines: int = int(os.getenv("AGENT_LOG_BUFFER_LINES", "1000"))
+    agent_log_max_line_bytes: int = int(os.getenv("AGENT_LOG_MAX_LINE_BYTES", "65536"))
+    agent_log_dir: str = os.getenv("AGENT_LOG_DIR", "")
+    agent_log_file_max_bytes: int = int(os.getenv("AGENT_LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+    agent_log_file_backups: int = int(os.getenv("AGENT_LOG_FILE_BACKUPS", "3"))
     
     # Configuration CORS
     cors_origins: List[str] = []
@@ -51,5 +159,13 @@ class Settings(BaseSettings):
         if not self.api_secret_key:
             self.api_secret_key = "default_insecure_key"
             print("WARNING: Using insecure default API key, please set API_SECRET_KEY")
+        
+        if not self.call_setup_wait_timeout:
+            self.call_setup_wait_timeout = (
+                self.dial_queue_timeout + self.agent_ready_timeout + 3 * self.livekit_request_timeout
+            )
+        
+        if not self.call_events_url:
+            self.call_events_url = f"http://127.0.0.1:{self.port}/api/calls"
 
 settings = Settings()
@@ -0,0 +1,235 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+# Bornes (en secondes) des histogrammes de latence
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Histogram:
+    """
+    Histogramme cumulatif au format Prometheus
+    """
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {series['count']}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+class Counter:
+    """
+    Compteur monotone au format Prometheus
+    """
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class Gauge:
+    """
+    Jauge au format Prometheus. Les valeurs peuvent être fixées directement
+    ou calculées au moment de la collecte par une fonction.
+    """
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """
+        La fonction retourne {(valeurs des labels,): valeur}, appelée à chaque collecte
+        """
+        self._function = function
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        if self._function is not None:
+            values = self._function()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+call_setup_stage_seconds = registry.register(Histogram(
+    "call_setup_stage_seconds",
+    "Durée de chaque étape de mise en place d'un appel",
+    ("stage", "outcome")
+))
+call_setup_seconds = registry.register(Histogram(
+    "call_setup_seconds",
+    "Durée totale de mise en place d'un appel (jusqu'à la numérotation)",
+    ("outcome",)
+))
+calls_in_flight = registry.register(Gauge(
+    "calls_in_flight",
+    "Appels en cours de mise en place"
+))
+calls_deduplicated_total = registry.register(Counter(
+    "calls_deduplicated_total",
+    "Demandes d'appel servies sans nouvelle mise en place (même call_id)",
+    ("reason",)
+))
+agent_processes = registry.register(Gauge(
+    "agent_processes",
+    "Processus d'agents actifs par type",
+    ("kind",)
+))
+agent_restarts_total = registry.register(Counter(
+    "agent_restarts_total",
+    "Redémarrages de processus d'agents par le superviseur",
+    ("outcome",)
+))
+dial_queue_depth = registry.register(Gauge(
+    "dial_queue_depth",
+    "Appels en attente d'un créneau de numérotation par trunk",
+    ("trunk",)
+))
+dial_active_calls = registry.register(Gauge(
+    "dial_active_calls",
+    "Appels en cours occupant un créneau de numérotation, par trunk",
+    ("trunk",)
+))
+dial_queue_wait_seconds = registry.register(Histogram(
+    "dial_queue_wait_seconds",
+    "Attente d'un créneau de numérotation par trunk",
+    ("trunk", "outcome")
+))
+call_events_total = registry.register(Counter(
+    "call_events_total",
+    "Événements d'appels publiés sur le bus",
+    ("event", "source")
+))
+call_event_subscribers = registry.register(Gauge(
+    "call_event_subscribers",
+    "Abonnés aux flux d'événements d'appels (SSE et WebSocket)"
+))
+call_events_dropped_total = registry.register(Counter(
+    "call_events_dropped_total",
+    "Événements abandonnés pour des abonnés trop lents"
+))
+xano_events_total = registry.register(Counter(
+    "xano_events_total",
+    "Événements d'appel traités par l'outbox Xano",
+    ("outcome",)
+))
+xano_outbox_queue_depth = registry.register(Gauge(
+    "xano_outbox_queue_depth",
+    "Événements en attente d'envoi à Xano"
+))
+
+class StageTimer:
+    def __init__(self):
+        self.outcome = "success"
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Mesure une étape de mise en place d'appel. Une exception marque l'étape en erreur;
+    l'appelant peut aussi fixer timer.outcome lorsque l'échec est retourné dans un résultat.
+    """
+    timer = StageTimer()
+    start_time = time.perf_counter()
+    try:
+        yield timer
+    except BaseException:
+        timer.outcome = "error"
+        raise
+    finally:
+        call_setup_stage_seconds.observe(time.perf_counter() - start_time, stage=stage, outcome=timer.outcome)
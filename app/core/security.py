@@ -1,8 +1,9 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import APIKeyHeader
 from jose import jwt, JWTError
+from starlette.requests import HTTPConnection
 from app.core.config import settings
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -32,3 +33,13 @@ async def verify_token(token: str = Depends(api_key_header)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Authentication error: {str(e)}",
         )
+
+def connection_api_key(connection: HTTPConnection) -> Optional[str]:
+    """
+    Clé API d'une requête HTTP ou d'un WebSocket: en-tête X-API-Key, sinon paramètre api_key.
+    Les navigateurs ne peuvent fixer d'en-tête ni sur un EventSource ni sur un WebSocket.
+    """
+    return connection.headers.get("X-API-Key") or connection.query_params.get("api_key")
+
+async def verify_stream_token(request: Request):
+    return await verify_token(connection_api_key(request))
@@ -1,9 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import logging
 
 from app.core.config import settings
+from app.core.metrics import registry as metrics_registry
 from app.api.endpoints import router as api_router
+from app.services.xano_outbox import xano_outbox
+from app.services.livekit_client import livekit_client
+from app.services.livekit_service import livekit_service
+from app.services.sip_service import sip_service
+from app.services.agent_service import agent_service
+from app.services.agent_forkserver import agent_forkserver
+from app.services.agent_supervisor import agent_supervisor
+from app.services.state_store import state_store
 
 # Configuration du logging
 logging.basicConfig(
@@ -34,6 +44,10 @@ app.include_router(api_router, prefix="/api")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -42,3 +56,20 @@ if __name__ == "__main__":
 async def startup_event():
     routes = [{"path": route.path, "name": route.name} for route in app.routes]
     logger.info(f"Available routes: {routes}")
+    await state_store.start()
+    await xano_outbox.start()
+    await sip_service.load_trunks()
+    await livekit_service.start_room_pool()
+    if agent_forkserver.enabled:
+        # Précharger modules et VAD avant le premier déploiement
+        await agent_forkserver.start()
+    await agent_service.start_agent_pool()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await livekit_service.stop_room_pool()
+    await agent_supervisor.stop()
+    await agent_service.stop_agent_pool()
+    await xano_outbox.stop()
+    await livekit_client.close()
+    await state_store.close()
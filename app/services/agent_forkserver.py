@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import asyncio
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.single_flight import SingleFlight
+from app.services.state_store import pid_alive
+
+logger = logging.getLogger(__name__)
+
+FORKSERVER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "agents", "forkserver.py"
+)
+
+async def _pipe_reader(fd: int, limit: int) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=limit)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0))
+    return reader
+
+class ForkedProcess:
+    """
+    Processus d'agent créé par le lanceur. Expose ce que le service utilise
+    d'asyncio.subprocess.Process: pid, returncode, stdout, stderr, wait(),
+    terminate(), kill() et send_signal().
+    """
+
+    def __init__(self, pid: int, stdout: asyncio.StreamReader, stderr: asyncio.StreamReader,
+                 exit_reader: asyncio.StreamReader, exit_writer: asyncio.StreamWriter):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self.stdout = stdout
+        self.stderr = stderr
+        self._exit_task = asyncio.create_task(self._watch_exit(exit_reader, exit_writer))
+
+    async def _watch_exit(self, exit_reader: asyncio.StreamReader, exit_writer: asyncio.StreamWriter) -> None:
+        returncode = None
+        try:
+            line = await exit_reader.readline()
+            if line:
+                returncode = json.loads(line).get("returncode")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Lanceur d'agents: fin du processus {self.pid} non reçue: {e}")
+        finally:
+            exit_writer.close()
+
+        if returncode is None:
+            # Lanceur arrêté avant l'agent: le code de sortie ne sera pas connu
+            while pid_alive(self.pid):
+                await asyncio.sleep(1)
+            returncode = -1
+        self.returncode = returncode
+
+    async def wait(self) -> int:
+        await asyncio.shield(self._exit_task)
+        return self.returncode
+
+    def send_signal(self, signum: int) -> None:
+        if self.returncode is not None:
+            raise ProcessLookupError()
+        os.kill(self.pid, signum)
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+class AgentForkserver:
+    """
+    Client du lanceur d'agents (agents/forkserver.py): les modules lourds et le VAD
+    y sont chargés une fois, chaque agent en est un fork qui partage ces pages.
+    Le lanceur est démarré à la première demande et relancé s'il s'est arrêté.
+    """
+
+    def __init__(self):
+        self.socket_path = settings.agent_forkserver_socket
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._start_flight = SingleFlight()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.agent_forkserver
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self._process and self._process.returncode is None:
+            return self._process.pid
+        return None
+
+    async def start(self) -> None:
+        if self.pid is None:
+            await self._start_flight.do("start", self._start)
+
+    async def _start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        start_time = time.time()
+        # Les sorties du lanceur rejoignent celles du service
+        self._process = await asyncio.create_subprocess_exec(
+            sys.executable, FORKSERVER_SCRIPT, "--socket", self.socket_path
+        )
+
+        # Le socket est ouvert une fois le préchargement terminé
+        while time.time() - start_time < settings.agent_ready_timeout:
+            if self._process.returncode is not None:
+                raise RuntimeError(f"Agent forkserver exited during startup (code {self._process.returncode})")
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+                writer.close()
+                logger.info(f"Lanceur d'agents prêt en {int((time.time() - start_time) * 1000)}ms (pid={self._process.pid})")
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)
+
+        self._process.kill()
+        raise RuntimeError(f"Agent forkserver not ready after {settings.agent_ready_timeout}s")
+
+    async def spawn(self, script_path: str, args: List[str], env: Dict[str, str]) -> ForkedProcess:
+        """
+        Lance un agent par fork du lanceur (équivalent de create_subprocess_exec)
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            try:
+                await loop.sock_connect(sock, self.socket_path)
+                # Les descripteurs accompagnent le premier octet, la demande suit
+                socket.send_fds(sock, [b"\0"], [stdout_w, stderr_w])
+                request = {"script": script_path, "args": args, "env": env}
+                await loop.sock_sendall(sock, (json.dumps(request) + "\n").encode("utf-8"))
+            finally:
+                os.close(stdout_w)
+                os.close(stderr_w)
+
+            exit_reader, exit_writer = await asyncio.open_unix_connection(sock=sock)
+            line = await asyncio.wait_for(exit_reader.readline(), timeout=10)
+            response = json.loads(line) if line else {"error": "forkserver closed the connection"}
+            if "pid" not in response:
+                exit_writer.close()
+                raise RuntimeError(f"Agent forkserver failed to spawn agent: {response.get('error')}")
+        except BaseException:
+            sock.close()
+            os.close(stdout_r)
+            os.close(stderr_r)
+            raise
+
+        stdout = await _pipe_reader(stdout_r, settings.agent_log_max_line_bytes)
+        stderr = await _pipe_reader(stderr_r, settings.agent_log_max_line_bytes)
+        return ForkedProcess(response["pid"], stdout, stderr, exit_reader, exit_writer)
+
+    async def stop(self) -> None:
+        """
+        Arrête le lanceur; les agents déjà lancés continuent de fonctionner
+        """
+        if self._process is None or self._process.returncode is not None:
+            return
+
+        self._process.terminate()
+        try:
+            await asyncio.wait_for(self._process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            self._process.kill()
+        self._process = None
+
+# Instancier le client du lanceur
+agent_forkserver = AgentForkserver()
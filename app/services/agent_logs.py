@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import asyncio
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class AgentLogBuffer:
+    """
+    Lit en continu stdout/stderr d'un processus d'agent pour que les pipes ne se remplissent
+    jamais, et conserve les dernières lignes dans un buffer circulaire borné.
+    Les lignes peuvent aussi être écrites dans un fichier avec rotation.
+    Un même buffer est rattaché aux processus successifs d'un agent relancé.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lines = deque(maxlen=settings.agent_log_buffer_lines)
+        self._tasks: List[asyncio.Task] = []
+        self._file_logger: Optional[logging.Logger] = None
+        self._file_handler: Optional[RotatingFileHandler] = None
+
+        if settings.agent_log_dir:
+            os.makedirs(settings.agent_log_dir, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(settings.agent_log_dir, f"{name}.log"),
+                maxBytes=settings.agent_log_file_max_bytes,
+                backupCount=settings.agent_log_file_backups,
+                encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger(f"agent_output.{name}")
+            self._file_logger.propagate = False
+            # Le logger est partagé par nom: fermer le fichier d'un buffer précédent non fermé
+            for previous_handler in self._file_logger.handlers:
+                previous_handler.close()
+            self._file_logger.handlers = [handler]
+            self._file_logger.setLevel(logging.INFO)
+            self._file_handler = handler
+
+    def attach(self, process: asyncio.subprocess.Process) -> None:
+        """
+        Démarre la lecture des deux flux du processus; les lignes du processus
+        précédent (sortie d'erreur d'un crash) restent dans le buffer
+        """
+        self._tasks = [
+            asyncio.create_task(self._drain(process.stdout, "stdout")),
+            asyncio.create_task(self._drain(process.stderr, "stderr")),
+        ]
+
+    def tail(self, lines: int = 100, stream: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Retourne les dernières lignes, éventuellement filtrées par flux
+        """
+        entries = [entry for entry in self.lines if stream is None or entry["stream"] == stream]
+        return entries[-lines:] if lines > 0 else []
+
+    def tail_text(self, lines: int = 20, stream: Optional[str] = None) -> str:
+        return "\n".join(entry["line"] for entry in self.tail(lines, stream))
+
+    async def drain(self) -> None:
+        """
+        Attend la fin de la lecture (les flux se ferment avec le processus)
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Attend la fin de la lecture puis ferme le fichier de log. Au-delà de timeout,
+        la lecture est abandonnée (un sous-processus de l'agent peut garder les flux ouverts).
+        """
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._file_handler:
+            # Seulement le fichier de ce buffer: un nouveau buffer du même nom a pu reprendre le logger
+            self._file_logger.removeHandler(self._file_handler)
+            self._file_handler.close()
+            self._file_handler = None
+
+    async def _drain(self, reader: asyncio.StreamReader, stream: str) -> None:
+        while True:
+            try:
+                raw_line = await reader.readline()
+            except ValueError:
+                # Ligne plus longue que la limite du StreamReader: on lit ce qui est disponible
+                raw_line = await reader.read(settings.agent_log_max_line_bytes)
+            if not raw_line:
+                break
+
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+            self.lines.append({"timestamp": time.time(), "stream": stream, "line": line})
+            if self._file_logger:
+                self._file_logger.info(f"[{stream}] {line}")
@@ -0,0 +1,87 @@
+import os
+import json
+import logging
+import asyncio
+from typing import Dict, Any, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Un processus d'agent est prêt quand son préchauffage est terminé et que le worker est enregistré
+READY_EVENTS = {"prewarmed", "registered"}
+
+class AgentReadinessServer:
+    """
+    Socket Unix sur lequel les processus d'agents signalent leur état de préparation.
+    Chaque processus reçoit un jeton unique (AGENT_READY_TOKEN) et envoie une ligne
+    JSON {"token": ..., "event": ...} pour chaque étape franchie.
+    """
+
+    def __init__(self):
+        self.socket_path = settings.agent_ready_socket
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    async def start(self) -> None:
+        if self._server is not None:
+            return
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        logger.info(f"Socket de préparation des agents en écoute: {self.socket_path}")
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def register(self, token: str) -> asyncio.Future:
+        """
+        Déclare un processus à attendre et retourne le futur résolu quand il est prêt
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending[token] = {"events": set(), "future": future}
+        return future
+
+    def get_future(self, token: str) -> Optional[asyncio.Future]:
+        pending = self._pending.get(token)
+        return pending["future"] if pending else None
+
+    def discard(self, token: str) -> None:
+        self._pending.pop(token, None)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Message de préparation invalide: {line!r}")
+                    continue
+                self._handle_message(message)
+        finally:
+            writer.close()
+
+    def _handle_message(self, message: Dict[str, Any]) -> None:
+        pending = self._pending.get(message.get("token"))
+        if pending is None:
+            return
+
+        pending["events"].add(message.get("event"))
+        logger.debug(f"Agent pid={message.get('pid')}: étape {message.get('event')}")
+
+        if READY_EVENTS <= pending["events"] and not pending["future"].done():
+            pending["future"].set_result(message.get("pid"))
+
+# Instancier le serveur
+agent_readiness = AgentReadinessServer()
@@ -1,13 +1,79 @@
 import logging
 import time
-import subprocess
 import os
+import re
 import sys
 import asyncio
-from typing import Dict, Any, Optional, List
+import json
+import uuid
+import signal
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+import psutil
+from app.core.config import settings
+from app.core.metrics import agent_processes, agent_restarts_total
+from app.core.single_flight import SingleFlight
+from app.services.agent_readiness import agent_readiness
+from app.services.agent_forkserver import agent_forkserver
+from app.services.agent_logs import AgentLogBuffer
+from app.services.agent_supervisor import agent_supervisor, STATE_RUNNING, STATE_RESTARTING
+from app.services.state_store import state_store, pid_alive
 
 logger = logging.getLogger(__name__)
 
+# L'identifiant d'agent sert de nom de fichier (configuration des workers partagés)
+AGENT_ID_PATTERN = re.compile(r"[\w-]{1,128}")
+
+def valid_agent_id(agent_id: str) -> bool:
+    return AGENT_ID_PATTERN.fullmatch(agent_id) is not None
+
+def _process_memory(pid: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    RSS, PSS et USS d'un processus en octets (PSS disponible sous Linux uniquement)
+    """
+    if not pid:
+        return None
+    try:
+        info = psutil.Process(pid).memory_full_info()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+    return {
+        "rss_bytes": info.rss,
+        "pss_bytes": getattr(info, "pss", None),
+        "uss_bytes": info.uss,
+        # Pages partagées avec d'autres processus (lanceur, autres agents)
+        "shared_bytes": info.rss - info.uss,
+    }
+
+def _memory_report(processes: List[Dict[str, Any]], forkserver_pid: Optional[int]) -> Dict[str, Any]:
+    workers = []
+    for process in processes:
+        memory = _process_memory(process["pid"])
+        if memory is not None:
+            workers.append({**process, **memory})
+    forkserver = _process_memory(forkserver_pid)
+    if forkserver is not None:
+        forkserver["pid"] = forkserver_pid
+
+    measured = workers + ([forkserver] if forkserver else [])
+    total_rss = sum(entry["rss_bytes"] for entry in measured)
+    pss_available = all(entry["pss_bytes"] is not None for entry in measured)
+    total_pss = sum(entry["pss_bytes"] for entry in measured) if pss_available else None
+
+    return {
+        "forkserver": forkserver,
+        "workers": workers,
+        "totals": {
+            "workers": len(workers),
+            "rss_bytes": total_rss,
+            "pss_bytes": total_pss,
+            # Pages comptées dans la RSS de plusieurs processus mais présentes une seule fois
+            "saved_bytes": total_rss - total_pss if total_pss is not None else None,
+            # Coût d'un agent supplémentaire: sa mémoire privée
+            "uss_bytes_per_worker": sum(entry["uss_bytes"] for entry in workers) // len(workers) if workers else None,
+        },
+    }
+
 class AgentService:
     """
     Service pour gérer les agents vocaux
@@ -16,16 +82,435 @@ class AgentService:
     def __init__(self):
         self.running_agents = {}
         self.agent_processes = {}
-        logger.info("Service d'agents initialisé")
+        # Processus des workers partagés (mode multi-tenant)
+        self.shared_workers = {}
+        # Sorties des processus d'agents, par nom de processus
+        self.agent_logs = {}
+        # Processus préchauffés en attente d'affectation à un agent
+        self.standby_agents = deque()
+        self._standby_pending = 0
+        self._agent_pool_refill: Optional[asyncio.Event] = None
+        self._agent_pool_task: Optional[asyncio.Task] = None
+        # Commande de lancement de chaque processus supervisé, pour le relancer à l'identique
+        self._launch_specs: Dict[str, Dict[str, Any]] = {}
+        # Déploiements en cours, par agent_id
+        self._deploy_flights = SingleFlight()
+        logger.info(f"Service d'agents initialisé (mode: {settings.agent_worker_mode})")
+    
+    @property
+    def shared_mode(self) -> bool:
+        return settings.agent_worker_mode == "shared"
+    
+    def _get_agent_script_path(self) -> str:
+        if settings.agent_script_path:
+            return settings.agent_script_path
+        return os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            "agents", "voice_agent.py"
+        )
+    
+    def _agent_config_path(self, agent_id: str) -> str:
+        if not valid_agent_id(agent_id):
+            raise ValueError(f"Invalid agent_id: {agent_id!r}")
+        return os.path.join(settings.agent_config_dir, f"{agent_id}.json")
+    
+    def _write_agent_config(self, agent_id: str, config: Dict[str, Any]) -> None:
+        """
+        Écrit la configuration d'un agent pour les workers partagés (écriture atomique)
+        """
+        path = self._agent_config_path(agent_id)
+        os.makedirs(settings.agent_config_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        os.replace(tmp_path, path)
+    
+    def _remove_agent_config(self, agent_id: str) -> None:
+        try:
+            os.remove(self._agent_config_path(agent_id))
+        except FileNotFoundError:
+            pass
+    
+    def _alive_shared_workers(self) -> List[str]:
+        return [key for key, process in self.shared_workers.items() if process.returncode is None]
+    
+    def _process_status(self, name: str, process: Optional[asyncio.subprocess.Process]) -> str:
+        """
+        État d'un processus d'agent, lu en mémoire (maintenu par le superviseur)
+        """
+        state = agent_supervisor.get_state(name)
+        if state is not None:
+            return state
+        return "running" if process and process.returncode is None else "stopped"
+    
+    def _shared_worker_keys(self) -> List[str]:
+        return [f"{settings.shared_worker_name}-{index}" for index in range(settings.shared_worker_count)]
+    
+    async def _remote_shared_workers(self) -> List[str]:
+        """
+        Workers partagés lancés et surveillés par un autre worker de l'API
+        """
+        remote = []
+        for key in self._shared_worker_keys():
+            if key in self.shared_workers:
+                continue
+            record = await state_store.get_agent(f"shared:{key}")
+            if record and self._record_status(record) == STATE_RUNNING:
+                remote.append(key)
+        return remote
+    
+    async def _shared_status(self) -> str:
+        states = {self._process_status(key, process) for key, process in self.shared_workers.items()}
+        if STATE_RUNNING in states or await self._remote_shared_workers():
+            return STATE_RUNNING
+        return STATE_RESTARTING if STATE_RESTARTING in states else "stopped"
+    
+    async def _agent_status(self, worker_id: str, agent_info: Dict[str, Any]) -> str:
+        if agent_info.get("mode") == "shared":
+            return await self._shared_status()
+        return self._process_status(agent_info.get("worker_name", worker_id), self.agent_processes.get(worker_id))
+    
+    def _record_status(self, record: Dict[str, Any]) -> str:
+        """
+        Statut d'un agent enregistré par un autre worker de l'API: tant que ce worker
+        est vivant, il surveille l'agent et le relance si son processus s'est arrêté
+        """
+        if not pid_alive(record.get("owner_pid")):
+            return "stopped"
+        if record.get("mode") == "shared" or pid_alive(record.get("pid")):
+            return STATE_RUNNING
+        return STATE_RESTARTING
+    
+    def _terminate_orphan(self, record: Dict[str, Any]) -> None:
+        """
+        Arrête un processus d'agent dont le worker API propriétaire a disparu
+        """
+        pid = record.get("pid")
+        if pid and pid != os.getpid() and pid_alive(pid):
+            logger.warning(f"Arrêt du processus d'agent orphelin pid={pid}")
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                logger.error(f"Impossible d'arrêter le processus orphelin {pid}: {e}")
+    
+    async def _publish_agent(self, worker_id: str) -> None:
+        """
+        Enregistre l'agent dans l'état partagé pour les autres workers de l'API
+        """
+        agent_info = self.running_agents.get(worker_id)
+        if agent_info is None:
+            return
+        process = self.agent_processes.get(worker_id)
+        await state_store.put_agent(worker_id, {
+            **agent_info,
+            "owner_pid": os.getpid(),
+            "pid": process.pid if process else None
+        })
+    
+    def _supervise_process(self, name: str, process: asyncio.subprocess.Process, args: List[str],
+                           env: Dict[str, str], worker_id: Optional[str] = None) -> None:
+        """
+        Confie un processus prêt au superviseur, qui le relancera s'il s'arrête
+        """
+        self._launch_specs[name] = {"args": args, "env": env, "worker_id": worker_id}
+        agent_supervisor.watch(name, process, self._restart_process, self._forget_process)
+    
+    async def _restart_process(self, name: str) -> Optional[asyncio.subprocess.Process]:
+        spec = self._launch_specs.get(name)
+        if spec is None:
+            return None
+        
+        process, ready_token = await self._spawn_agent_process(name, spec["args"], spec["env"])
+        result = await self._wait_until_ready(process, ready_token, name)
+        if result.get("status") == "error":
+            logger.error(f"Le processus d'agent {name} n'a pas redémarré: {result.get('error')}")
+            if process.returncode is None:
+                process.kill()
+            agent_restarts_total.inc(outcome="error")
+            return None
+        
+        if spec["worker_id"]:
+            self.agent_processes[spec["worker_id"]] = process
+            await self._publish_agent(spec["worker_id"])
+        else:
+            self.shared_workers[name] = process
+            await state_store.put_agent(f"shared:{name}", {"mode": "shared", "owner_pid": os.getpid(), "pid": process.pid})
+        agent_restarts_total.inc(outcome="success")
+        return process
+    
+    async def _forget_process(self, name: str) -> None:
+        """
+        Oublie un processus abandonné par le superviseur et l'agent qu'il servait
+        """
+        spec = self._launch_specs.pop(name, None)
+        await self._discard_logs(name)
+        if spec and spec["worker_id"]:
+            worker_id = spec["worker_id"]
+            self.agent_processes.pop(worker_id, None)
+            agent_info = self.running_agents.pop(worker_id, None)
+            if agent_info and agent_info.get("worker_name"):
+                self._remove_agent_config(agent_info["agent_id"])
+            record_key = worker_id
+            logger.warning(f"Agent {worker_id} retiré après l'échec de ses redémarrages")
+        else:
+            self.shared_workers.pop(name, None)
+            record_key = f"shared:{name}"
+        
+        try:
+            await state_store.delete_agent(record_key)
+        except Exception as e:
+            # L'enregistrement resterait visible des autres workers de l'API comme en cours d'exécution
+            logger.error(f"Impossible de retirer {record_key} de l'état partagé: {e}")
+    
+    async def _discard_logs(self, log_name: str) -> None:
+        """
+        Oublie le buffer d'un processus arrêté et ferme son fichier de log
+        """
+        log_buffer = self.agent_logs.pop(log_name, None)
+        if log_buffer:
+            try:
+                await log_buffer.close(timeout=5)
+            except Exception as e:
+                logger.error(f"Erreur lors de la fermeture des logs de {log_name}: {e}")
+    
+    async def _spawn_agent_process(self, log_name: str, args: List[str], env_overrides: Dict[str, str]) -> Tuple[asyncio.subprocess.Process, str]:
+        """
+        Lance un processus d'agent et retourne le jeton avec lequel il signalera être prêt.
+        Les sorties du processus sont lues en continu dans un buffer nommé log_name.
+        """
+        await agent_readiness.start()
+        
+        token = uuid.uuid4().hex
+        agent_readiness.register(token)
+        
+        env = os.environ.copy()
+        env.update(env_overrides)
+        env["AGENT_READY_SOCKET"] = agent_readiness.socket_path
+        env["AGENT_READY_TOKEN"] = token
+        # Les agents signalent les événements des appels à l'API
+        env["AGENT_CALL_EVENTS_URL"] = settings.call_events_url
+        env["AGENT_CALL_EVENTS_KEY"] = settings.api_secret_key
+        
+        try:
+            if agent_forkserver.enabled:
+                # Fork du lanceur: modules et VAD déjà chargés, pages partagées
+                process = await agent_forkserver.spawn(self._get_agent_script_path(), list(args), env)
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, self._get_agent_script_path(), *args,
+                    env=env,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    limit=settings.agent_log_max_line_bytes
+                )
+        except Exception:
+            agent_readiness.discard(token)
+            raise
+        
+        # Un processus relancé reprend le buffer de celui qu'il remplace
+        log_buffer = self.agent_logs.get(log_name) or AgentLogBuffer(log_name)
+        log_buffer.attach(process)
+        self.agent_logs[log_name] = log_buffer
+        
+        return process, token
+    
+    async def _wait_until_ready(self, process: asyncio.subprocess.Process, token: str, log_name: str) -> Dict[str, Any]:
+        """
+        Attend le signal de préparation du processus, son arrêt prématuré ou le timeout
+        """
+        ready_future = agent_readiness.get_future(token)
+        exit_task = asyncio.ensure_future(process.wait())
+        start_time = time.time()
+        
+        try:
+            await asyncio.wait(
+                {ready_future, exit_task},
+                timeout=settings.agent_ready_timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            if ready_future.done():
+                return {"status": "ready", "elapsed_time_ms": int((time.time() - start_time) * 1000)}
+            
+            if exit_task.done():
+                # Laisser la lecture des sorties se terminer pour récupérer la cause de l'arrêt
+                log_buffer = self.agent_logs.get(log_name)
+                stderr = ""
+                if log_buffer:
+                    await log_buffer.drain()
+                    stderr = log_buffer.tail_text(stream="stderr")
+                return {"status": "error", "error": f"Agent process failed to start: {stderr}"}
+            
+            return {"status": "error", "error": f"Agent process not ready after {settings.agent_ready_timeout}s"}
+        finally:
+            exit_task.cancel()
+            agent_readiness.discard(token)
+    
+    def get_agent_logs(self, agent_id: str, lines: int = 100, stream: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retourne les dernières lignes de sortie des processus qui servent un agent
+        """
+        worker_id = f"agent-{agent_id}"
+        agent_info = self.running_agents.get(worker_id)
+        if agent_info is None:
+            return None
+        
+        if agent_info.get("mode") == "shared":
+            log_names = list(self.shared_workers)
+        else:
+            log_names = [agent_info.get("worker_name", worker_id)]
+        
+        return {
+            "agent_id": agent_id,
+            "processes": {
+                log_name: self.agent_logs[log_name].tail(lines, stream)
+                for log_name in log_names if log_name in self.agent_logs
+            }
+        }
+    
+    async def ensure_shared_workers(self) -> Dict[str, Any]:
+        """
+        Démarre les workers partagés manquants (un nombre fixe de processus pour tous les agents)
+        """
+        agent_script_path = self._get_agent_script_path()
+        if not os.path.exists(agent_script_path):
+            logger.error(f"Script d'agent introuvable: {agent_script_path}")
+            return {
+                "status": "error",
+                "error": f"Agent script not found: {agent_script_path}"
+            }
+        
+        try:
+            # Un seul worker de l'API lance les workers partagés manquants
+            async with state_store.lock("shared-workers", ttl=settings.agent_ready_timeout + 30):
+                return await self._ensure_shared_workers()
+        except asyncio.TimeoutError:
+            return {"status": "error", "error": "Timed out waiting for shared workers to start"}
+    
+    async def _ensure_shared_workers(self) -> Dict[str, Any]:
+        worker_name = settings.shared_worker_name
+        started = {}
+        remote = await self._remote_shared_workers()
+        
+        for key in self._shared_worker_keys():
+            # Un worker en cours de redémarrage est laissé au superviseur
+            if key in remote or self._process_status(key, self.shared_workers.get(key)) in (STATE_RUNNING, STATE_RESTARTING):
+                continue
+            
+            # Un worker dont le propriétaire a disparu est repris ici
+            record = await state_store.get_agent(f"shared:{key}")
+            if record:
+                self._terminate_orphan(record)
+            
+            args = ["--agent-name", worker_name, "--multi-tenant"]
+            env = {
+                "AGENT_NAME": worker_name,
+                "AGENT_MULTI_TENANT": "1",
+                "AGENT_CONFIG_DIR": settings.agent_config_dir
+            }
+            process, ready_token = await self._spawn_agent_process(key, args, env)
+            self.shared_workers[key] = process
+            started[key] = (process, ready_token, args, env)
+        
+        if started:
+            # Attendre que les nouveaux workers soient réellement prêts
+            results = await asyncio.gather(*(
+                self._wait_until_ready(process, ready_token, key) for key, (process, ready_token, _, _) in started.items()
+            ))
+            for (key, (process, _, args, env)), result in zip(started.items(), results):
+                if result.get("status") == "error":
+                    logger.error(f"Le worker partagé {key} n'a pas démarré: {result.get('error')}")
+                    if process.returncode is None:
+                        process.kill()
+                    self.shared_workers.pop(key, None)
+                else:
+                    self._supervise_process(key, process, args, env)
+                    await state_store.put_agent(f"shared:{key}", {"mode": "shared", "owner_pid": os.getpid(), "pid": process.pid})
+            logger.info(f"Workers partagés démarrés: {list(started)}")
+        
+        alive = self._alive_shared_workers() + remote
+        if not alive:
+            return {"status": "error", "error": "No shared agent worker is running"}
+        
+        return {"status": "running", "worker_id": worker_name, "workers": alive}
+    
+    async def _deploy_shared_agent(self, agent_id: str, name: str, prompt_template: str) -> Dict[str, Any]:
+        """
+        Enregistre un agent auprès des workers partagés au lieu de lancer un processus dédié
+        """
+        worker_id = f"agent-{agent_id}"
+        
+        try:
+            self._write_agent_config(agent_id, {
+                "agent_id": agent_id,
+                "name": name,
+                "prompt_template": prompt_template,
+                "updated_at": time.time()
+            })
+        except OSError as e:
+            logger.error(f"Impossible d'écrire la configuration de l'agent {agent_id}: {e}")
+            return {"status": "error", "error": str(e)}
+        
+        workers_result = await self.ensure_shared_workers()
+        if workers_result.get("status") == "error":
+            return workers_result
+        
+        self.running_agents[worker_id] = {
+            "agent_id": agent_id,
+            "name": name,
+            "status": "running",
+            "mode": "shared",
+            "deployed_at": time.time()
+        }
+        await self._publish_agent(worker_id)
+        
+        logger.info(f"Agent enregistré sur les workers partagés: id={agent_id}, worker={settings.shared_worker_name}")
+        
+        return {
+            "agent_id": agent_id,
+            "worker_id": settings.shared_worker_name,
+            "status": "deployed"
+        }
     
     async def deploy_agent(self, agent_id: str, name: str, prompt_template: str) -> Dict[str, Any]:
         """
-        Déploie un agent vocal dans un processus séparé
+        Déploie un agent vocal dans un processus séparé.
+        Les déploiements simultanés d'un même agent partagent un seul lancement.
         """
+        if not valid_agent_id(agent_id):
+            logger.error(f"Identifiant d'agent invalide: {agent_id!r}")
+            return {
+                "status": "error",
+                "error": "agent_id may only contain letters, digits, '_' and '-'",
+                "error_code": "invalid_agent_id"
+            }
+        
+        if self._deploy_flights.in_flight(agent_id):
+            logger.info(f"Déploiement de l'agent {agent_id} déjà en cours, attente de son résultat")
+        result = await self._deploy_flights.do(agent_id, lambda: self._deploy_agent(agent_id, name, prompt_template))
+        return dict(result)
+    
+    async def _deploy_agent(self, agent_id: str, name: str, prompt_template: str) -> Dict[str, Any]:
+        if self.shared_mode:
+            return await self._deploy_shared_agent(agent_id, name, prompt_template)
+        
+        try:
+            # Verrou partagé: deux workers de l'API ne lancent jamais le même agent
+            async with state_store.lock(f"agent:{agent_id}", ttl=settings.agent_ready_timeout + 30):
+                return await self._deploy_dedicated_agent(agent_id, name, prompt_template)
+        except asyncio.TimeoutError:
+            logger.error(f"Déploiement de l'agent {agent_id} déjà en cours ailleurs, délai dépassé")
+            return {
+                "status": "error",
+                "error": f"Timed out waiting for another deployment of agent {agent_id}"
+            }
+    
+    async def _deploy_dedicated_agent(self, agent_id: str, name: str, prompt_template: str) -> Dict[str, Any]:
         worker_id = f"agent-{agent_id}"
         
-        # Vérifier si l'agent est déjà en cours d'exécution
-        if worker_id in self.running_agents and self.running_agents[worker_id].get("status") == "running":
+        # Vérifier si l'agent est déjà en cours d'exécution (ou redémarré par le superviseur)
+        agent_info = self.running_agents.get(worker_id)
+        if agent_info and await self._agent_status(worker_id, agent_info) in (STATE_RUNNING, STATE_RESTARTING):
             logger.info(f"L'agent {worker_id} est déjà en cours d'exécution")
             return {
                 "agent_id": agent_id,
@@ -33,13 +518,30 @@ class AgentService:
                 "status": "already_running"
             }
         
+        # L'agent peut avoir été déployé par un autre worker de l'API
+        record = await state_store.get_agent(worker_id)
+        if record and record.get("owner_pid") != os.getpid():
+            if self._record_status(record) in (STATE_RUNNING, STATE_RESTARTING):
+                logger.info(f"L'agent {worker_id} est déjà en cours d'exécution (worker API pid={record.get('owner_pid')})")
+                return {
+                    "agent_id": agent_id,
+                    "worker_id": record.get("worker_name", worker_id),
+                    "status": "already_running"
+                }
+            self._terminate_orphan(record)
+        
         logger.info(f"Déploiement de l'agent: id={agent_id}, name={name}")
         
+        # Affecter un processus préchauffé si le pool en a un de disponible
+        standby = await self._acquire_standby_agent()
+        if standby:
+            result = self._assign_standby_agent(standby, agent_id, name, prompt_template)
+            if result.get("status") != "error":
+                await self._publish_agent(worker_id)
+            return result
+        
         # Chemin vers le script d'agent
-        agent_script_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
-            "agents", "voice_agent.py"
-        )
+        agent_script_path = self._get_agent_script_path()
         
         # Vérifier que le script existe
         if not os.path.exists(agent_script_path):
@@ -50,39 +552,34 @@ class AgentService:
             }
         
         # Configuration de l'agent
-        env = os.environ.copy()
-        env["AGENT_NAME"] = worker_id
-        env["AGENT_IDENTITY"] = f"agent-id-{agent_id}"
+        env = {
+            "AGENT_NAME": worker_id,
+            "AGENT_IDENTITY": f"agent-id-{agent_id}"
+        }
         
         if prompt_template:
             env["AGENT_PROMPT_TEMPLATE"] = prompt_template
         
+        args = ["--agent-id", agent_id, "--agent-name", worker_id]
+        
         try:
             # Démarrer le processus d'agent
-            cmd = [sys.executable, agent_script_path, "--agent-id", agent_id, "--agent-name", worker_id]
-            
-            process = subprocess.Popen(
-                cmd,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            process, ready_token = await self._spawn_agent_process(worker_id, args, env)
             
             # Enregistrer le processus
             self.agent_processes[worker_id] = process
             
-            # Attendre un peu pour que l'agent démarre
-            await asyncio.sleep(2)
+            # Attendre que l'agent signale être prêt (préchauffé et enregistré auprès de LiveKit)
+            ready_result = await self._wait_until_ready(process, ready_token, worker_id)
+            if ready_result.get("status") == "error":
+                logger.error(f"L'agent {worker_id} n'a pas démarré: {ready_result.get('error')}")
+                if process.returncode is None:
+                    process.kill()
+                self.agent_processes.pop(worker_id, None)
+                return ready_result
             
-            # Vérifier si le processus est toujours en cours d'exécution
-            if process.poll() is not None:
-                stderr = process.stderr.read()
-                logger.error(f"L'agent {worker_id} s'est arrêté prématurément: {stderr}")
-                return {
-                    "status": "error",
-                    "error": f"Agent process failed to start: {stderr}"
-                }
+            # Relancer automatiquement le processus s'il s'arrête
+            self._supervise_process(worker_id, process, args, env, worker_id=worker_id)
             
             # Enregistrer l'agent comme en cours d'exécution
             self.running_agents[worker_id] = {
@@ -91,8 +588,9 @@ class AgentService:
                 "status": "running",
                 "deployed_at": time.time()
             }
+            await self._publish_agent(worker_id)
             
-            logger.info(f"Agent déployé avec succès: id={agent_id}, worker_id={worker_id}")
+            logger.info(f"Agent déployé avec succès: id={agent_id}, worker_id={worker_id}, prêt en {ready_result['elapsed_time_ms']}ms")
             
             return {
                 "agent_id": agent_id,
@@ -106,37 +604,233 @@ class AgentService:
                 "error": str(e)
             }
     
-    async def get_agent_status(self, agent_id: str) -> Dict[str, Any]:
+    def _assign_standby_agent(self, standby: Dict[str, Any], agent_id: str, name: str, prompt_template: str) -> Dict[str, Any]:
         """
-        Récupère le statut d'un agent
+        Affecte un processus préchauffé à un agent: sa configuration est lue depuis le dispatch
         """
         worker_id = f"agent-{agent_id}"
         
-        if worker_id in self.running_agents:
-            agent_info = self.running_agents[worker_id]
+        try:
+            self._write_agent_config(agent_id, {
+                "agent_id": agent_id,
+                "name": name,
+                "prompt_template": prompt_template,
+                "updated_at": time.time()
+            })
+        except OSError as e:
+            logger.error(f"Impossible d'écrire la configuration de l'agent {agent_id}: {e}")
+            standby["process"].kill()
+            return {"status": "error", "error": str(e)}
+        
+        self.agent_processes[worker_id] = standby["process"]
+        self._supervise_process(standby["worker_name"], standby["process"], standby["args"], standby["env"], worker_id=worker_id)
+        self.running_agents[worker_id] = {
+            "agent_id": agent_id,
+            "name": name,
+            "status": "running",
+            "worker_name": standby["worker_name"],
+            "deployed_at": time.time()
+        }
+        
+        logger.info(f"Processus préchauffé {standby['worker_name']} affecté à l'agent {agent_id}")
+        
+        return {
+            "agent_id": agent_id,
+            "worker_id": standby["worker_name"],
+            "status": "deployed"
+        }
+    
+    async def _acquire_standby_agent(self) -> Optional[Dict[str, Any]]:
+        standby = None
+        while self.standby_agents:
+            candidate = self.standby_agents.popleft()
+            if candidate["process"].returncode is None:
+                standby = candidate
+                break
+            logger.warning(f"Processus préchauffé {candidate['worker_name']} arrêté, ignoré")
+            await self._discard_logs(candidate["worker_name"])
+        
+        if self._agent_pool_refill:
+            self._agent_pool_refill.set()
+        return standby
+    
+    async def start_agent_pool(self) -> None:
+        """
+        Démarre le maintien en arrière-plan du pool de processus préchauffés
+        """
+        if settings.agent_pool_size <= 0 or self.shared_mode:
+            return
+        if self._agent_pool_task and not self._agent_pool_task.done():
+            return
+        
+        self._agent_pool_refill = asyncio.Event()
+        self._agent_pool_task = asyncio.create_task(self._run_agent_pool())
+        logger.info(f"Pool d'agents préchauffés démarré: taille={settings.agent_pool_size}")
+    
+    async def stop_agent_pool(self) -> None:
+        """
+        Arrête le pool et les processus préchauffés non affectés
+        """
+        if self._agent_pool_task:
+            self._agent_pool_task.cancel()
+            try:
+                await self._agent_pool_task
+            except asyncio.CancelledError:
+                pass
+            self._agent_pool_task = None
+        
+        while self.standby_agents:
+            standby = self.standby_agents.popleft()
+            if standby["process"].returncode is None:
+                standby["process"].terminate()
+        
+        await agent_forkserver.stop()
+        await agent_readiness.stop()
+    
+    def count_agent_processes(self) -> Dict[str, int]:
+        """
+        Nombre de processus d'agents vivants, par type
+        """
+        return {
+            "dedicated": sum(1 for process in self.agent_processes.values() if process.returncode is None),
+            "shared": len(self._alive_shared_workers()),
+            "standby": sum(1 for standby in self.standby_agents if standby["process"].returncode is None),
+        }
+    
+    def _local_processes(self) -> List[Dict[str, Any]]:
+        """
+        Processus d'agents vivants lancés par ce worker de l'API
+        """
+        entries = []
+        for worker_id, process in self.agent_processes.items():
+            entries.append((self.running_agents.get(worker_id, {}).get("worker_name", worker_id), "dedicated", process))
+        for key, process in self.shared_workers.items():
+            entries.append((key, "shared", process))
+        for standby in self.standby_agents:
+            entries.append((standby["worker_name"], "standby", standby["process"]))
+        return [{"name": name, "kind": kind, "pid": process.pid}
+                for name, kind, process in entries if process.returncode is None]
+    
+    async def get_memory_stats(self) -> Dict[str, Any]:
+        """
+        RSS et PSS de chaque processus d'agent (et du lanceur). La RSS compte en entier
+        les pages partagées avec le lanceur dans chaque processus, la PSS les répartit:
+        l'écart entre les deux totaux est la mémoire économisée par le partage.
+        """
+        processes = self._local_processes()
+        forkserver_pid = agent_forkserver.pid
+        # Lecture de /proc/<pid>/smaps: hors de la boucle d'événements
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _memory_report, processes, forkserver_pid
+        )
+    
+    def get_agent_pool_stats(self) -> Dict[str, Any]:
+        return {
+            "size": settings.agent_pool_size,
+            "available": len(self.standby_agents),
+            "pending": self._standby_pending,
+        }
+    
+    async def _run_agent_pool(self) -> None:
+        while True:
+            self._agent_pool_refill.clear()
             
-            # Vérifier si le processus est toujours en cours d'exécution
-            process = self.agent_processes.get(worker_id)
-            if process and process.poll() is not None:
-                # Le processus s'est arrêté
-                self.running_agents[worker_id]["status"] = "stopped"
+            missing = settings.agent_pool_size - len(self.standby_agents) - self._standby_pending
+            if missing > 0:
+                self._standby_pending += missing
+                try:
+                    results = await asyncio.gather(*(self._start_standby_agent() for _ in range(missing)))
+                finally:
+                    self._standby_pending -= missing
+                
+                if any(results):
+                    continue
+                # Éviter de relancer en boucle des processus qui échouent
+                await asyncio.sleep(settings.agent_ready_timeout)
+                continue
             
+            await self._agent_pool_refill.wait()
+    
+    async def _start_standby_agent(self) -> bool:
+        worker_name = f"agent-pool-{uuid.uuid4().hex[:8]}"
+        args = ["--agent-name", worker_name, "--multi-tenant"]
+        env = {
+            "AGENT_NAME": worker_name,
+            "AGENT_MULTI_TENANT": "1",
+            "AGENT_CONFIG_DIR": settings.agent_config_dir
+        }
+        try:
+            process, ready_token = await self._spawn_agent_process(worker_name, args, env)
+        except Exception as e:
+            logger.error(f"Impossible de lancer un processus préchauffé: {e}")
+            return False
+        
+        result = await self._wait_until_ready(process, ready_token, worker_name)
+        if result.get("status") == "error":
+            logger.error(f"Processus préchauffé {worker_name} non prêt: {result.get('error')}")
+            if process.returncode is None:
+                process.kill()
+            await self._discard_logs(worker_name)
+            return False
+        
+        self.standby_agents.append({
+            "worker_name": worker_name,
+            "process": process,
+            "args": args,
+            "env": env,
+            "ready_at": time.time()
+        })
+        logger.info(f"Processus préchauffé prêt: {worker_name} en {result['elapsed_time_ms']}ms")
+        return True
+    
+    async def get_agent_status(self, agent_id: str) -> Dict[str, Any]:
+        """
+        Récupère le statut d'un agent. Un agent redémarré par le superviseur est signalé
+        "restarting" sans attendre la fin du redémarrage; un agent lancé par un autre
+        worker de l'API est lu dans l'état partagé.
+        """
+        worker_id = f"agent-{agent_id}"
+        agent_info = self.running_agents.get(worker_id)
+        
+        if agent_info is None:
+            record = await state_store.get_agent(worker_id)
+            if record:
+                return {
+                    "agent_id": agent_id,
+                    "worker_id": settings.shared_worker_name if record.get("mode") == "shared" else record.get("worker_name", worker_id),
+                    "status": self._record_status(record),
+                    "deployed_at": record.get("deployed_at")
+                }
             return {
                 "agent_id": agent_id,
                 "worker_id": worker_id,
-                "status": self.running_agents[worker_id].get("status", "unknown"),
-                "deployed_at": self.running_agents[worker_id].get("deployed_at")
+                "status": "not_found"
             }
-        else:
+        
+        agent_info["status"] = await self._agent_status(worker_id, agent_info)
+        
+        if agent_info.get("mode") == "shared":
             return {
                 "agent_id": agent_id,
-                "worker_id": worker_id,
-                "status": "not_found"
+                "worker_id": settings.shared_worker_name,
+                "status": agent_info["status"],
+                "deployed_at": agent_info.get("deployed_at")
             }
+        
+        process_name = agent_info.get("worker_name", worker_id)
+        supervision = agent_supervisor.get_entry(process_name) or {}
+        return {
+            "agent_id": agent_id,
+            "worker_id": process_name,
+            "status": agent_info["status"],
+            "deployed_at": agent_info.get("deployed_at"),
+            "restarts": supervision.get("restarts", 0),
+            "next_restart_at": supervision.get("next_restart_at")
+        }
     
     async def stop_agent(self, agent_id: str) -> Dict[str, Any]:
         """
-        Arrête un agent en cours d'exécution
+        Arrête un agent en cours d'exécution et l'oublie
         """
         worker_id = f"agent-{agent_id}"
         
@@ -146,44 +840,63 @@ class AgentService:
                 "status": "not_found"
             }
         
-        process = self.agent_processes.get(worker_id)
-        if process:
+        if self.running_agents[worker_id].get("mode") == "shared":
+            # Les workers partagés continuent de servir les autres agents
+            self._remove_agent_config(agent_id)
+            del self.running_agents[worker_id]
+            await state_store.delete_agent(worker_id)
+            logger.info(f"Agent {agent_id} retiré des workers partagés")
+            return {
+                "agent_id": agent_id,
+                "worker_id": settings.shared_worker_name,
+                "status": "stopped"
+            }
+        
+        agent_info = self.running_agents.pop(worker_id)
+        process_name = agent_info.get("worker_name", worker_id)
+        await state_store.delete_agent(worker_id)
+        
+        # Arrêter la supervision avant le processus pour qu'il ne soit pas relancé
+        agent_supervisor.forget(process_name)
+        self._launch_specs.pop(process_name, None)
+        process = self.agent_processes.pop(worker_id, None)
+        if agent_info.get("worker_name"):
+            self._remove_agent_config(agent_id)
+        
+        if process is None or process.returncode is not None:
+            await self._discard_logs(process_name)
+            return {
+                "agent_id": agent_id,
+                "worker_id": worker_id,
+                "status": "not_running"
+            }
+        
+        try:
+            # Envoyer un signal d'arrêt au processus
+            process.terminate()
+            
+            # Attendre que le processus se termine
             try:
-                # Envoyer un signal d'arrêt au processus
-                process.terminate()
-                
-                # Attendre que le processus se termine
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    # Si le processus ne se termine pas, le tuer
-                    process.kill()
-                
-                # Mettre à jour le statut
-                self.running_agents[worker_id]["status"] = "stopped"
-                
-                logger.info(f"Agent {worker_id} arrêté avec succès")
-                
-                return {
-                    "agent_id": agent_id,
-                    "worker_id": worker_id,
-                    "status": "stopped"
-                }
-            except Exception as e:
-                logger.error(f"Erreur lors de l'arrêt de l'agent {worker_id}: {e}")
-                return {
-                    "status": "error",
-                    "error": str(e)
-                }
-        else:
-            # Pas de processus, mais l'agent est enregistré
-            self.running_agents[worker_id]["status"] = "not_running"
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                # Si le processus ne se termine pas, le tuer
+                process.kill()
+            
+            logger.info(f"Agent {worker_id} arrêté avec succès")
             
             return {
                 "agent_id": agent_id,
                 "worker_id": worker_id,
-                "status": "not_running"
+                "status": "stopped"
             }
+        except Exception as e:
+            logger.error(f"Erreur lors de l'arrêt de l'agent {worker_id}: {e}")
+            return {
+                "status": "error",
+                "error": str(e)
+            }
+        finally:
+            await self._discard_logs(process_name)
     
     async def list_agents(self) -> List[Dict[str, Any]]:
         """
@@ -191,21 +904,26 @@ class AgentService:
         """
         agents = []
         
-        for worker_id, agent_info in self.running_agents.items():
-            # Mettre à jour le statut si nécessaire
-            process = self.agent_processes.get(worker_id)
-            if process and process.poll() is not None:
-                agent_info["status"] = "stopped"
-            
-            agents.append({
-                "agent_id": agent_info.get("agent_id"),
-                "worker_id": worker_id,
-                "name": agent_info.get("name"),
-                "status": agent_info.get("status"),
-                "deployed_at": agent_info.get("deployed_at")
-            })
+        for worker_id, agent_info in list(self.running_agents.items()):
+            agent_info["status"] = await self._agent_status(worker_id, agent_info)
+            agents.append(self._agent_summary(worker_id, agent_info))
+        
+        # Agents lancés par les autres workers de l'API
+        for key, record in (await state_store.list_agents()).items():
+            if key.startswith("agent-") and key not in self.running_agents and record.get("owner_pid") != os.getpid():
+                agents.append(self._agent_summary(key, {**record, "status": self._record_status(record)}))
         
         return agents
+    
+    def _agent_summary(self, worker_id: str, agent_info: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "agent_id": agent_info.get("agent_id"),
+            "worker_id": settings.shared_worker_name if agent_info.get("mode") == "shared" else agent_info.get("worker_name", worker_id),
+            "name": agent_info.get("name"),
+            "status": agent_info.get("status"),
+            "deployed_at": agent_info.get("deployed_at")
+        }
 
 # Instancier le service
 agent_service = AgentService()
+agent_processes.set_function(lambda: {(kind,): count for kind, count in agent_service.count_agent_processes().items()})
@@ -0,0 +1,142 @@
+import time
+import random
+import logging
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# États d'un processus supervisé
+STATE_RUNNING = "running"
+STATE_RESTARTING = "restarting"
+STATE_FAILED = "failed"
+
+# Relance un processus (même commande, même environnement) et retourne le nouveau
+# processus une fois prêt, ou None si le redémarrage a échoué
+RestartFunction = Callable[[str], Awaitable[Optional[asyncio.subprocess.Process]]]
+
+# Appelée (et attendue) quand un processus est abandonné après ses tentatives de redémarrage
+FailedFunction = Callable[[str], Awaitable[None]]
+
+class AgentSupervisor:
+    """
+    Surveille la fin des processus d'agents sans interroger leur état: une tâche par
+    processus attend process.wait(). Un processus qui s'arrête sans avoir été arrêté
+    volontairement est relancé avec un backoff exponentiel, jusqu'à un nombre maximal
+    de tentatives consécutives.
+
+    L'état de chaque processus est un petit dictionnaire mis à jour par ces tâches:
+    le lire est une simple consultation en mémoire, qui n'attend jamais un redémarrage.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def watch(self, key: str, process: asyncio.subprocess.Process, restart: RestartFunction,
+              on_failed: Optional[FailedFunction] = None) -> None:
+        """
+        Commence la surveillance d'un processus prêt
+        """
+        self.forget(key)
+        self._entries[key] = {
+            "state": STATE_RUNNING,
+            "pid": process.pid,
+            "started_at": time.time(),
+            "restarts": 0,
+            "attempts": 0,
+            "last_exit_code": None,
+            "next_restart_at": None,
+        }
+        self._tasks[key] = asyncio.create_task(self._supervise(key, process, restart, on_failed))
+
+    def forget(self, key: str) -> None:
+        """
+        Arrête la surveillance (à appeler avant d'arrêter volontairement le processus)
+        """
+        task = self._tasks.pop(key, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        self._entries.pop(key, None)
+
+    def get_state(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        return entry["state"] if entry else None
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        return dict(entry) if entry else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for entry in self._entries.values():
+            states[entry["state"]] = states.get(entry["state"], 0) + 1
+        return {
+            "supervised": len(self._entries),
+            "states": states,
+            "restarts": sum(entry["restarts"] for entry in self._entries.values()),
+        }
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._entries.clear()
+
+    def _restart_delay(self, attempt: int) -> float:
+        delay = min(settings.agent_restart_max_delay, settings.agent_restart_base_delay * (2 ** attempt))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _supervise(self, key: str, process: asyncio.subprocess.Process, restart: RestartFunction,
+                         on_failed: Optional[FailedFunction]) -> None:
+        entry = self._entries[key]
+        while True:
+            returncode = await process.wait()
+            entry["last_exit_code"] = returncode
+
+            # Un processus resté stable assez longtemps repart avec un backoff minimal
+            if time.time() - entry["started_at"] >= settings.agent_restart_reset_after:
+                entry["attempts"] = 0
+
+            logger.warning(f"Processus d'agent {key} (pid={process.pid}) arrêté avec le code {returncode}")
+
+            new_process = None
+            while new_process is None:
+                if entry["attempts"] >= settings.agent_restart_max_attempts:
+                    entry["state"] = STATE_FAILED
+                    entry["next_restart_at"] = None
+                    logger.error(f"Processus d'agent {key} abandonné après {entry['attempts']} tentatives de redémarrage")
+                    # Oublier l'entrée: un nouveau déploiement repartira de zéro
+                    self._tasks.pop(key, None)
+                    self._entries.pop(key, None)
+                    if on_failed:
+                        await on_failed(key)
+                    return
+
+                delay = self._restart_delay(entry["attempts"])
+                entry["state"] = STATE_RESTARTING
+                entry["next_restart_at"] = time.time() + delay
+                logger.info(f"Redémarrage du processus d'agent {key} dans {delay:.1f}s (tentative {entry['attempts'] + 1})")
+                await asyncio.sleep(delay)
+
+                entry["attempts"] += 1
+                try:
+                    new_process = await restart(key)
+                except Exception as e:
+                    logger.error(f"Erreur lors du redémarrage du processus d'agent {key}: {e}")
+
+            process = new_process
+            entry.update({
+                "state": STATE_RUNNING,
+                "pid": process.pid,
+                "started_at": time.time(),
+                "restarts": entry["restarts"] + 1,
+                "next_restart_at": None,
+            })
+            logger.info(f"Processus d'agent {key} redémarré (pid={process.pid}, redémarrages={entry['restarts']})")
+
+# Instancier le superviseur
+agent_supervisor = AgentSupervisor()
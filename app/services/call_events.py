@@ -0,0 +1,160 @@
+import time
+import logging
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Any, Iterable, List, Optional, Set
+from app.core.config import settings
+from app.core.metrics import call_events_total, call_event_subscribers, call_events_dropped_total
+
+logger = logging.getLogger(__name__)
+
+# Événements que les agents peuvent signaler pendant l'appel (la mise en place
+# de l'appel publie "initiating", "dialing" et "failed")
+AGENT_EVENTS = {"answered", "agent_speaking", "hangup", "failed"}
+# Après ces événements, l'appel n'évolue plus et les flux SSE se terminent
+TERMINAL_EVENTS = {"hangup", "failed"}
+# Abonnement à tous les appels
+ALL_CALLS = "*"
+
+class CallEventSubscription:
+    """
+    Abonnement aux événements d'un ensemble d'appels (ou de tous les appels).
+
+    Le buffer est borné: si l'abonné ne consomme pas assez vite, les événements les
+    plus anciens sont abandonnés et un événement "dropped" indiquant leur nombre est
+    délivré à la place, sans jamais ralentir les émetteurs.
+    """
+
+    def __init__(self, bus: "CallEventBus", call_ids: Optional[Iterable[str]], buffer_size: int):
+        self._bus = bus
+        self.call_ids: Optional[Set[str]] = set(call_ids) if call_ids is not None else None
+        self._buffer: deque = deque()
+        self._buffer_size = buffer_size
+        self._dropped = 0
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def matches(self, call_id: str) -> bool:
+        return self.call_ids is None or call_id in self.call_ids
+
+    def add(self, call_ids: Iterable[str]) -> None:
+        call_ids = set(call_ids)
+        if ALL_CALLS in call_ids:
+            self.call_ids = None
+        elif self.call_ids is not None:
+            self.call_ids.update(call_ids)
+
+    def discard(self, call_ids: Iterable[str]) -> None:
+        call_ids = set(call_ids)
+        if ALL_CALLS in call_ids:
+            self.call_ids = set()
+        elif self.call_ids is not None:
+            self.call_ids.difference_update(call_ids)
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if len(self._buffer) >= self._buffer_size:
+            self._buffer.popleft()
+            self._dropped += 1
+            call_events_dropped_total.inc()
+        self._buffer.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Prochain événement, ou None si le délai expire ou si l'abonnement est fermé
+        """
+        if not self._buffer and not self.closed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self._dropped:
+            dropped, self._dropped = self._dropped, 0
+            return {"event": "dropped", "count": dropped, "timestamp": time.time()}
+        if not self._buffer:
+            return None
+        return self._buffer.popleft()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._ready.set()
+            self._bus._unsubscribe(self)
+
+class CallEventBus:
+    """
+    Bus d'événements d'appels du processus: la mise en place de l'appel et les agents
+    y publient, les flux SSE et WebSocket s'y abonnent. Les derniers événements de
+    chaque appel sont conservés pour les abonnés arrivés en cours d'appel.
+    """
+
+    def __init__(self):
+        self._subscriptions: Set[CallEventSubscription] = set()
+        self._history: "OrderedDict[str, deque]" = OrderedDict()
+        self._sequence = 0
+        # Fonctions appelées à chaque événement (libération des ressources d'un appel terminé)
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        call_event_subscribers.set_function(lambda: {(): len(self._subscriptions)})
+
+    def publish(self, call_id: str, event: str, data: Optional[Dict[str, Any]] = None, source: str = "api") -> Dict[str, Any]:
+        self._sequence += 1
+        message = {
+            **(data or {}),
+            "id": self._sequence,
+            "call_id": call_id,
+            "event": event,
+            "source": source,
+            "timestamp": time.time(),
+        }
+
+        history = self._history.get(call_id)
+        if history is None:
+            history = deque(maxlen=settings.call_events_history_size)
+            self._history[call_id] = history
+        history.append(message)
+        self._history.move_to_end(call_id)
+        while len(self._history) > settings.call_events_max_calls:
+            self._history.popitem(last=False)
+
+        call_events_total.inc(event=event, source=source)
+        for listener in self._listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.error(f"Erreur d'un observateur des événements d'appels: {e}")
+        for subscription in list(self._subscriptions):
+            if subscription.matches(call_id):
+                subscription.put(message)
+        return message
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        self._listeners.append(listener)
+
+    def get_history(self, call_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+        return [message for message in self._history.get(call_id, ()) if message["id"] > after_id]
+
+    def is_finished(self, call_id: str) -> bool:
+        history = self._history.get(call_id)
+        return bool(history) and history[-1]["event"] in TERMINAL_EVENTS
+
+    def subscribe(self, call_ids: Optional[Iterable[str]] = None) -> CallEventSubscription:
+        """
+        Abonnement aux appels indiqués (None pour tous les appels)
+        """
+        subscription = CallEventSubscription(self, call_ids, settings.call_events_subscriber_buffer)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: CallEventSubscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscriptions),
+            "calls": len(self._history),
+            "last_event_id": self._sequence,
+        }
+
+# Instancier le bus d'événements
+call_events = CallEventBus()
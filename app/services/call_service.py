@@ -0,0 +1,467 @@
+import logging
+import time
+import uuid
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+from app.core.metrics import track_stage, calls_in_flight, call_setup_seconds, calls_deduplicated_total
+from app.core.single_flight import SingleFlight
+from app.services.livekit_service import livekit_service
+from app.services.sip_service import sip_service, TrunkRegistryUnavailable
+from app.services.agent_service import agent_service
+from app.services.state_store import state_store
+from app.services.call_events import call_events
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_CALL_FIELDS = ["agent_id", "phone_number", "call_id"]
+
+class CallSetupError(Exception):
+    """
+    Échec d'une étape de mise en place d'appel (interrompt les étapes parallèles)
+    """
+
+    def __init__(self, step: str, message: str, error_code: Optional[str] = None):
+        super().__init__(message)
+        self.step = step
+        self.error_code = error_code
+
+class CallService:
+    """
+    Service pour orchestrer la mise en place des appels sortants
+    """
+
+    def __init__(self):
+        self.batch_jobs = OrderedDict()
+        # Mises en place en cours et résultats récents, par call_id
+        self._call_flights = SingleFlight()
+        self._call_results = OrderedDict()
+        logger.info("Service d'appels initialisé")
+
+    def get_missing_fields(self, call_data: Dict[str, Any]) -> List[str]:
+        """
+        Retourne la liste des champs obligatoires absents d'une demande d'appel
+        """
+        missing_fields = [field for field in REQUIRED_CALL_FIELDS if not call_data.get(field)]
+        # Le trunk peut être désigné par le numéro appelant (from_number) ou configuré par défaut
+        if not (call_data.get("trunk_id") or call_data.get("from_number")
+                or settings.twilio_sip_trunk_id or settings.twilio_phone_number):
+            missing_fields.append("trunk_id")
+        return missing_fields
+
+    async def initiate_call(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Met en place un appel sortant: agent, salle, dispatch puis numérotation.
+        Les données doivent avoir été validées au préalable.
+
+        Idempotent par call_id: les demandes simultanées partagent la même mise en place
+        et une nouvelle tentative reçoit le résultat déjà obtenu, sans nouvel appel à LiveKit.
+        """
+        call_id = str(call_data.get("call_id"))
+
+        cached = self._get_cached_result(call_id)
+        if cached is not None:
+            logger.info(f"Appel {call_id} déjà mis en place, résultat précédent renvoyé")
+            calls_deduplicated_total.inc(reason="cached")
+            return cached
+
+        if self._call_flights.in_flight(call_id):
+            logger.info(f"Mise en place de l'appel {call_id} déjà en cours, attente de son résultat")
+            calls_deduplicated_total.inc(reason="in_flight")
+
+        result = await self._call_flights.do(call_id, lambda: self._initiate_call_once(call_data))
+        return dict(result)
+
+    async def _initiate_call_once(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+        call_id = str(call_data.get("call_id"))
+        in_progress = {"status": "error", "error": "Call setup already in progress",
+                       "error_code": "call_in_progress", "call_id": call_id}
+        try:
+            # Verrou partagé: la même demande reçue par un autre worker de l'API attend ici,
+            # jusqu'au pire cas d'une mise en place
+            async with state_store.lock(f"call:{call_id}", ttl=settings.call_setup_lock_ttl,
+                                        timeout=settings.call_setup_wait_timeout):
+                record = await state_store.get_call(call_id)
+                if self._is_reusable(record):
+                    logger.info(f"Appel {call_id} mis en place par un autre worker, résultat partagé")
+                    calls_deduplicated_total.inc(reason="shared")
+                    result = record["result"]
+                elif self._is_in_progress(record):
+                    # Le worker qui a commencé la mise en place a perdu le verrou (arrêt, perte
+                    # du bail): l'appel a peut-être déjà été composé, ne pas le relancer
+                    logger.warning(f"Mise en place de l'appel {call_id} commencée par un autre worker et non terminée")
+                    return in_progress
+                else:
+                    result = await self._run_call_setup(call_data)
+        except asyncio.TimeoutError:
+            return in_progress
+
+        # Les échecs ne sont pas conservés: une nouvelle tentative relance la mise en place
+        if result.get("status") != "error":
+            self._cache_result(call_id, result)
+        return result
+
+    def _is_reusable(self, record: Optional[Dict[str, Any]]) -> bool:
+        return bool(
+            record
+            and record.get("result")
+            and record.get("status") != "error"
+            and time.time() - record.get("finished_at", 0) < settings.call_result_ttl
+        )
+
+    def _is_in_progress(self, record: Optional[Dict[str, Any]]) -> bool:
+        """
+        Mise en place commencée et non terminée, depuis moins que son pire cas
+        (au-delà, le worker qui la menait s'est arrêté et l'appel peut être relancé)
+        """
+        return bool(
+            record
+            and "finished_at" not in record
+            and time.time() - record.get("started_at", 0) < settings.call_setup_wait_timeout
+        )
+
+    def _get_cached_result(self, call_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._call_results.get(call_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            del self._call_results[call_id]
+            return None
+        return dict(entry["result"])
+
+    def _cache_result(self, call_id: str, result: Dict[str, Any]) -> None:
+        self._call_results[call_id] = {"result": dict(result), "expires_at": time.time() + settings.call_result_ttl}
+        self._call_results.move_to_end(call_id)
+        while len(self._call_results) > settings.call_result_cache_size:
+            self._call_results.popitem(last=False)
+
+    async def _run_call_setup(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+        start_time = time.perf_counter()
+        # Même clé que initiate_call et GET /calls/{call_id}, quel que soit le type reçu de Xano
+        call_id = str(call_data.get("call_id"))
+        record = {
+            "call_id": call_id,
+            "agent_id": call_data.get("agent_id"),
+            "phone_number": call_data.get("phone_number"),
+            "status": "initiating",
+            "started_at": time.time()
+        }
+        await state_store.put_call(call_id, record)
+        call_events.publish(call_id, "initiating", {"agent_id": record["agent_id"], "phone_number": record["phone_number"]})
+
+        calls_in_flight.inc()
+        result = {"status": "error", "error": "Call setup interrupted", "call_id": call_id}
+        try:
+            result = await self._setup_call(call_data)
+            return result
+        finally:
+            calls_in_flight.dec()
+            call_setup_seconds.observe(
+                time.perf_counter() - start_time,
+                outcome="error" if result.get("status") == "error" else "success"
+            )
+            await state_store.put_call(call_id, {**record, "result": result, "status": result.get("status"), "finished_at": time.time()})
+            if result.get("status") == "error":
+                call_events.publish(call_id, "failed", {"error": result.get("error"), "error_code": result.get("error_code")})
+            else:
+                call_events.publish(call_id, result.get("status"), {
+                    "room_name": result.get("room_name"),
+                    "participant_id": result.get("participant_id")
+                })
+
+    async def get_call(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Enregistrement d'un appel (partagé entre les workers de l'API)
+        """
+        return await state_store.get_call(call_id)
+
+    async def _setup_call(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Étapes de mise en place, les étapes indépendantes étant exécutées en parallèle:
+            déploiement de l'agent (si nécessaire) || salle
+            puis dispatch de l'agent || numérotation
+        Au premier échec, les étapes en cours sont annulées et la salle de l'appel supprimée.
+        """
+        agent_id = call_data.get("agent_id")
+        phone_number = call_data.get("phone_number")
+        call_id = call_data.get("call_id")
+
+        # Le metadata indique à l'agent qui appeler; l'agent_id permet aux workers
+        # partagés de retrouver la configuration de l'agent
+        metadata = json.dumps({"phone_number": phone_number, "call_id": call_id, "agent_id": str(agent_id)})
+
+        # Trunk désigné par son identifiant, le numéro appelant ou la configuration par défaut
+        try:
+            with track_stage("trunk_resolve"):
+                trunk_id = await sip_service.resolve_trunk_id(call_data.get("trunk_id"), call_data.get("from_number"))
+        except TrunkRegistryUnavailable as e:
+            logger.error(f"Trunk SIP de l'appel {call_id} introuvable: {str(e)}")
+            return {"status": "error", "error": str(e), "error_code": e.error_code, "call_id": call_id}
+        if not trunk_id:
+            from_number = call_data.get("from_number") or settings.twilio_phone_number
+            logger.error(f"Aucun trunk SIP pour le numéro {from_number} (appel {call_id})")
+            return {"status": "error", "error": f"No SIP trunk found for number {from_number}",
+                    "error_code": "trunk_not_found", "call_id": call_id}
+        call_data = {**call_data, "trunk_id": trunk_id}
+
+        with track_stage("agent_status"):
+            agent_status = await agent_service.get_agent_status(agent_id)
+        worker_id = agent_status.get("worker_id") or f"agent-{agent_id}"
+
+        needs_deploy = agent_status.get("status") not in ("running", "restarting")
+        if agent_status.get("status") == "restarting":
+            # Le superviseur relance le processus: le dispatch sera servi dès qu'il sera enregistré
+            logger.info(f"L'agent {agent_id} est en cours de redémarrage, pas de redéploiement")
+        elif needs_deploy:
+            logger.warning(f"L'agent {agent_id} n'est pas en cours d'exécution, tentative de déploiement")
+
+        # Prendre une salle pré-créée dans le pool, sinon créer une salle pour l'appel
+        pooled_room = livekit_service.acquire_pooled_room()
+        room_name = pooled_room["room_name"] if pooled_room else f"call-{call_id}"
+        # Salle à supprimer en cas d'échec: salle du pool ou créée (même partiellement) pour cet appel
+        owns_room = bool(pooled_room)
+        agent_dispatched = False
+
+        try:
+            steps = {}
+            if needs_deploy:
+                steps["agent"] = self._deploy_call_agent(agent_id, call_data)
+            if not pooled_room:
+                # Si l'agent est déjà connu, LiveKit le dispatche à la création de la salle
+                dispatch_agent = worker_id if settings.room_dispatch_on_create and not needs_deploy else None
+                steps["room"] = self._create_call_room(room_name, dispatch_agent, metadata)
+                owns_room = True
+            results = await self._run_steps(steps)
+
+            if "room" in results:
+                owns_room = results["room"].get("status") == "created"
+                agent_dispatched = results["room"].get("agent_dispatched", False)
+            if "agent" in results:
+                worker_id = results["agent"].get("worker_id") or worker_id
+
+            # Le dispatch ne conditionne pas la numérotation: l'agent rejoint la salle pendant la sonnerie
+            steps = {"dial": self._dial(call_data, room_name)}
+            if not agent_dispatched:
+                logger.info(f"Dispatching de l'agent {worker_id} dans la salle {room_name}")
+                steps["dispatch"] = self._dispatch_agent(worker_id, room_name, metadata)
+            results = await self._run_steps(steps)
+        except CallSetupError as e:
+            logger.error(f"Échec de la mise en place de l'appel {call_id} ({e.step}): {e}")
+            if owns_room:
+                await self._rollback_room(room_name)
+            result = {"status": "error", "error": str(e), "call_id": call_id}
+            if e.error_code:
+                result["error_code"] = e.error_code
+            return result
+        except asyncio.CancelledError:
+            if owns_room:
+                await self._rollback_room(room_name)
+            raise
+
+        call_result = results["dial"]
+        logger.info(f"Appel initié: participant_id={call_result.get('participant_id')}")
+
+        return {
+            "call_id": call_id,
+            "participant_id": call_result.get("participant_id"),
+            "room_name": room_name,
+            "status": call_result.get("status"),
+            "agent_id": agent_id
+        }
+
+    async def _run_steps(self, steps: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Exécute des étapes indépendantes en parallèle. Au premier échec, les autres
+        sont annulées et l'erreur est propagée.
+        """
+        if not steps:
+            return {}
+        tasks = {asyncio.ensure_future(coroutine): name for name, coroutine in steps.items()}
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            errors = [task.exception() for task in done if task.exception() is not None]
+            if errors:
+                raise errors[0]
+            return {name: task.result() for task, name in tasks.items()}
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _deploy_call_agent(self, agent_id: str, call_data: Dict[str, Any]) -> Dict[str, Any]:
+        with track_stage("agent_deploy"):
+            deploy_result = await agent_service.deploy_agent(
+                agent_id=str(agent_id),
+                name=f"agent-{agent_id}",
+                prompt_template=call_data.get("prompt_template", "")
+            )
+            if deploy_result.get("status") == "error":
+                raise CallSetupError("agent_deploy", f"Failed to deploy agent: {deploy_result.get('error')}")
+        return deploy_result
+
+    async def _create_call_room(self, room_name: str, agent_name: Optional[str], metadata: str) -> Dict[str, Any]:
+        logger.info(f"Création de la salle pour l'appel: {room_name}")
+        with track_stage("room_create"):
+            room_result = await livekit_service.create_room(room_name, agent_name=agent_name, agent_metadata=metadata)
+            if room_result.get("status") not in ["created", "existing"]:
+                raise CallSetupError("room_create", "Failed to create room")
+        return room_result
+
+    async def _dispatch_agent(self, worker_id: str, room_name: str, metadata: str) -> Dict[str, Any]:
+        with track_stage("dispatch"):
+            dispatch_result = await livekit_service.create_agent_dispatch(worker_id, room_name, metadata)
+            if dispatch_result.get("status") != "dispatched":
+                raise CallSetupError("dispatch", "Failed to dispatch agent")
+        return dispatch_result
+
+    async def _dial(self, call_data: Dict[str, Any], room_name: str) -> Dict[str, Any]:
+        trunk_id = call_data.get("trunk_id")
+        call_id = call_data.get("call_id")
+        logger.info(f"Initiation de l'appel: trunk={trunk_id}, téléphone={call_data.get('phone_number')}")
+        with track_stage("dial"):
+            call_result = await sip_service.make_outbound_call(
+                trunk_id, call_data.get("phone_number"), room_name, call_id,
+                priority=call_data.get("priority", 0),
+                queue_timeout=call_data.get("queue_timeout")
+            )
+            if call_result.get("status") == "error":
+                raise CallSetupError("dial", call_result.get("error"), call_result.get("error_code"))
+        return call_result
+
+    async def _rollback_room(self, room_name: str) -> None:
+        """
+        Supprime la salle d'un appel dont la mise en place a échoué (raccroche aussi
+        le participant SIP et retire l'agent s'ils l'avaient déjà rejointe)
+        """
+        logger.info(f"Annulation de la mise en place: suppression de la salle {room_name}")
+        with track_stage("rollback"):
+            await livekit_service.delete_room(room_name)
+
+    async def start_batch(self, calls: List[Dict[str, Any]], concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Démarre un lot d'appels en arrière-plan avec une concurrence bornée
+        """
+        concurrency = max(1, min(concurrency or settings.batch_call_concurrency, settings.batch_call_max_concurrency))
+        job_id = f"batch-{uuid.uuid4().hex[:12]}"
+
+        job = {
+            "job_id": job_id,
+            "status": "running",
+            "total": len(calls),
+            "completed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "concurrency": concurrency,
+            "created_at": time.time(),
+            "finished_at": None,
+            "results": [],
+            "queue": asyncio.Queue(),
+        }
+        self.batch_jobs[job_id] = job
+        self._prune_batch_jobs()
+
+        logger.info(f"Lot d'appels démarré: job_id={job_id}, appels={len(calls)}, concurrence={concurrency}")
+        job["task"] = asyncio.create_task(self._run_batch(job, calls, concurrency))
+
+        return self._job_summary(job)
+
+    async def _run_batch(self, job: Dict[str, Any], calls: List[Dict[str, Any]], concurrency: int) -> None:
+        """
+        Exécute chaque appel du lot en limitant le nombre d'appels simultanés
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(index: int, call_data: Dict[str, Any]) -> None:
+            async with semaphore:
+                start_time = time.time()
+                missing_fields = self.get_missing_fields(call_data)
+                if missing_fields:
+                    result = {
+                        "status": "error",
+                        "error": f"Missing required fields: {', '.join(missing_fields)}",
+                        "call_id": call_data.get("call_id")
+                    }
+                else:
+                    try:
+                        # Les appels unitaires passent avant les appels de campagne sur un trunk saturé
+                        result = await self.initiate_call({"priority": settings.dial_batch_priority, **call_data})
+                    except Exception as e:
+                        logger.error(f"Erreur lors de l'appel {call_data.get('call_id')} du lot {job['job_id']}: {e}")
+                        result = {"status": "error", "error": str(e), "call_id": call_data.get("call_id")}
+
+                result["index"] = index
+                result["elapsed_time_ms"] = int((time.time() - start_time) * 1000)
+
+                job["completed"] += 1
+                if result.get("status") == "error":
+                    job["failed"] += 1
+                else:
+                    job["succeeded"] += 1
+                job["results"].append(result)
+                job["queue"].put_nowait(result)
+
+        try:
+            await asyncio.gather(*(run_one(index, call_data) for index, call_data in enumerate(calls)))
+            job["status"] = "completed"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        finally:
+            job["finished_at"] = time.time()
+            # Marqueur de fin pour les lecteurs du flux
+            job["queue"].put_nowait(None)
+            logger.info(f"Lot d'appels terminé: job_id={job['job_id']}, réussis={job['succeeded']}, échecs={job['failed']}")
+
+    async def stream_batch_results(self, job_id: str):
+        """
+        Produit les résultats du lot au fur et à mesure qu'ils arrivent
+        """
+        job = self.batch_jobs.get(job_id)
+        if not job:
+            return
+
+        while True:
+            result = await job["queue"].get()
+            if result is None:
+                break
+            yield result
+
+    def get_batch_status(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Récupère l'état d'un lot d'appels
+        """
+        job = self.batch_jobs.get(job_id)
+        if not job:
+            return None
+
+        summary = self._job_summary(job)
+        if include_results:
+            summary["results"] = sorted(job["results"], key=lambda r: r["index"])
+        return summary
+
+    def _job_summary(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            key: job[key]
+            for key in ["job_id", "status", "total", "completed", "succeeded", "failed",
+                        "concurrency", "created_at", "finished_at"]
+        }
+
+    def _prune_batch_jobs(self) -> None:
+        """
+        Oublie les lots terminés les plus anciens au-delà de la limite de rétention
+        """
+        while len(self.batch_jobs) > settings.batch_job_retention:
+            oldest_id = next(
+                (job_id for job_id, job in self.batch_jobs.items() if job["status"] != "running"),
+                None
+            )
+            if oldest_id is None:
+                break
+            del self.batch_jobs[oldest_id]
+
+# Instancier le service
+call_service = CallService()
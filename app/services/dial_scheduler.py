@@ -0,0 +1,235 @@
+import time
+import heapq
+import itertools
+import logging
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import dial_queue_depth, dial_active_calls, dial_queue_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+class DialSchedulerError(Exception):
+    """
+    Appel non numéroté par l'ordonnanceur (le trunk n'a pas pu le prendre en charge)
+    """
+    error_code = "dial_rejected"
+
+class DialQueueFull(DialSchedulerError):
+    error_code = "dial_queue_full"
+
+class DialQueueTimeout(DialSchedulerError):
+    error_code = "dial_queue_timeout"
+
+def parse_trunk_limits(value: str) -> Dict[str, Tuple[float, int]]:
+    """
+    Analyse DIAL_TRUNK_LIMITS: "trunk_id:cps:max_concurrent,..." (0 = sans limite)
+    """
+    limits = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            trunk_id, cps, max_concurrent = item.rsplit(":", 2)
+            limits[trunk_id.strip()] = (float(cps), int(max_concurrent))
+        except ValueError:
+            logger.warning(f"Limite de trunk invalide ignorée: '{item}' (format attendu trunk_id:cps:max_concurrent)")
+    return limits
+
+class TrunkLane:
+    """
+    File de numérotation d'un trunk: seau à jetons pour les appels par seconde,
+    limite d'appels simultanés et file d'attente par priorité puis échéance.
+
+    Une tâche de pompe, démarrée à la première mise en file, accorde les créneaux
+    un par un dès qu'un jeton et une place sont disponibles; elle s'arrête quand la
+    file est vide.
+    """
+
+    def __init__(self, trunk_id: str, cps: float, max_concurrent: int, burst: float):
+        self.trunk_id = trunk_id
+        self.cps = cps
+        self.max_concurrent = max_concurrent
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.active = 0
+        self.granted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self._waiters: List[Tuple[int, float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._slot_freed = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, _, future in self._waiters if not future.done())
+
+    def enqueue(self, priority: int, deadline: float) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Priorité la plus haute d'abord, puis l'échéance la plus proche, puis l'ordre d'arrivée
+        heapq.heappush(self._waiters, (-priority, deadline, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        return future
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slot_freed.set()
+
+    def penalize(self) -> None:
+        """
+        Vide le seau après un refus pour dépassement de limite côté opérateur
+        """
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.cps > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.cps)
+        else:
+            self.tokens = self.burst
+        self.updated_at = now
+
+    def _pop_waiter(self) -> Optional[asyncio.Future]:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[3]
+            if not future.done():
+                return future
+        return None
+
+    async def _pump(self) -> None:
+        while self._waiters:
+            # Attendre une place libre
+            while self.max_concurrent > 0 and self.active >= self.max_concurrent:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+
+            # Attendre un jeton
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.cps)
+                continue
+
+            future = self._pop_waiter()
+            if future is None:
+                break
+            self.tokens -= 1
+            self.active += 1
+            future.set_result(time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "trunk_id": self.trunk_id,
+            "cps": self.cps,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "average_wait_ms": int(self.total_wait / self.granted * 1000) if self.granted else 0,
+        }
+
+class DialScheduler:
+    """
+    Ordonnanceur des numérotations sortantes, une file par trunk SIP. Les appels au-delà
+    des limites du trunk attendent leur tour au lieu d'être refusés par l'opérateur.
+    Un appel numéroté occupe son créneau jusqu'à sa fin (raccroché ou échec), de sorte
+    que max_concurrent borne les appels simultanés sur le trunk.
+    """
+
+    def __init__(self):
+        self._lanes: Dict[str, TrunkLane] = {}
+        # Appels en cours occupant un créneau de leur trunk, par call_id
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._limits = parse_trunk_limits(settings.dial_trunk_limits)
+        dial_queue_depth.set_function(lambda: {(lane.trunk_id,): lane.queue_depth for lane in self._lanes.values()})
+        dial_active_calls.set_function(lambda: {(lane.trunk_id,): lane.active for lane in self._lanes.values()})
+
+    def _lane(self, trunk_id: str) -> TrunkLane:
+        lane = self._lanes.get(trunk_id)
+        if lane is None:
+            cps, max_concurrent = self._limits.get(
+                trunk_id, (settings.dial_default_cps, settings.dial_default_max_concurrent)
+            )
+            lane = TrunkLane(trunk_id, cps, max_concurrent, settings.dial_burst)
+            self._lanes[trunk_id] = lane
+        return lane
+
+    async def acquire(self, trunk_id: str, priority: int = 0, timeout: Optional[float] = None) -> float:
+        """
+        Attend un créneau de numérotation sur le trunk et retourne le temps d'attente en
+        secondes. Le créneau est ensuite rendu par release() ou confié à un appel par
+        hold_call(). Lève DialQueueFull ou DialQueueTimeout.
+        """
+        lane = self._lane(trunk_id)
+        if lane.queue_depth >= settings.dial_queue_max_size:
+            lane.rejected += 1
+            dial_queue_wait_seconds.observe(0, trunk=trunk_id, outcome="rejected")
+            raise DialQueueFull(f"Dial queue for trunk {trunk_id} is full")
+
+        timeout = settings.dial_queue_timeout if timeout is None else timeout
+        enqueued_at = time.monotonic()
+        future = lane.enqueue(priority, enqueued_at + timeout)
+        try:
+            granted_at = await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            # Créneau accordé au moment même de l'annulation: le rendre
+            if future.done() and not future.cancelled():
+                lane.release()
+            if isinstance(e, asyncio.TimeoutError):
+                lane.timed_out += 1
+                dial_queue_wait_seconds.observe(time.monotonic() - enqueued_at, trunk=trunk_id, outcome="timeout")
+                raise DialQueueTimeout(f"No dial slot available on trunk {trunk_id} within {timeout:.0f}s")
+            raise
+
+        wait_time = granted_at - enqueued_at
+        lane.granted += 1
+        lane.total_wait += wait_time
+        dial_queue_wait_seconds.observe(wait_time, trunk=trunk_id, outcome="granted")
+        if wait_time >= 1:
+            logger.info(f"Numérotation sur le trunk {trunk_id} après {wait_time:.1f}s d'attente")
+        return wait_time
+
+    def release(self, trunk_id: str) -> None:
+        self._lane(trunk_id).release()
+
+    def hold_call(self, call_id: str, trunk_id: str) -> None:
+        """
+        Le créneau reste occupé par l'appel numéroté jusqu'à sa fin (release_call), ou
+        au plus DIAL_SLOT_MAX_HOLD secondes si la fin de l'appel n'est jamais signalée
+        """
+        previous = self._calls.pop(call_id, None)
+        if previous is not None:
+            previous["timer"].cancel()
+            self.release(previous["trunk_id"])
+        timer = asyncio.get_running_loop().call_later(
+            settings.dial_slot_max_hold, self.release_call, call_id, "timeout"
+        )
+        self._calls[call_id] = {"trunk_id": trunk_id, "timer": timer}
+
+    def release_call(self, call_id: str, reason: str = "ended") -> bool:
+        held = self._calls.pop(call_id, None)
+        if held is None:
+            return False
+        held["timer"].cancel()
+        self.release(held["trunk_id"])
+        if reason == "timeout":
+            logger.warning(f"Fin de l'appel {call_id} non signalée après {settings.dial_slot_max_hold:.0f}s, créneau du trunk {held['trunk_id']} libéré")
+        return True
+
+    def penalize(self, trunk_id: str) -> None:
+        lane = self._lanes.get(trunk_id)
+        if lane:
+            lane.penalize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {trunk_id: lane.get_stats() for trunk_id, lane in self._lanes.items()}
+
+# Instancier l'ordonnanceur
+dial_scheduler = DialScheduler()
@@ -0,0 +1,57 @@
+import logging
+import aiohttp
+from typing import Optional
+from livekit import api
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class LiveKitClientManager:
+    """
+    Client LiveKit partagé par tous les services du processus.
+    La session HTTP (pool de connexions keep-alive) est créée à la première
+    utilisation, dans la boucle d'événements, et fermée à l'arrêt de l'application.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._api: Optional[api.LiveKitAPI] = None
+
+    @property
+    def api(self) -> api.LiveKitAPI:
+        if self._api is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.livekit_pool_size,
+                    keepalive_timeout=settings.livekit_keepalive_timeout
+                ),
+                timeout=aiohttp.ClientTimeout(total=settings.livekit_request_timeout)
+            )
+            self._api = api.LiveKitAPI(
+                url=settings.livekit_url,
+                api_key=settings.livekit_api_key,
+                api_secret=settings.livekit_api_secret,
+                session=self._session
+            )
+            logger.info(
+                f"Client LiveKit partagé créé: URL={settings.livekit_url}, pool={settings.livekit_pool_size}, "
+                f"keep-alive={settings.livekit_keepalive_timeout}s, timeout={settings.livekit_request_timeout}s"
+            )
+        return self._api
+
+    async def close(self) -> None:
+        """
+        Ferme le client et la session HTTP partagée
+        """
+        if self._api is not None:
+            await self._api.aclose()
+            self._api = None
+
+        if self._session is not None:
+            if not self._session.closed:
+                await self._session.close()
+            self._session = None
+            logger.info("Client LiveKit partagé fermé")
+
+# Instancier le gestionnaire
+livekit_client = LiveKitClientManager()
@@ -2,32 +2,67 @@ import logging
 import time
 from typing import Dict, Any, Optional
 import asyncio
+import uuid
+from collections import deque, OrderedDict
 from livekit import api
 from app.core.config import settings
+from app.services.livekit_client import livekit_client
 
 logger = logging.getLogger(__name__)
 
 class LiveKitService:
     def __init__(self):
-        self.livekit_api = api.LiveKitAPI(
-            url=settings.livekit_url,
-            api_key=settings.livekit_api_key, 
-            api_secret=settings.livekit_api_secret
-        )
+        # Cache LRU/TTL des salles créées ou vues par ce service
+        self.room_cache = OrderedDict()
+        self.room_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        # Pool de salles pré-créées (désactivé si room_pool_size vaut 0)
+        self.room_pool = deque()
+        self._room_pool_pending = 0
+        self._room_pool_refill: Optional[asyncio.Event] = None
+        self._room_pool_task: Optional[asyncio.Task] = None
         logger.info(f"LiveKit service initialisé avec URL: {settings.livekit_url}")
+
+    @property
+    def livekit_api(self) -> api.LiveKitAPI:
+        """
+        Client LiveKit partagé (pool de connexions commun aux services)
+        """
+        return livekit_client.api
     
-    async def create_room(self, room_name: str, empty_timeout: int = 300) -> Dict[str, Any]:
+    async def create_room(self, room_name: str, empty_timeout: int = 300,
+                          agent_name: Optional[str] = None, agent_metadata: Optional[str] = None) -> Dict[str, Any]:
         """
-        Crée une salle LiveKit ou la récupère si elle existe déjà
+        Crée une salle LiveKit ou la récupère si elle existe déjà.
+        Si agent_name est fourni, l'agent est dispatché par LiveKit à la création de la salle
+        ("agent_dispatched": True); une salle existante n'est pas modifiée.
         """
         start_time = time.time()
+        
+        # Salle déjà créée ou vue récemment par ce service: aucun appel à LiveKit
+        cached_room = self._get_cached_room(room_name)
+        if cached_room:
+            logger.debug(f"Salle trouvée dans le cache: {room_name}")
+            return {
+                "room_name": cached_room["room_name"],
+                "room_sid": cached_room["room_sid"],
+                "status": "existing",
+                "cached": True,
+                "elapsed_time_ms": int((time.time() - start_time) * 1000)
+            }
+        
         logger.info(f"Création de salle LiveKit: nom={room_name}, timeout={empty_timeout}s")
         
         try:
+            request = self._room_request(room_name, empty_timeout, agent_name, agent_metadata)
+            
+            if settings.room_create_first:
+                return await self._create_room_first(request, start_time)
+            
             # Vérifier si la salle existe déjà
             try:
                 room_info = await self.livekit_api.room.get_room(api.GetRoomRequest(name=room_name))
                 logger.info(f"Salle existante récupérée: {room_name}")
+                self._cache_room(room_info.name, room_info.sid)
                 
                 return {
                     "room_name": room_info.name,
@@ -40,12 +75,8 @@ class LiveKitService:
                 logger.debug(f"La salle {room_name} n'existe pas encore: {e}")
             
             # Créer la salle
-            request = api.CreateRoomRequest(
-                name=room_name,
-                empty_timeout=empty_timeout
-            )
-            
             response = await self.livekit_api.room.create_room(request)
+            self._cache_room(response.name, response.sid)
             
             elapsed_time = time.time() - start_time
             logger.info(f"Salle LiveKit créée: nom={response.name}, sid={response.sid}, temps={elapsed_time:.2f}s")
@@ -54,6 +85,7 @@ class LiveKitService:
                 "room_name": response.name,
                 "room_sid": response.sid,
                 "status": "created",
+                "agent_dispatched": bool(agent_name),
                 "elapsed_time_ms": int(elapsed_time * 1000)
             }
         except Exception as e:
@@ -61,6 +93,223 @@ class LiveKitService:
             logger.error(f"Erreur lors de la création de la salle: {e}, temps={elapsed_time:.2f}s")
             return {"status": "error", "error": str(e), "elapsed_time_ms": int(elapsed_time * 1000)}
     
+    def _room_request(self, room_name: str, empty_timeout: int,
+                      agent_name: Optional[str], agent_metadata: Optional[str]) -> api.CreateRoomRequest:
+        if not agent_name:
+            return api.CreateRoomRequest(name=room_name, empty_timeout=empty_timeout)
+        return api.CreateRoomRequest(
+            name=room_name,
+            empty_timeout=empty_timeout,
+            agents=[api.RoomAgentDispatch(agent_name=agent_name, metadata=agent_metadata or "")]
+        )
+    
+    async def _create_room_first(self, request: api.CreateRoomRequest, start_time: float) -> Dict[str, Any]:
+        """
+        Crée la salle directement et traite le conflit "already exists" sans sonde préalable
+        """
+        room_name = request.name
+        try:
+            response = await self.livekit_api.room.create_room(request)
+            status = "created"
+        except api.TwirpError as e:
+            if e.code != api.TwirpErrorCode.ALREADY_EXISTS:
+                raise
+            logger.info(f"La salle {room_name} existe déjà, récupération")
+            response = await self.livekit_api.room.get_room(api.GetRoomRequest(name=room_name))
+            status = "existing"
+        
+        self._cache_room(response.name, response.sid)
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"Salle LiveKit {status}: nom={response.name}, sid={response.sid}, temps={elapsed_time:.2f}s")
+        
+        return {
+            "room_name": response.name,
+            "room_sid": response.sid,
+            "status": status,
+            "agent_dispatched": status == "created" and bool(request.agents),
+            "elapsed_time_ms": int(elapsed_time * 1000)
+        }
+    
+    async def delete_room(self, room_name: str) -> Dict[str, Any]:
+        """
+        Supprime une salle LiveKit
+        """
+        self.invalidate_room(room_name)
+        try:
+            await self.livekit_api.room.delete_room(api.DeleteRoomRequest(room=room_name))
+            logger.info(f"Salle LiveKit supprimée: {room_name}")
+            return {"room_name": room_name, "status": "deleted"}
+        except Exception as e:
+            logger.error(f"Erreur lors de la suppression de la salle {room_name}: {e}")
+            return {"status": "error", "error": str(e)}
+    
+    def invalidate_room(self, room_name: str) -> None:
+        """
+        Retire une salle du cache (suppression, fermeture ou timeout de la salle)
+        """
+        if self.room_cache.pop(room_name, None) is not None:
+            self.room_cache_stats["invalidations"] += 1
+    
+    def get_room_cache_stats(self) -> Dict[str, Any]:
+        lookups = self.room_cache_stats["hits"] + self.room_cache_stats["misses"]
+        return {
+            "size": len(self.room_cache),
+            "max_size": settings.room_cache_size,
+            "ttl": settings.room_cache_ttl,
+            "create_first": settings.room_create_first,
+            "hit_rate": self.room_cache_stats["hits"] / lookups if lookups else 0.0,
+            **self.room_cache_stats
+        }
+    
+    def _get_cached_room(self, room_name: str) -> Optional[Dict[str, Any]]:
+        if settings.room_cache_size <= 0:
+            return None
+        
+        entry = self.room_cache.get(room_name)
+        if entry is None:
+            self.room_cache_stats["misses"] += 1
+            return None
+        
+        if entry["expires_at"] < time.time():
+            del self.room_cache[room_name]
+            self.room_cache_stats["misses"] += 1
+            return None
+        
+        self.room_cache.move_to_end(room_name)
+        self.room_cache_stats["hits"] += 1
+        return entry
+    
+    def _cache_room(self, room_name: str, room_sid: str) -> None:
+        if settings.room_cache_size <= 0:
+            return
+        
+        self.room_cache[room_name] = {
+            "room_name": room_name,
+            "room_sid": room_sid,
+            "expires_at": time.time() + settings.room_cache_ttl,
+        }
+        self.room_cache.move_to_end(room_name)
+        while len(self.room_cache) > settings.room_cache_size:
+            self.room_cache.popitem(last=False)
+    
+    @property
+    def room_pool_enabled(self) -> bool:
+        return settings.room_pool_size > 0
+    
+    async def start_room_pool(self) -> None:
+        """
+        Démarre le remplissage en arrière-plan du pool de salles
+        """
+        if not self.room_pool_enabled or (self._room_pool_task and not self._room_pool_task.done()):
+            return
+        
+        self._room_pool_refill = asyncio.Event()
+        self._room_pool_task = asyncio.create_task(self._run_room_pool())
+        logger.info(f"Pool de salles démarré: taille={settings.room_pool_size}, timeout={settings.room_pool_empty_timeout}s")
+    
+    async def stop_room_pool(self) -> None:
+        """
+        Arrête le remplissage du pool et supprime les salles inutilisées
+        """
+        if self._room_pool_task:
+            self._room_pool_task.cancel()
+            try:
+                await self._room_pool_task
+            except asyncio.CancelledError:
+                pass
+            self._room_pool_task = None
+        
+        idle_rooms = list(self.room_pool)
+        self.room_pool.clear()
+        if idle_rooms:
+            await asyncio.gather(*(self.delete_room(room["room_name"]) for room in idle_rooms))
+    
+    def acquire_pooled_room(self) -> Optional[Dict[str, Any]]:
+        """
+        Retire une salle prête du pool, ou None si le pool est vide ou désactivé
+        """
+        room = None
+        while self.room_pool:
+            candidate = self.room_pool.popleft()
+            if not self._is_pooled_room_expired(candidate):
+                room = candidate
+                break
+            self.invalidate_room(candidate["room_name"])
+        
+        # Déclencher le remplissage en arrière-plan
+        if self._room_pool_refill:
+            self._room_pool_refill.set()
+        
+        if room:
+            logger.info(f"Salle prise dans le pool: {room['room_name']} (restantes: {len(self.room_pool)})")
+        elif self.room_pool_enabled:
+            logger.warning("Pool de salles vide, création à la demande")
+        return room
+    
+    def get_room_pool_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.room_pool_enabled,
+            "size": settings.room_pool_size,
+            "available": len(self.room_pool),
+            "pending": self._room_pool_pending,
+        }
+    
+    def _is_pooled_room_expired(self, room: Dict[str, Any]) -> bool:
+        # LiveKit ferme une salle restée vide après empty_timeout: on la retire avant
+        max_age = settings.room_pool_empty_timeout * settings.room_pool_max_age_ratio
+        return time.time() - room["created_at"] > max_age
+    
+    async def _run_room_pool(self) -> None:
+        """
+        Maintient le pool à sa taille cible et écarte les salles trop anciennes
+        """
+        check_interval = max(1.0, settings.room_pool_empty_timeout * settings.room_pool_max_age_ratio / 4)
+        
+        while True:
+            self._room_pool_refill.clear()
+            
+            fresh_rooms = []
+            for room in self.room_pool:
+                if self._is_pooled_room_expired(room):
+                    self.invalidate_room(room["room_name"])
+                else:
+                    fresh_rooms.append(room)
+            if len(fresh_rooms) != len(self.room_pool):
+                logger.info(f"{len(self.room_pool) - len(fresh_rooms)} salle(s) expirée(s) retirée(s) du pool")
+                self.room_pool = deque(fresh_rooms)
+            
+            missing = settings.room_pool_size - len(self.room_pool) - self._room_pool_pending
+            if missing > 0:
+                batch = min(missing, settings.room_pool_refill_concurrency)
+                self._room_pool_pending += batch
+                try:
+                    results = await asyncio.gather(*(self._create_pooled_room() for _ in range(batch)))
+                finally:
+                    self._room_pool_pending -= batch
+                
+                # Continuer immédiatement tant que des créations réussissent
+                if any(results):
+                    continue
+            
+            try:
+                await asyncio.wait_for(self._room_pool_refill.wait(), timeout=check_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _create_pooled_room(self) -> bool:
+        room_name = f"pool-{uuid.uuid4().hex[:12]}"
+        result = await self.create_room(room_name, empty_timeout=settings.room_pool_empty_timeout)
+        if result.get("status") != "created":
+            return False
+        
+        self.room_pool.append({
+            "room_name": result["room_name"],
+            "room_sid": result["room_sid"],
+            "created_at": time.time(),
+        })
+        return True
+    
     async def create_agent_dispatch(self, agent_name: str, room_name: str, metadata: Optional[str] = None) -> Dict[str, Any]:
         """
         Dispatch un agent dans une salle LiveKit
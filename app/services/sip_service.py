@@ -1,76 +1,234 @@
+import re
+import hmac
+import hashlib
 import logging
-import httpx
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from livekit import api
 from livekit.protocol.sip import CreateSIPParticipantRequest, SIPParticipantInfo
 from app.core.config import settings
+from app.core.single_flight import SingleFlight
+from app.services.livekit_client import livekit_client
+from app.services.xano_outbox import xano_outbox
+from app.services.dial_scheduler import dial_scheduler, DialSchedulerError
+from app.services.state_store import state_store
+from app.services.call_events import call_events, TERMINAL_EVENTS
 
 logger = logging.getLogger(__name__)
 
+# Adresse du serveur SIP Twilio
+TWILIO_SIP_ADDRESS = "sip.twilio.com"
+
+def normalize_phone_number(phone_number: Optional[str]) -> str:
+    """
+    Forme canonique d'un numéro pour l'index des trunks (+33 1 23-45 → +3312345)
+    """
+    return re.sub(r"[^\d+]", "", phone_number or "")
+
+def password_digest(password: Optional[str]) -> str:
+    """
+    Empreinte d'un mot de passe SIP: le registre et les clés de déduplication ne le gardent pas en clair
+    """
+    return hashlib.sha256((password or "").encode("utf-8")).hexdigest()
+
+class TrunkRegistryUnavailable(Exception):
+    """
+    Registre des trunks impossible à recharger (LiveKit injoignable): l'absence
+    d'un trunk ne peut pas être confirmée
+    """
+    error_code = "trunk_registry_unavailable"
+
 class SipService:
     def __init__(self):
-        self.livekit_api = api.LiveKitAPI(
-            url=settings.livekit_url,
-            api_key=settings.livekit_api_key, 
-            api_secret=settings.livekit_api_secret
-        )
-        self.xano_webhook_url = settings.xano_webhook_url
-        self.xano_api_key = settings.xano_api_key
+        self.xano_outbox = xano_outbox
+        self.dial_scheduler = dial_scheduler
+        call_events.add_listener(self._on_call_event)
+        # Registre des trunks sortants LiveKit: trunk_id -> description, numéro -> trunk_ids
+        self._trunks: Dict[str, Dict[str, Any]] = {}
+        self._trunks_by_number: Dict[str, List[str]] = {}
+        # Empreinte du mot de passe de chaque trunk, hors des descriptions renvoyées par l'API
+        self._trunk_passwords: Dict[str, str] = {}
+        self._trunks_loaded_at = 0.0
+        self._trunk_flights = SingleFlight()
+
+    @property
+    def livekit_api(self) -> api.LiveKitAPI:
+        """
+        Client LiveKit partagé (pool de connexions commun aux services)
+        """
+        return livekit_client.api
+    
+    async def load_trunks(self) -> bool:
+        """
+        Charge le registre des trunks depuis la liste des trunks sortants LiveKit
+        """
+        try:
+            response = await self.livekit_api.sip.list_sip_outbound_trunk(api.ListSIPOutboundTrunkRequest())
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement des trunks SIP: {str(e)}")
+            return False
         
+        self._trunks.clear()
+        self._trunks_by_number.clear()
+        self._trunk_passwords.clear()
+        for trunk_info in response.items:
+            self._register_trunk(trunk_info)
+        self._trunks_loaded_at = time.monotonic()
+        
+        logger.info(f"Registre des trunks SIP chargé: {len(self._trunks)} trunks, {len(self._trunks_by_number)} numéros")
+        return True
+    
+    def _register_trunk(self, trunk_info: api.SIPOutboundTrunkInfo) -> Dict[str, Any]:
+        trunk = {
+            "trunk_id": trunk_info.sip_trunk_id,
+            "name": trunk_info.name,
+            "address": trunk_info.address,
+            "numbers": list(trunk_info.numbers),
+            "auth_username": trunk_info.auth_username,
+        }
+        self._trunks[trunk["trunk_id"]] = trunk
+        self._trunk_passwords[trunk["trunk_id"]] = password_digest(trunk_info.auth_password)
+        for number in trunk["numbers"]:
+            trunk_ids = self._trunks_by_number.setdefault(normalize_phone_number(number), [])
+            if trunk["trunk_id"] not in trunk_ids:
+                trunk_ids.append(trunk["trunk_id"])
+        return trunk
+    
+    def find_trunk(self, phone_number: str, auth_username: Optional[str] = None,
+                   address: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Recherche dans le registre un trunk portant ce numéro (et ces identifiants si fournis)
+        """
+        for trunk_id in self._trunks_by_number.get(normalize_phone_number(phone_number), []):
+            trunk = self._trunks[trunk_id]
+            if auth_username is not None and trunk["auth_username"] != auth_username:
+                continue
+            if address is not None and trunk["address"] != address:
+                continue
+            return dict(trunk)
+        return None
+    
+    def list_trunks(self) -> List[Dict[str, Any]]:
+        return [dict(trunk) for trunk in self._trunks.values()]
+    
+    async def _find_trunk_or_reload(self, phone_number: str, auth_username: Optional[str] = None,
+                                    address: Optional[str] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Recherche un trunk; en cas d'absence, recharge le registre (trunk créé ailleurs)
+        au plus une fois par intervalle, sauf si force est demandé.
+        Lève TrunkRegistryUnavailable si le rechargement nécessaire a échoué.
+        """
+        trunk = self.find_trunk(phone_number, auth_username, address)
+        if trunk is None and (force or time.monotonic() - self._trunks_loaded_at >= settings.sip_trunk_reload_interval):
+            if not await self._trunk_flights.do("reload", self.load_trunks):
+                raise TrunkRegistryUnavailable("SIP trunk registry unavailable: LiveKit trunk list failed")
+            trunk = self.find_trunk(phone_number, auth_username, address)
+        return trunk
+    
+    async def resolve_trunk_id(self, trunk_id: Optional[str] = None, from_number: Optional[str] = None) -> Optional[str]:
+        """
+        Détermine le trunk d'un appel: trunk_id explicite, sinon le trunk du numéro appelant
+        (from_number), sinon le trunk configuré par défaut
+        """
+        if trunk_id:
+            return trunk_id
+        if not from_number and settings.twilio_sip_trunk_id:
+            return settings.twilio_sip_trunk_id
+        from_number = from_number or settings.twilio_phone_number
+        if not from_number:
+            return None
+        trunk = await self._find_trunk_or_reload(from_number)
+        return trunk["trunk_id"] if trunk else None
+    
     async def create_outbound_trunk(self, name: str, phone_number: str, auth_username: str, auth_password: str) -> Dict[str, Any]:
         """
-        Crée un trunk SIP outbound pour les appels sortants
+        Crée un trunk SIP outbound pour les appels sortants, ou retourne le trunk existant
+        pour ce numéro et ces identifiants (conflit si son mot de passe diffère)
         """
+        key = f"{normalize_phone_number(phone_number)}:{auth_username}:{password_digest(auth_password)}"
+        result = await self._trunk_flights.do(
+            key, lambda: self._create_outbound_trunk(name, phone_number, auth_username, auth_password)
+        )
+        return dict(result)
+    
+    async def _create_outbound_trunk(self, name: str, phone_number: str, auth_username: str, auth_password: str) -> Dict[str, Any]:
         try:
-            logger.info(f"Création d'un trunk avec: name={name}, phone={phone_number}, username={auth_username}")
-            
-            # Création du trunk
-            trunk = api.SIPOutboundTrunkInfo(
-                name=name,
-                address="sip.twilio.com",  # Adresse du serveur SIP Twilio
-                numbers=[phone_number],
-                auth_username=auth_username,
-                auth_password=auth_password
-            )
-            
-            request = api.CreateSIPOutboundTrunkRequest(trunk=trunk)
-            trunk_info = await self.livekit_api.sip.create_sip_outbound_trunk(request)
-            
-            # Générer un ID pour le trunk
-            trunk_id = getattr(trunk_info, 'id', f"trunk-{int(time.time())}")
+            # Verrou partagé: deux workers de l'API ne créent pas le même trunk
+            async with state_store.lock(f"trunk:{normalize_phone_number(phone_number)}", ttl=settings.livekit_request_timeout * 3):
+                existing = await self._find_trunk_or_reload(
+                    phone_number, auth_username, TWILIO_SIP_ADDRESS, force=True
+                )
+                if existing:
+                    known_digest = self._trunk_passwords.get(existing["trunk_id"], "")
+                    if not hmac.compare_digest(known_digest, password_digest(auth_password)):
+                        logger.warning(f"Trunk existant pour {phone_number} (id={existing['trunk_id']}) avec un autre mot de passe")
+                        return {
+                            "status": "error",
+                            "error": f"Trunk {existing['trunk_id']} already exists for this number and username with a different password",
+                            "error_code": "trunk_conflict",
+                            "trunk_id": existing["trunk_id"]
+                        }
+                    logger.info(f"Trunk existant pour {phone_number}: id={existing['trunk_id']}, name={existing['name']}")
+                    return {**existing, "status": "existing"}
+                
+                logger.info(f"Création d'un trunk avec: name={name}, phone={phone_number}, username={auth_username}")
+                
+                # Création du trunk
+                trunk = api.SIPOutboundTrunkInfo(
+                    name=name,
+                    address=TWILIO_SIP_ADDRESS,
+                    numbers=[phone_number],
+                    auth_username=auth_username,
+                    auth_password=auth_password
+                )
+                
+                request = api.CreateSIPOutboundTrunkRequest(trunk=trunk)
+                trunk_info = await self.livekit_api.sip.create_sip_outbound_trunk(request)
+                
+                if not trunk_info.sip_trunk_id:
+                    raise ValueError("LiveKit returned a trunk without sip_trunk_id")
+                registered = self._register_trunk(trunk_info)
+                self._trunk_passwords[registered["trunk_id"]] = password_digest(auth_password)
             
-            logger.info(f"Trunk créé avec succès: id={trunk_id}, name={name}")
+            logger.info(f"Trunk créé avec succès: id={registered['trunk_id']}, name={name}")
             
-            return {
-                "trunk_id": trunk_id,
-                "name": name,
-                "numbers": [phone_number],
-                "status": "created"
-            }
+            return {**registered, "status": "created"}
+        except TrunkRegistryUnavailable as e:
+            # Sans registre, créer le trunk risquerait un doublon
+            logger.error(f"Création du trunk impossible: {str(e)}")
+            return {"status": "error", "error": str(e), "error_code": e.error_code}
         except Exception as e:
             logger.error(f"Erreur lors de la création du trunk: {str(e)}")
             return {"status": "error", "error": str(e)}
     
-    async def make_outbound_call(self, trunk_id: str, phone_number: str, room_name: str, call_id: str) -> Dict[str, Any]:
+    async def make_outbound_call(self, trunk_id: str, phone_number: str, room_name: str, call_id: str,
+                                 priority: int = 0, queue_timeout: Optional[float] = None) -> Dict[str, Any]:
         """
-        Effectue un appel sortant en utilisant un trunk SIP
+        Effectue un appel sortant en utilisant un trunk SIP. La numérotation attend un
+        créneau de l'ordonnanceur du trunk (appels par seconde et appels simultanés).
         """
         try:
-            logger.info(f"Initiation d'un appel: trunk={trunk_id}, phone={phone_number}, room={room_name}")
-            
-            # Création d'un participant SIP pour effectuer l'appel
-            request = CreateSIPParticipantRequest(
-                sip_trunk_id=trunk_id,
-                sip_call_to=phone_number,
-                room_name=room_name,
-                participant_identity=f"sip-{call_id}",
-                participant_name="Outbound Call",
-                play_dialtone=True  # Jouer une tonalité pendant que l'appel se connecte
-            )
-            
-            # Faire l'appel
-            participant = await self.livekit_api.sip.create_sip_participant(request)
+            wait_time = await self.dial_scheduler.acquire(trunk_id, priority, queue_timeout)
+            try:
+                logger.info(f"Initiation d'un appel: trunk={trunk_id}, phone={phone_number}, room={room_name}")
+                
+                # Création d'un participant SIP pour effectuer l'appel
+                request = CreateSIPParticipantRequest(
+                    sip_trunk_id=trunk_id,
+                    sip_call_to=phone_number,
+                    room_name=room_name,
+                    participant_identity=f"sip-{call_id}",
+                    participant_name="Outbound Call",
+                    play_dialtone=True  # Jouer une tonalité pendant que l'appel se connecte
+                )
+                
+                # Faire l'appel
+                participant = await self.livekit_api.sip.create_sip_participant(request)
+            except BaseException:
+                self.dial_scheduler.release(trunk_id)
+                raise
+            # Le créneau reste occupé jusqu'au raccroché ou à l'échec de l'appel
+            self.dial_scheduler.hold_call(str(call_id), trunk_id)
             
             # Enregistrer l'ID du participant pour le suivi
             participant_id = getattr(participant, 'id', f"SIP-{call_id}")
@@ -78,67 +236,64 @@ class SipService:
             logger.info(f"Appel initié avec succès: participant_id={participant_id}, status=dialing")
             
             # Notifier Xano du début de l'appel
-            await self._send_call_event_to_xano(call_id, "dialing", participant_id)
+            self._send_call_event_to_xano(call_id, "dialing", participant_id)
             
             return {
                 "participant_id": participant_id,
                 "room_name": room_name,
                 "status": "dialing",
-                "call_id": call_id
+                "call_id": call_id,
+                "dial_wait_ms": int(wait_time * 1000)
             }
+        except DialSchedulerError as e:
+            # Pas d'échec signalé à Xano: l'API répond 503 et le client réessaie avec le même call_id
+            logger.warning(f"Appel {call_id} non numéroté: {str(e)}")
+            return {"status": "error", "error": str(e), "error_code": e.error_code, "call_id": call_id}
         except Exception as e:
             logger.error(f"Erreur lors de l'initiation de l'appel: {str(e)}")
             
-            # Notifier Xano de l'échec
-            await self._send_call_event_to_xano(call_id, "failed", None, error=str(e))
-            
-            return {
+            result = {
                 "status": "error", 
                 "error": str(e),
                 "call_id": call_id
             }
+            # Refus de l'opérateur pour dépassement de limite: ralentir le trunk
+            if isinstance(e, api.TwirpError) and e.code == api.TwirpErrorCode.RESOURCE_EXHAUSTED:
+                self.dial_scheduler.penalize(trunk_id)
+                result["error_code"] = "trunk_rate_limited"
+                # Nouvelle tentative attendue du client (503), comme pour une file saturée
+                return result
             
-    async def _send_call_event_to_xano(self, call_id: str, status: str, participant_id: str = None, error: str = None):
-        """
-        Envoie un événement d'appel à Xano pour le suivi
-        """
-        if not self.xano_webhook_url or not self.xano_api_key:
-            logger.warning("Configuration Xano manquante, impossible d'envoyer l'événement d'appel")
-            return
-            
-        try:
-            # Préparation du payload
-            payload = {
-                "call_id": call_id,
-                "status": status,
-                "field_value": "1"  # Champ requis par Xano
-            }
+            # Notifier Xano de l'échec
+            self._send_call_event_to_xano(call_id, "failed", None, error=str(e))
             
-            if participant_id:
-                payload["participant_id"] = participant_id
-                
-            if error:
-                payload["error"] = error
+            return result
             
-            # Envoi à Xano
-            headers = {
-                "X-API-Key": self.xano_api_key,
-                "Content-Type": "application/json"
-            }
+    def _on_call_event(self, message: Dict[str, Any]) -> None:
+        """
+        Libère le créneau de numérotation d'un appel terminé (raccroché ou échec)
+        """
+        if message["event"] in TERMINAL_EVENTS:
+            self.dial_scheduler.release_call(message["call_id"])
+    
+    def _send_call_event_to_xano(self, call_id: str, status: str, participant_id: str = None, error: str = None) -> bool:
+        """
+        Place un événement d'appel dans l'outbox Xano pour envoi en arrière-plan
+        """
+        # Préparation du payload
+        payload = {
+            "call_id": call_id,
+            "status": status,
+            "field_value": "1"  # Champ requis par Xano
+        }
+        
+        if participant_id:
+            payload["participant_id"] = participant_id
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.xano_webhook_url,
-                    json=payload,
-                    headers=headers
-                )
-                
-                if response.status_code in [200, 201]:
-                    logger.info(f"Événement d'appel envoyé à Xano: {status}")
-                else:
-                    logger.warning(f"Échec de l'envoi à Xano: {response.status_code}, {response.text}")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'envoi à Xano: {str(e)}")
+        if error:
+            payload["error"] = error
+        
+        return self.xano_outbox.enqueue(payload)
 
 # Instancier le service
 sip_service = SipService()
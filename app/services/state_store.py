@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """
+    Indique si un processus existe sur cette machine
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class StateStore(ABC):
+    """
+    État partagé entre les workers de l'API (uvicorn --workers N): registre des agents,
+    enregistrements d'appels et verrous. Les enregistrements sont des dictionnaires
+    sérialisables en JSON.
+
+    Les enregistrements d'agents portent le pid du worker API propriétaire et celui du
+    processus d'agent; leur validité est vérifiée avec pid_alive, ce qui suppose que tous
+    les workers sont sur la même machine. Une implémentation réseau (Redis, etcd...)
+    remplacerait cette vérification par des baux renouvelés par le propriétaire.
+    """
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def get_agent(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def put_agent(self, key: str, record: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_agent(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def list_agents(self) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_call(self, call_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def put_call(self, call_id: str, record: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Prend le verrou s'il est libre, expiré ou déjà détenu par owner (le bail est alors prolongé)
+        """
+
+    @abstractmethod
+    async def release_lock(self, name: str, owner: str) -> None:
+        ...
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float, timeout: Optional[float] = None, poll_interval: float = 0.05):
+        """
+        Verrou exclusif entre tous les workers (et toutes les tâches d'un même worker).
+        Lève asyncio.TimeoutError si le verrou n'est pas obtenu dans le délai.
+
+        Le bail est prolongé tant que le verrou est détenu: le ttl ne borne que la durée
+        pendant laquelle le verrou d'un worker arrêté reste pris.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + (ttl if timeout is None else timeout)
+        while not await self.try_acquire_lock(name, owner, ttl):
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(f"Lock {name} not acquired")
+            await asyncio.sleep(poll_interval)
+        renew_task = asyncio.create_task(self._renew_lock(name, owner, ttl))
+        try:
+            yield
+        finally:
+            renew_task.cancel()
+            await asyncio.gather(renew_task, return_exceptions=True)
+            await self.release_lock(name, owner)
+
+    async def _renew_lock(self, name: str, owner: str, ttl: float) -> None:
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if not await self.try_acquire_lock(name, owner, ttl):
+                    logger.error(f"Bail du verrou {name} perdu: il a expiré et été pris par un autre worker")
+                    return
+            except Exception as e:
+                logger.warning(f"Impossible de prolonger le bail du verrou {name}: {e}")
+
+class MemoryStateStore(StateStore):
+    """
+    État local au processus: suffisant avec un seul worker API
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, Dict[str, Any]] = {}
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, Dict[str, Any]] = {}
+
+    async def get_agent(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._agents.get(key)
+        return dict(record) if record else None
+
+    async def put_agent(self, key: str, record: Dict[str, Any]) -> None:
+        self._agents[key] = dict(record)
+
+    async def delete_agent(self, key: str) -> None:
+        self._agents.pop(key, None)
+
+    async def list_agents(self) -> Dict[str, Dict[str, Any]]:
+        return {key: dict(record) for key, record in self._agents.items()}
+
+    async def get_call(self, call_id: str) -> Optional[Dict[str, Any]]:
+        record = self._calls.get(call_id)
+        return dict(record) if record else None
+
+    async def put_call(self, call_id: str, record: Dict[str, Any]) -> None:
+        self._calls[call_id] = dict(record)
+        while len(self._calls) > settings.state_call_retention:
+            self._calls.pop(next(iter(self._calls)))
+
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        current = self._locks.get(name)
+        if current and current["owner"] != owner and current["expires_at"] > now:
+            return False
+        self._locks[name] = {"owner": owner, "expires_at": now + ttl}
+        return True
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        current = self._locks.get(name)
+        if current and current["owner"] == owner:
+            del self._locks[name]
+
+class SQLiteStateStore(StateStore):
+    """
+    État partagé par les workers d'une même machine, dans une base SQLite en mode WAL
+    (lecteurs concurrents, un écrivain à la fois). Les requêtes s'exécutent dans un
+    thread dédié pour ne pas bloquer la boucle d'événements.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def start(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+            await self._run(self._open)
+            logger.info(f"État partagé SQLite ouvert: {self.path}")
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self._close)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, function, *args):
+        if self._executor is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS agents (key TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS calls (call_id TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS calls_updated_at ON calls (updated_at)")
+        connection.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._connection = connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connection_execute(self, query: str, params: tuple) -> None:
+        self._connection.execute(query, params)
+
+    def _fetch_all(self, query: str) -> List[tuple]:
+        return self._connection.execute(query).fetchall()
+
+    def _fetch_record(self, query: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection.execute(query, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put_call(self, call_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        self._connection.execute(
+            "INSERT INTO calls (call_id, record, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(call_id) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at",
+            (call_id, json.dumps(record), now)
+        )
+        # Ne conserver que les enregistrements les plus récents
+        self._connection.execute(
+            "DELETE FROM calls WHERE call_id IN (SELECT call_id FROM calls ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (settings.state_call_retention,)
+        )
+
+    def _try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._connection.execute(
+            "INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE locks.expires_at < ? OR locks.owner = excluded.owner",
+            (name, owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    async def get_agent(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._fetch_record, "SELECT record FROM agents WHERE key = ?", key)
+
+    async def put_agent(self, key: str, record: Dict[str, Any]) -> None:
+        await self._run(
+            self._connection_execute,
+            "INSERT INTO agents (key, record, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at",
+            (key, json.dumps(record), time.time())
+        )
+
+    async def delete_agent(self, key: str) -> None:
+        await self._run(self._connection_execute, "DELETE FROM agents WHERE key = ?", (key,))
+
+    async def list_agents(self) -> Dict[str, Dict[str, Any]]:
+        rows = await self._run(self._fetch_all, "SELECT key, record FROM agents")
+        return {key: json.loads(record) for key, record in rows}
+
+    async def get_call(self, call_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._fetch_record, "SELECT record FROM calls WHERE call_id = ?", call_id)
+
+    async def put_call(self, call_id: str, record: Dict[str, Any]) -> None:
+        await self._run(self._put_call, call_id, record)
+
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        return await self._run(self._try_acquire_lock, name, owner, ttl)
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        await self._run(self._connection_execute, "DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+def create_state_store() -> StateStore:
+    if settings.state_backend == "sqlite":
+        return SQLiteStateStore(settings.state_sqlite_path)
+    if settings.state_backend != "memory":
+        logger.warning(f"Backend d'état inconnu '{settings.state_backend}', utilisation de la mémoire")
+    return MemoryStateStore()
+
+# Instancier le stockage d'état
+state_store = create_state_store()
@@ -0,0 +1,253 @@
+import logging
+import time
+import random
+import asyncio
+import httpx
+from typing import Dict, Any, List, Optional, Set
+from app.core.config import settings
+from app.core.metrics import track_stage, xano_events_total, xano_outbox_queue_depth
+
+logger = logging.getLogger(__name__)
+
+class XanoOutbox:
+    """
+    File d'attente en mémoire des événements d'appel à destination de Xano.
+    Les événements sont envoyés en arrière-plan par un client HTTP persistant,
+    regroupés par lots si possible et renvoyés avec backoff en cas d'échec.
+    Plusieurs tâches d'envoi (une par connexion) vident la file; les événements
+    d'un même appel sont postés dans leur ordre d'arrivée.
+    """
+
+    def __init__(self):
+        self.webhook_url = settings.xano_webhook_url
+        self.batch_webhook_url = settings.xano_batch_webhook_url or settings.xano_webhook_url
+        self.api_key = settings.xano_api_key
+        self.batch_max_events = max(1, settings.xano_batch_max_events)
+        self.batch_linger = settings.xano_batch_linger_ms / 1000
+        self.max_retries = settings.xano_max_retries
+        self.retry_base_delay = settings.xano_retry_base_delay
+        self.retry_max_delay = settings.xano_retry_max_delay
+        self.sender_count = max(1, settings.xano_max_connections)
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+        # Dernier lot pris en charge par appel: le lot suivant du même appel attend son envoi
+        self._call_tails: Dict[Any, asyncio.Future] = {}
+
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "retries": 0,
+            "batches": 0,
+        }
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.webhook_url and self.api_key)
+
+    async def start(self) -> None:
+        """
+        Démarre le client HTTP partagé et les tâches d'envoi
+        """
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        if len(self._workers) >= self.sender_count:
+            return
+
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=settings.xano_outbox_max_size)
+
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers={
+                    "X-API-Key": self.api_key,
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=settings.xano_max_connections,
+                    max_keepalive_connections=settings.xano_max_connections
+                ),
+                timeout=httpx.Timeout(settings.xano_request_timeout)
+            )
+
+        starting = not self._workers
+        while len(self._workers) < self.sender_count:
+            self._workers.append(asyncio.create_task(self._run()))
+        if starting:
+            logger.info(f"Outbox Xano démarrée: taille max={settings.xano_outbox_max_size}, lot max={self.batch_max_events}, "
+                        f"{self.sender_count} tâches d'envoi")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """
+        Vide la file (dans la limite du timeout) puis ferme le client HTTP
+        """
+        if self._workers:
+            if self.queue is not None and not self.queue.empty():
+                try:
+                    await asyncio.wait_for(self.queue.join(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Outbox Xano arrêtée avec {self.queue.qsize()} événements non envoyés")
+
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+        logger.info("Outbox Xano arrêtée")
+
+    def enqueue(self, payload: Dict[str, Any]) -> bool:
+        """
+        Ajoute un événement à la file sans bloquer l'appelant
+        """
+        if not self.configured:
+            logger.warning("Configuration Xano manquante, impossible d'envoyer l'événement d'appel")
+            return False
+
+        # Démarrage paresseux si le service n'a pas été démarré par l'application
+        self._ensure_started()
+
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            xano_events_total.inc(outcome="dropped")
+            logger.error(f"Outbox Xano pleine, événement abandonné: {payload}")
+            return False
+
+        self.stats["enqueued"] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retourne la profondeur de la file et les compteurs d'envoi
+        """
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_size": settings.xano_outbox_max_size,
+            "running": any(not worker.done() for worker in self._workers),
+            **self.stats
+        }
+
+    def _claim(self, event: Dict[str, Any], done: asyncio.Future, previous: Set[asyncio.Future]) -> Dict[str, Any]:
+        """
+        Rattache un événement retiré de la file au lot en cours: le lot attendra
+        l'envoi du lot précédent du même appel
+        """
+        tail = self._call_tails.get(event.get("call_id"))
+        if tail is not None and tail is not done:
+            previous.add(tail)
+        self._call_tails[event.get("call_id")] = done
+        return event
+
+    def _held_elsewhere(self, event: Dict[str, Any], done: asyncio.Future) -> bool:
+        """
+        L'appel de l'événement a un lot en cours sur une autre tâche d'envoi
+        """
+        tail = self._call_tails.get(event.get("call_id"))
+        return tail is not None and tail is not done and not tail.done()
+
+    async def _run(self) -> None:
+        """
+        Boucle d'une tâche d'envoi: regroupe les événements disponibles et les poste
+        """
+        loop = asyncio.get_running_loop()
+        # Lot suivant déjà commencé par un événement retiré de la file pendant l'attente
+        carried = None
+        while True:
+            if carried is None:
+                event = await self.queue.get()
+                done = loop.create_future()
+                previous = set()
+                batch = [self._claim(event, done, previous)]
+            else:
+                batch, done, previous = carried
+                carried = None
+
+            # Attendre brièvement d'autres événements pour former un lot
+            if self.batch_max_events > 1:
+                deadline = time.monotonic() + self.batch_linger
+                while len(batch) < self.batch_max_events:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if self._held_elsewhere(event, done):
+                        # Un lot n'attend les autres que pour son premier événement: deux tâches
+                        # qui s'échangent des appels ne peuvent pas s'attendre mutuellement.
+                        # L'événement ouvre le lot suivant et garde sa place dans l'ordre de l'appel.
+                        next_done = loop.create_future()
+                        next_previous = set()
+                        carried = ([self._claim(event, next_done, next_previous)], next_done, next_previous)
+                        break
+                    batch.append(self._claim(event, done, previous))
+
+            try:
+                if previous:
+                    await asyncio.wait(previous)
+                with track_stage("xano_notify") as stage:
+                    if not await self._post_with_retry(batch):
+                        stage.outcome = "error"
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                logger.error(f"Erreur inattendue de l'outbox Xano: {e}")
+            finally:
+                done.set_result(None)
+                for event in batch:
+                    if self._call_tails.get(event.get("call_id")) is done:
+                        del self._call_tails[event.get("call_id")]
+                    self.queue.task_done()
+
+    async def _post_with_retry(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        Poste un lot d'événements en réessayant avec un backoff exponentiel
+        """
+        if len(batch) == 1:
+            url, body = self.webhook_url, batch[0]
+        else:
+            url, body = self.batch_webhook_url, {"events": batch}
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(url, json=body)
+
+                if response.status_code in [200, 201]:
+                    self.stats["sent"] += len(batch)
+                    self.stats["batches"] += 1
+                    xano_events_total.inc(len(batch), outcome="sent")
+                    logger.info(f"Événements d'appel envoyés à Xano: {[event.get('status') for event in batch]}")
+                    return True
+
+                # Les erreurs client (hors limitation de débit) ne sont pas réessayées
+                if response.status_code < 500 and response.status_code != 429:
+                    logger.warning(f"Échec de l'envoi à Xano: {response.status_code}, {response.text}")
+                    break
+
+                logger.warning(f"Échec temporaire de l'envoi à Xano: {response.status_code} (tentative {attempt + 1})")
+            except httpx.HTTPError as e:
+                logger.warning(f"Erreur réseau lors de l'envoi à Xano: {e} (tentative {attempt + 1})")
+
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+        self.stats["failed"] += len(batch)
+        xano_events_total.inc(len(batch), outcome="failed")
+        logger.error(f"Abandon de l'envoi à Xano de {len(batch)} événement(s)")
+        return False
+
+# Instancier le service
+xano_outbox = XanoOutbox()
+xano_outbox_queue_depth.set_function(lambda: {(): xano_outbox.get_stats()["queue_depth"]})
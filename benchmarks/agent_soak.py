@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Test de charge d'un worker voice_agent.py: combien d'appels simultanés un processus
+peut-il porter avant que la latence des tours ne se dégrade?
+
+Le vrai point d'entrée de l'agent est exécuté avec des plugins STT/LLM/TTS simulés
+(AGENT_MOCK_PLUGINS=1, délais fixes et transcriptions prédéfinies) contre un serveur
+LiveKit local (`livekit-server --dev`). Pour chaque session, un appelant simulé rejoint
+la salle et publie en boucle un audio enregistré (WAV PCM 16 bits mono) ou généré.
+Le nombre de sessions augmente par paliers; on relève pour chaque palier le CPU et
+la RSS du worker, le retard de la boucle d'événements et la latence de chaque tour.
+
+    livekit-server --dev &
+    python benchmarks/agent_soak.py --levels 1,5,10,20 --hold 60 --audio appel.wav
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import signal
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import psutil
+from livekit import api, rtc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "agents")
+sys.path.insert(0, AGENTS_DIR)
+
+from turn_tracing import TURN_METRICS, percentile
+
+logger = logging.getLogger("agent_soak")
+
+AGENT_NAME = "soak-agent"
+FRAME_DURATION_MS = 20
+
+def load_utterance(path: Optional[str], sample_rate: int = 16000) -> Tuple[np.ndarray, int]:
+    """
+    Retourne l'audio d'une prise de parole (int16 mono) et sa fréquence d'échantillonnage
+    """
+    if path:
+        with wave.open(path, "rb") as f:
+            if f.getsampwidth() != 2 or f.getnchannels() != 1:
+                raise ValueError("Le fichier audio doit être un WAV PCM 16 bits mono")
+            return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16), f.getframerate()
+
+    # Signal voisé synthétique: harmoniques d'une fondamentale de 120Hz modulées
+    # par une enveloppe syllabique de 4Hz, sur 2,5 secondes
+    t = np.arange(int(2.5 * sample_rate)) / sample_rate
+    voiced = sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    rng = np.random.default_rng(0)
+    signal_ = voiced * envelope + 0.02 * rng.standard_normal(len(t))
+    signal_ = signal_ / np.max(np.abs(signal_)) * 0.5
+    return (signal_ * 32767).astype(np.int16), sample_rate
+
+class CallerSession:
+    """
+    Appelant simulé: une salle, un dispatch de l'agent et un participant qui parle en boucle
+    """
+
+    def __init__(self, args, lkapi: api.LiveKitAPI, utterance: np.ndarray, sample_rate: int, index: int):
+        self.args = args
+        self.lkapi = lkapi
+        self.utterance = utterance
+        self.sample_rate = sample_rate
+        self.room_name = f"soak-{uuid.uuid4().hex[:8]}"
+        self.call_id = f"soak-call-{index}"
+        self.room = rtc.Room()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.lkapi.room.create_room(api.CreateRoomRequest(name=self.room_name, empty_timeout=60))
+        await self.lkapi.agent_dispatch.create_dispatch(api.CreateAgentDispatchRequest(
+            agent_name=AGENT_NAME,
+            room=self.room_name,
+            metadata=json.dumps({"agent_id": "soak", "call_id": self.call_id})
+        ))
+        token = (
+            api.AccessToken(self.args.api_key, self.args.api_secret)
+            .with_identity(f"caller-{self.call_id}")
+            .with_grants(api.VideoGrants(room_join=True, room=self.room_name))
+            .to_jwt()
+        )
+        await self.room.connect(self.args.livekit_url, token)
+        self._task = asyncio.create_task(self._speak())
+
+    async def _speak(self) -> None:
+        source = rtc.AudioSource(self.sample_rate, 1)
+        track = rtc.LocalAudioTrack.create_audio_track("caller-audio", source)
+        await self.room.local_participant.publish_track(
+            track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE)
+        )
+        samples_per_frame = self.sample_rate * FRAME_DURATION_MS // 1000
+        silence = np.zeros(samples_per_frame, dtype=np.int16)
+        pause_frames = int(self.args.pause * 1000 / FRAME_DURATION_MS)
+
+        def frame(samples: np.ndarray) -> rtc.AudioFrame:
+            if len(samples) < samples_per_frame:
+                samples = np.concatenate([samples, silence[:samples_per_frame - len(samples)]])
+            return rtc.AudioFrame(
+                data=samples.tobytes(),
+                sample_rate=self.sample_rate,
+                num_channels=1,
+                samples_per_channel=samples_per_frame
+            )
+
+        while True:
+            # capture_frame régule le débit au temps réel
+            for offset in range(0, len(self.utterance), samples_per_frame):
+                await source.capture_frame(frame(self.utterance[offset:offset + samples_per_frame]))
+            # Laisser l'agent répondre avant la prise de parole suivante
+            for _ in range(pause_frames):
+                await source.capture_frame(frame(silence))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.room.disconnect()
+        try:
+            await self.lkapi.room.delete_room(api.DeleteRoomRequest(room=self.room_name))
+        except Exception as e:
+            logger.warning(f"Suppression de la salle {self.room_name} impossible: {e}")
+
+class ResourceSampler:
+    """
+    Échantillonne le CPU et la RSS du worker et de ses processus de jobs
+    """
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.samples: List[Dict[str, Any]] = []
+        self._processes: Dict[int, psutil.Process] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _sample(self) -> Dict[str, Any]:
+        try:
+            current = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            current = []
+        cpu, rss = 0.0, 0
+        for process in current:
+            # Réutiliser le même objet pour que cpu_percent mesure depuis l'appel précédent
+            process = self._processes.setdefault(process.pid, process)
+            try:
+                cpu += process.cpu_percent(None)
+                rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                self._processes.pop(process.pid, None)
+        return {"timestamp": time.time(), "cpu_percent": round(cpu, 1), "rss_mb": round(rss / 1024 / 1024, 1), "processes": len(current)}
+
+    async def _run(self) -> None:
+        while True:
+            self.samples.append(self._sample())
+            await asyncio.sleep(self.interval)
+
+async def wait_for_worker(socket_path: str, token: str, timeout: float) -> None:
+    """
+    Attend que le worker signale son enregistrement (même protocole que l'API)
+    """
+    registered = asyncio.get_running_loop().create_future()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            message = json.loads(await reader.readline())
+            if message.get("token") == token and message.get("event") == "registered" and not registered.done():
+                registered.set_result(True)
+        except (json.JSONDecodeError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    try:
+        await asyncio.wait_for(registered, timeout)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+def summarize_level(level: Dict[str, Any], samples: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    start, end = level["start"], level["end"]
+    window = [sample for sample in samples if start <= sample["timestamp"] <= end]
+    turns = [record for record in records if record.get("type", "turn") == "turn" and start <= record["timestamp"] <= end]
+    lags = [record for record in records if record.get("type") == "loop_lag" and start <= record["timestamp"] <= end]
+
+    summary = {
+        "sessions": level["sessions"],
+        "turns": len(turns),
+        "cpu_percent_avg": round(sum(s["cpu_percent"] for s in window) / len(window), 1) if window else 0.0,
+        "cpu_percent_max": max((s["cpu_percent"] for s in window), default=0.0),
+        "rss_mb_max": max((s["rss_mb"] for s in window), default=0.0),
+        "loop_lag_p99_ms": max((record["p99_ms"] for record in lags), default=0.0),
+        "loop_lag_max_ms": max((record["max_ms"] for record in lags), default=0.0),
+    }
+    for metric in TURN_METRICS:
+        values = sorted(record[metric] for record in turns if record.get(metric) is not None)
+        summary[metric] = {
+            "p50": round(percentile(values, 0.50), 1),
+            "p95": round(percentile(values, 0.95), 1),
+            "p99": round(percentile(values, 0.99), 1),
+        }
+    return summary
+
+def read_trace_records(trace_dir: str) -> List[Dict[str, Any]]:
+    records = []
+    for filename in sorted(os.listdir(trace_dir)):
+        if filename.endswith(".jsonl"):
+            with open(os.path.join(trace_dir, filename), "r", encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+async def run_soak(args) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix="agent-soak-")
+    trace_dir = os.path.join(work_dir, "traces")
+    socket_path = os.path.join(work_dir, "ready.sock")
+    ready_token = uuid.uuid4().hex
+
+    env = os.environ.copy()
+    env.update({
+        "LIVEKIT_URL": args.livekit_url,
+        "LIVEKIT_API_KEY": args.api_key,
+        "LIVEKIT_API_SECRET": args.api_secret,
+        "AGENT_MOCK_PLUGINS": "1",
+        "AGENT_TURN_TRACE_DIR": trace_dir,
+        "AGENT_TTS_CACHE_DIR": os.path.join(work_dir, "tts_audio_cache"),
+        "AGENT_READY_SOCKET": socket_path,
+        "AGENT_READY_TOKEN": ready_token,
+        "MOCK_STT_DELAY_MS": str(args.stt_delay_ms),
+        "MOCK_LLM_TTFT_MS": str(args.llm_ttft_ms),
+        "MOCK_LLM_TOKEN_MS": str(args.llm_token_ms),
+        "MOCK_TTS_TTFB_MS": str(args.tts_ttfb_ms),
+    })
+    if args.transcripts:
+        env["MOCK_TRANSCRIPTS"] = os.path.abspath(args.transcripts)
+
+    utterance, sample_rate = load_utterance(args.audio)
+    worker_log = open(os.path.join(work_dir, "worker.log"), "wb")
+    ready = asyncio.create_task(wait_for_worker(socket_path, ready_token, args.worker_timeout))
+    # Laisser le serveur de préparation démarrer avant le worker
+    await asyncio.sleep(0.1)
+    worker = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(AGENTS_DIR, "voice_agent.py"), "--agent-name", AGENT_NAME,
+        env=env, stdout=worker_log, stderr=asyncio.subprocess.STDOUT
+    )
+    print(f"Worker démarré (pid={worker.pid}), traces et logs dans {work_dir}", flush=True)
+
+    lkapi = api.LiveKitAPI(url=args.livekit_url, api_key=args.api_key, api_secret=args.api_secret)
+    sampler = ResourceSampler(worker.pid, args.sample_interval)
+    sessions: List[CallerSession] = []
+    levels = []
+    try:
+        await ready
+        sampler.start()
+        # Mesure au repos avant la première session
+        idle_start = time.time()
+        await asyncio.sleep(args.sample_interval * 3)
+        levels.append({"sessions": 0, "start": idle_start, "end": time.time()})
+
+        for target in args.levels:
+            while len(sessions) < target:
+                session = CallerSession(args, lkapi, utterance, sample_rate, len(sessions))
+                await session.start()
+                sessions.append(session)
+            # Laisser les nouvelles sessions démarrer avant de mesurer le palier
+            await asyncio.sleep(args.warmup)
+            start = time.time()
+            await asyncio.sleep(args.hold)
+            levels.append({"sessions": target, "start": start, "end": time.time()})
+            print(f"Palier {target} sessions terminé", flush=True)
+    finally:
+        await sampler.stop()
+        await asyncio.gather(*(session.stop() for session in sessions), return_exceptions=True)
+        await lkapi.aclose()
+        if worker.returncode is None:
+            worker.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(worker.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                worker.kill()
+                await worker.wait()
+        worker_log.close()
+
+    records = read_trace_records(trace_dir) if os.path.isdir(trace_dir) else []
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("api_key", "api_secret", "output")},
+        "levels": [summarize_level(level, sampler.samples, records) for level in levels],
+        "samples": sampler.samples,
+    }
+
+def estimate_capacity(levels: List[Dict[str, Any]], factor: float) -> int:
+    """
+    Plus grand palier dont le p95 de début de lecture reste sous factor x celui du premier palier
+    """
+    measured = [level for level in levels if level["sessions"] > 0 and level["turns"]]
+    if not measured:
+        return 0
+    baseline = measured[0]["playout_start_ms"]["p95"]
+    capacity = 0
+    for level in measured:
+        if level["playout_start_ms"]["p95"] > baseline * factor:
+            break
+        capacity = level["sessions"]
+    return capacity
+
+def print_report(report: Dict[str, Any], factor: float) -> None:
+    print(
+        f"{'sessions':>8} {'tours':>6} {'cpu moy':>8} {'cpu max':>8} {'rss max':>9} "
+        f"{'lag p99':>8} {'lag max':>8} {'stt p95':>8} {'ttft p95':>9} {'lecture p50':>12} {'lecture p95':>12}"
+    )
+    for level in report["levels"]:
+        print(
+            f"{level['sessions']:>8} {level['turns']:>6} {level['cpu_percent_avg']:>7.1f}% {level['cpu_percent_max']:>7.1f}% "
+            f"{level['rss_mb_max']:>7.1f}MB {level['loop_lag_p99_ms']:>6.1f}ms {level['loop_lag_max_ms']:>6.1f}ms "
+            f"{level['stt_final_ms']['p95']:>6.1f}ms {level['llm_request_ttft_ms']['p95']:>7.1f}ms "
+            f"{level['playout_start_ms']['p50']:>10.1f}ms {level['playout_start_ms']['p95']:>10.1f}ms"
+        )
+    print(f"Capacité estimée (p95 début de lecture < {factor}x le premier palier): {estimate_capacity(report['levels'], factor)} sessions")
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge d'un worker voice_agent.py avec des plugins simulés")
+    parser.add_argument("--livekit-url", type=str, default=os.getenv("LIVEKIT_URL", "ws://localhost:7880"), help="Serveur LiveKit (local)")
+    parser.add_argument("--api-key", type=str, default=os.getenv("LIVEKIT_API_KEY", "devkey"), help="Clé API LiveKit")
+    parser.add_argument("--api-secret", type=str, default=os.getenv("LIVEKIT_API_SECRET", "secret"), help="Secret API LiveKit")
+    parser.add_argument("--levels", type=str, default="1,5,10,20", help="Nombre de sessions simultanées par palier")
+    parser.add_argument("--hold", type=float, default=60.0, help="Durée de mesure de chaque palier (secondes)")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Délai avant la mesure d'un palier (secondes)")
+    parser.add_argument("--audio", type=str, help="WAV PCM 16 bits mono joué par chaque appelant (généré sinon)")
+    parser.add_argument("--pause", type=float, default=4.0, help="Silence entre deux prises de parole (secondes)")
+    parser.add_argument("--transcripts", type=str, help="Transcriptions prédéfinies, une par ligne")
+    parser.add_argument("--stt-delay-ms", type=float, default=150.0, help="Délai du STT simulé")
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0, help="Délai avant le premier token du LLM simulé")
+    parser.add_argument("--llm-token-ms", type=float, default=20.0, help="Délai entre deux tokens du LLM simulé")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=200.0, help="Délai avant le premier octet du TTS simulé")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Intervalle d'échantillonnage CPU/RSS (secondes)")
+    parser.add_argument("--worker-timeout", type=float, default=60.0, help="Délai maximal de démarrage du worker")
+    parser.add_argument("--degradation-factor", type=float, default=1.5, help="Dégradation tolérée du p95 de début de lecture")
+    parser.add_argument("--output", type=str, help="Fichier JSON où écrire les résultats")
+
+    args = parser.parse_args()
+    args.levels = sorted(int(level) for level in args.levels.split(",") if level)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    report = asyncio.run(run_soak(args))
+    print_report(report, args.degradation_factor)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+if __name__ == "__main__":
+    main()
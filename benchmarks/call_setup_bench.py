@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Benchmark hors ligne de la mise en place des appels.
+L'application FastAPI tourne dans le processus, avec une API LiveKit et un webhook Xano
+simulés (latence et erreurs configurables) et un agent factice. Chaque scénario
+(/api/calls/initiate, /api/agents/deploy, /api/trunks/create) est exécuté à des niveaux
+de concurrence croissants; on mesure le débit et les latences p50/p95/p99.
+
+    python benchmarks/call_setup_bench.py --levels 1,10,50 --requests 200 --latency-ms 20
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Dict, Any, List, Callable
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+API_KEY = "bench-api-key"
+SCENARIOS = ["initiate", "deploy", "trunks"]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+def configure_environment(args) -> None:
+    """
+    Doit être appelé avant d'importer l'application: les paramètres sont lus à l'import
+    """
+    work_dir = tempfile.mkdtemp(prefix="call-setup-bench-")
+    os.environ.update({
+        "LIVEKIT_URL": "ws://livekit.bench",
+        "LIVEKIT_API_KEY": "bench",
+        "LIVEKIT_API_SECRET": "bench-secret",
+        "API_SECRET_KEY": API_KEY,
+        "XANO_WEBHOOK_URL": "http://xano.bench/webhook",
+        "XANO_API_KEY": "bench",
+        "AGENT_SCRIPT_PATH": os.path.join(BENCH_DIR, "stub_agent.py"),
+        "AGENT_CONFIG_DIR": os.path.join(work_dir, "agent_configs"),
+        "AGENT_READY_SOCKET": os.path.join(work_dir, "agent-ready.sock"),
+        "STUB_AGENT_STARTUP_MS": str(args.agent_startup_ms),
+        # Mesurer la mise en place, pas la cadence de numérotation des trunks
+        "DIAL_DEFAULT_CPS": "0",
+        "DIAL_DEFAULT_MAX_CONCURRENT": "0",
+    })
+
+class LevelResult:
+    def __init__(self, scenario: str, concurrency: int):
+        self.scenario = scenario
+        self.concurrency = concurrency
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.status_codes: Dict[int, int] = {}
+        self.duration = 0.0
+
+    def record(self, latency: float, status_code: int) -> None:
+        self.latencies.append(latency)
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        if status_code >= 400:
+            self.errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "scenario": self.scenario,
+            "concurrency": self.concurrency,
+            "requests": len(latencies),
+            "errors": self.errors,
+            "status_codes": self.status_codes,
+            "throughput_rps": round(len(latencies) / self.duration, 1) if self.duration else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+
+async def run_level(client, scenario: str, concurrency: int, total_requests: int,
+                    make_request: Callable[[int], Dict[str, Any]]) -> LevelResult:
+    """
+    Boucle fermée: `concurrency` clients envoient au total `total_requests` requêtes
+    """
+    result = LevelResult(scenario, concurrency)
+    counter = iter(range(total_requests))
+
+    async def worker():
+        for index in counter:
+            request = make_request(index)
+            start_time = time.perf_counter()
+            try:
+                response = await client.post(request["path"], json=request["json"])
+                status_code = response.status_code
+            except Exception:
+                status_code = 599
+            result.record(time.perf_counter() - start_time, status_code)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.duration = time.perf_counter() - start_time
+    return result
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+    from fake_livekit import FakeLatency, FakeLiveKitServer, FakeXanoWebhook
+    from app.main import app
+    from app.services.livekit_client import livekit_client
+    from app.services.xano_outbox import xano_outbox
+    from app.services.agent_service import agent_service
+
+    fake_livekit = FakeLiveKitServer({
+        "default": FakeLatency(args.latency_ms, args.jitter_ms, args.error_rate),
+    })
+    fake_xano = FakeXanoWebhook(FakeLatency(args.xano_latency_ms, args.jitter_ms, args.error_rate))
+    livekit_client._api = fake_livekit
+    xano_outbox.client = httpx.AsyncClient(
+        transport=fake_xano.transport(),
+        headers={"X-API-Key": xano_outbox.api_key}
+    )
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    client = httpx.AsyncClient(
+        transport=transport,
+        base_url="http://api.bench",
+        headers={"X-API-Key": API_KEY},
+        timeout=httpx.Timeout(60)
+    )
+
+    agent_ids = [f"bench-{i}" for i in range(args.agents)]
+    results = []
+    try:
+        # Les agents utilisés par "initiate" sont déployés avant la mesure
+        if "initiate" in args.scenarios and not args.cold_agents:
+            for agent_id in agent_ids:
+                await client.post("/api/agents/deploy", json={"agent_id": agent_id})
+
+        for concurrency in args.levels:
+            run_id = uuid.uuid4().hex[:6]
+            scenarios = {
+                "initiate": lambda i: {"path": "/api/calls/initiate", "json": {
+                    "agent_id": agent_ids[i % len(agent_ids)],
+                    "phone_number": f"+3361{i:07d}",
+                    "trunk_id": "ST_bench",
+                    "call_id": f"bench-{run_id}-{i}",
+                }},
+                "deploy": lambda i: {"path": "/api/agents/deploy", "json": {
+                    "agent_id": f"bench-deploy-{run_id}-{i % args.agents}",
+                    "prompt_template": "Vous êtes un agent de test.",
+                }},
+                "trunks": lambda i: {"path": "/api/trunks/create", "json": {
+                    "name": f"bench-trunk-{run_id}-{i}",
+                    "phone_number": f"+3361{i:07d}",
+                    "auth_username": "bench",
+                    "auth_password": "bench",
+                }},
+            }
+            for scenario in args.scenarios:
+                result = await run_level(client, scenario, concurrency, args.requests, scenarios[scenario])
+                results.append(result.summary())
+                print_row(results[-1])
+
+            # Arrêter les agents lancés par le scénario "deploy" avant le niveau suivant
+            for agent in await agent_service.list_agents():
+                if str(agent.get("agent_id")).startswith(f"bench-deploy-{run_id}"):
+                    await agent_service.stop_agent(agent["agent_id"])
+    finally:
+        await client.aclose()
+        await app.router.shutdown()
+
+    return {
+        "config": {
+            "levels": args.levels,
+            "requests": args.requests,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "xano_latency_ms": args.xano_latency_ms,
+            "error_rate": args.error_rate,
+            "agents": args.agents,
+        },
+        "results": results,
+        "livekit_calls": fake_livekit.calls,
+        "xano_events_received": fake_xano.received,
+    }
+
+def print_row(row: Dict[str, Any]) -> None:
+    print(
+        f"{row['scenario']:<10} c={row['concurrency']:<4} n={row['requests']:<6} err={row['errors']:<5} "
+        f"{row['throughput_rps']:>8.1f} req/s  p50={row['p50_ms']:>8.1f}ms  "
+        f"p95={row['p95_ms']:>8.1f}ms  p99={row['p99_ms']:>8.1f}ms",
+        flush=True
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne de la mise en place des appels")
+    parser.add_argument("--levels", type=str, default="1,5,10,25,50", help="Niveaux de concurrence, séparés par des virgules")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes par scénario et par niveau")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS), help="Scénarios à exécuter")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latence moyenne simulée de LiveKit")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Écart-type de la latence simulée")
+    parser.add_argument("--xano-latency-ms", type=float, default=50.0, help="Latence moyenne simulée du webhook Xano")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion d'appels simulés en erreur")
+    parser.add_argument("--agents", type=int, default=5, help="Nombre d'agents distincts utilisés")
+    parser.add_argument("--agent-startup-ms", type=float, default=200.0, help="Délai de démarrage de l'agent factice")
+    parser.add_argument("--cold-agents", action="store_true", help="Ne pas déployer les agents avant le scénario initiate")
+    parser.add_argument("--output", type=str, help="Fichier JSON où écrire les résultats")
+    parser.add_argument("--verbose", action="store_true", help="Afficher les logs de l'application")
+
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",") if level]
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Scénarios inconnus: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    configure_environment(args)
+    report = asyncio.run(run_benchmark(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+if __name__ == "__main__":
+    main()
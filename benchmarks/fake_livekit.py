@@ -0,0 +1,143 @@
+"""
+Remplaçants en mémoire de l'API serveur LiveKit et du webhook Xano pour les benchmarks.
+Chaque service simule une latence réseau configurable et peut injecter des erreurs.
+"""
+
+import time
+import random
+import asyncio
+import itertools
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
+import httpx
+from livekit import api
+
+class FakeLatency:
+    """
+    Latence simulée (moyenne et écart-type en millisecondes) et taux d'erreur injecté
+    """
+
+    def __init__(self, mean_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    async def wait(self, operation: str) -> None:
+        delay_ms = max(0.0, random.gauss(self.mean_ms, self.jitter_ms))
+        await asyncio.sleep(delay_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise api.TwirpError(api.TwirpErrorCode.UNAVAILABLE, f"injected error in {operation}")
+
+class _FakeService:
+    def __init__(self, server: "FakeLiveKitServer", latency: FakeLatency):
+        self.server = server
+        self.latency = latency
+
+    async def _call(self, operation: str) -> None:
+        self.server.calls[operation] = self.server.calls.get(operation, 0) + 1
+        await self.latency.wait(operation)
+
+class FakeRoomService(_FakeService):
+    async def get_room(self, request):
+        await self._call("room.get_room")
+        room = self.server.rooms.get(request.name)
+        if room is None:
+            raise api.TwirpError(api.TwirpErrorCode.NOT_FOUND, "room not found")
+        return room
+
+    async def create_room(self, request):
+        await self._call("room.create_room")
+        room = self.server.rooms.get(request.name)
+        if room is None:
+            room = SimpleNamespace(
+                name=request.name,
+                sid=f"RM_{next(self.server.ids)}",
+                empty_timeout=request.empty_timeout,
+                creation_time=int(time.time())
+            )
+            self.server.rooms[request.name] = room
+            # Dispatch demandé à la création de la salle
+            for dispatch in getattr(request, "agents", None) or []:
+                self.server.dispatches.append((dispatch.agent_name, request.name))
+        return room
+
+    async def delete_room(self, request):
+        await self._call("room.delete_room")
+        self.server.rooms.pop(request.room, None)
+        return SimpleNamespace()
+
+    async def list_participants(self, request):
+        await self._call("room.list_participants")
+        return []
+
+class FakeAgentDispatchService(_FakeService):
+    async def create_dispatch(self, request):
+        await self._call("agent_dispatch.create_dispatch")
+        self.server.dispatches.append((request.agent_name, request.room))
+        return SimpleNamespace(id=f"AD_{next(self.server.ids)}", agent_name=request.agent_name, room=request.room)
+
+class FakeSipService(_FakeService):
+    async def create_sip_participant(self, request):
+        await self._call("sip.create_sip_participant")
+        return SimpleNamespace(
+            participant_id=f"PA_{next(self.server.ids)}",
+            participant_identity=request.participant_identity,
+            room_name=request.room_name,
+            sip_call_id=f"SCL_{next(self.server.ids)}"
+        )
+
+    async def create_sip_outbound_trunk(self, request):
+        await self._call("sip.create_sip_outbound_trunk")
+        trunk = SimpleNamespace(
+            sip_trunk_id=f"ST_{next(self.server.ids)}",
+            name=request.trunk.name,
+            address=request.trunk.address,
+            numbers=list(request.trunk.numbers),
+            auth_username=request.trunk.auth_username
+        )
+        self.server.trunks.append(trunk)
+        return trunk
+
+    async def list_sip_outbound_trunk(self, request):
+        await self._call("sip.list_sip_outbound_trunk")
+        return SimpleNamespace(items=list(self.server.trunks))
+
+class FakeLiveKitServer:
+    """
+    Se substitue à api.LiveKitAPI: expose room, agent_dispatch et sip
+    """
+
+    def __init__(self, latency: Optional[Dict[str, FakeLatency]] = None):
+        latency = latency or {}
+        default = latency.get("default", FakeLatency())
+        self.ids = itertools.count(1)
+        self.rooms: Dict[str, Any] = {}
+        self.dispatches = []
+        self.trunks = []
+        self.calls: Dict[str, int] = {}
+        self.room = FakeRoomService(self, latency.get("room", default))
+        self.agent_dispatch = FakeAgentDispatchService(self, latency.get("agent_dispatch", default))
+        self.sip = FakeSipService(self, latency.get("sip", default))
+
+    async def aclose(self) -> None:
+        pass
+
+class FakeXanoWebhook:
+    """
+    Webhook Xano simulé, branché sur le client httpx de l'outbox via un MockTransport
+    """
+
+    def __init__(self, latency: Optional[FakeLatency] = None):
+        self.latency = latency or FakeLatency(mean_ms=50, jitter_ms=20)
+        self.received = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        try:
+            await self.latency.wait("xano.webhook")
+        except Exception:
+            return httpx.Response(503, json={"error": "injected error"})
+        self.received += 1
+        return httpx.Response(200, json={"ok": True})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Agent factice pour les benchmarks: signale sa préparation comme le vrai agent
+puis attend d'être arrêté. Le délai de démarrage est simulé via STUB_AGENT_STARTUP_MS.
+"""
+
+import os
+import sys
+import time
+import signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agents"))
+
+import readiness
+
+def main():
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    time.sleep(float(os.getenv("STUB_AGENT_STARTUP_MS", "200")) / 1000)
+    readiness.notify("prewarmed")
+    readiness.notify("registered")
+    print(f"stub agent prêt: {' '.join(sys.argv[1:])}", flush=True)
+    while True:
+        time.sleep(3600)
+
+if __name__ == "__main__":
+    main()
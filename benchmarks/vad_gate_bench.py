@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmark hors ligne du pré-filtre d'énergie du VAD (agents/vad_gate.py) sur un
+enregistrement d'appel SIP (WAV PCM 16 bits mono, 8kHz) ou sur un appel synthétique
+(prises de parole séparées par des silences, bruit de ligne et ronflette 50Hz).
+
+L'audio est découpé en trames de 20ms puis:
+    - passé au pré-filtre seul: coût du pré-filtre et part des trames écartées;
+    - passé à Silero deux fois, toutes les trames puis uniquement les trames
+      transmises par le pré-filtre: CPU de Silero dans les deux cas, et écart des
+      débuts et fins de parole détectés (la fin de parole déclenche la réponse de
+      l'agent, elle ne doit pas être retardée).
+
+    python benchmarks/vad_gate_bench.py --audio appel_8k.wav
+    python benchmarks/vad_gate_bench.py --duration 120 --no-silero
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import logging
+import argparse
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from livekit import rtc
+from livekit.agents import vad
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "agents")
+sys.path.insert(0, AGENTS_DIR)
+
+from vad_gate import EnergyGate, gate_summary
+
+logger = logging.getLogger("vad_gate_bench")
+
+def load_audio(path: str) -> Tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError("Le fichier audio doit être un WAV PCM 16 bits mono")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16), f.getframerate()
+
+def synthetic_call(duration: float, sample_rate: int = 8000, seed: int = 0) -> Tuple[np.ndarray, int, List[Tuple[float, float]]]:
+    """
+    Appel synthétique et ses régions de parole (secondes): 1 à 4s de parole voisée
+    (harmoniques de 120Hz, enveloppe syllabique de 4Hz) toutes les 3 à 9s
+    """
+    rng = np.random.default_rng(seed)
+    total = int(duration * sample_rate)
+    t = np.arange(total) / sample_rate
+    # Bruit de ligne limité à la bande téléphonique (-50 dBFS) et ronflette (-55 dBFS)
+    noise = np.convolve(rng.standard_normal(total), np.ones(3) / 3, mode="same")
+    audio = noise / np.sqrt(np.mean(noise ** 2)) * 10 ** (-50 / 20) + np.sin(2 * np.pi * 50 * t) * 10 ** (-55 / 20) * np.sqrt(2)
+
+    segments = []
+    position = rng.uniform(1.0, 3.0)
+    while position < duration - 1.0:
+        length = min(rng.uniform(1.0, 4.0), duration - position - 0.5)
+        start, end = int(position * sample_rate), int((position + length) * sample_rate)
+        local_t = t[:end - start]
+        voiced = sum(np.sin(2 * np.pi * 120 * k * local_t) / k for k in range(1, 25) if 120 * k < sample_rate / 2)
+        envelope = np.clip(np.sin(2 * np.pi * 4 * local_t), 0, None) ** 0.5
+        speech = voiced * envelope
+        audio[start:end] += speech / np.max(np.abs(speech)) * rng.uniform(0.1, 0.4)
+        segments.append((position, position + length))
+        position += length + rng.uniform(3.0, 9.0)
+
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16), sample_rate, segments
+
+def split_frames(audio: np.ndarray, sample_rate: int, frame_ms: int) -> List[rtc.AudioFrame]:
+    samples_per_frame = sample_rate * frame_ms // 1000
+    count = len(audio) // samples_per_frame
+    return [
+        rtc.AudioFrame(
+            data=audio[index * samples_per_frame:(index + 1) * samples_per_frame].tobytes(),
+            sample_rate=sample_rate,
+            num_channels=1,
+            samples_per_channel=samples_per_frame
+        )
+        for index in range(count)
+    ]
+
+def run_gate(frames: List[rtc.AudioFrame], args) -> Dict[str, Any]:
+    """
+    Passe toutes les trames au pré-filtre; retourne les indices des trames transmises
+    """
+    gate = EnergyGate(threshold_db=args.threshold_db, hangover_ms=args.hangover_ms,
+                      preroll_ms=args.preroll_ms, block_ms=args.block_ms)
+    positions = {id(frame): index for index, frame in enumerate(frames)}
+    forwarded = []
+    start_time = time.perf_counter()
+    for frame in frames:
+        forwarded.extend(positions[id(out)] for out in gate.process(frame))
+    elapsed = time.perf_counter() - start_time
+    return {"forwarded": forwarded, "elapsed": elapsed, "summary": gate_summary(gate.stats)}
+
+async def run_silero(vad_model: vad.VAD, frames: List[rtc.AudioFrame]) -> Dict[str, Any]:
+    """
+    Passe les trames à un flux Silero; retourne le CPU consommé et les événements
+    de début/fin de parole (position en échantillons dans l'audio transmis)
+    """
+    stream = vad_model.stream()
+    events = []
+
+    async def collect():
+        async for event in stream:
+            if event.type in (vad.VADEventType.START_OF_SPEECH, vad.VADEventType.END_OF_SPEECH):
+                events.append((event.type, event.samples_index))
+
+    collect_task = asyncio.create_task(collect())
+    start_cpu = time.process_time()
+    for index, frame in enumerate(frames):
+        stream.push_frame(frame)
+        if index % 50 == 0:
+            await asyncio.sleep(0)
+    stream.end_input()
+    await collect_task
+    cpu = time.process_time() - start_cpu
+    await stream.aclose()
+    return {"cpu": cpu, "events": events}
+
+def to_segments(events: List[Tuple[Any, int]], sample_positions: np.ndarray, samples_per_frame: int,
+                sample_rate: int) -> List[Tuple[float, Optional[float]]]:
+    """
+    Régions de parole en secondes dans l'audio d'origine. sample_positions donne la
+    position d'origine de chaque trame transmise au VAD.
+    """
+    def original_time(samples_index: int) -> float:
+        frame = min(samples_index // samples_per_frame, len(sample_positions) - 1)
+        return (sample_positions[frame] + samples_index - frame * samples_per_frame) / sample_rate
+
+    segments = []
+    for event_type, samples_index in events:
+        if event_type == vad.VADEventType.START_OF_SPEECH:
+            segments.append((original_time(samples_index), None))
+        elif segments and segments[-1][1] is None:
+            segments[-1] = (segments[-1][0], original_time(samples_index))
+    return segments
+
+def compare_segments(reference: List[Tuple[float, Optional[float]]], gated: List[Tuple[float, Optional[float]]]) -> Dict[str, Any]:
+    """
+    Associe chaque région de référence à la région filtrée qui la chevauche
+    """
+    start_deltas, end_deltas, missed = [], [], 0
+    for ref_start, ref_end in reference:
+        ref_end = ref_end if ref_end is not None else float("inf")
+        match = next((segment for segment in gated
+                      if segment[0] < ref_end and (segment[1] is None or segment[1] > ref_start)), None)
+        if match is None:
+            missed += 1
+            continue
+        start_deltas.append((match[0] - ref_start) * 1000)
+        if match[1] is not None and ref_end != float("inf"):
+            end_deltas.append((match[1] - ref_end) * 1000)
+
+    def describe(deltas: List[float]) -> Dict[str, float]:
+        if not deltas:
+            return {"mean": 0.0, "max": 0.0}
+        return {"mean": round(float(np.mean(deltas)), 1), "max": round(float(np.max(np.abs(deltas))), 1)}
+
+    return {
+        "reference_segments": len(reference),
+        "gated_segments": len(gated),
+        "missed": missed,
+        "start_delta_ms": describe(start_deltas),
+        "end_delta_ms": describe(end_deltas),
+    }
+
+def ground_truth_recall(segments: List[Tuple[float, float]], forwarded: List[int], frame_ms: int) -> float:
+    """
+    Part des trames de parole (vérité terrain de l'appel synthétique) transmises au VAD
+    """
+    forwarded_set = set(forwarded)
+    speech_frames = [index for start, end in segments
+                     for index in range(int(start * 1000 / frame_ms), int(end * 1000 / frame_ms))]
+    if not speech_frames:
+        return 1.0
+    return sum(1 for index in speech_frames if index in forwarded_set) / len(speech_frames)
+
+async def run_bench(args) -> Dict[str, Any]:
+    truth = None
+    if args.audio:
+        audio, sample_rate = load_audio(args.audio)
+    else:
+        audio, sample_rate, truth = synthetic_call(args.duration)
+    frames = split_frames(audio, sample_rate, args.frame_ms)
+    samples_per_frame = sample_rate * args.frame_ms // 1000
+    duration = len(frames) * args.frame_ms / 1000
+
+    gate_runs = [run_gate(frames, args) for _ in range(args.repeat)]
+    forwarded = gate_runs[0]["forwarded"]
+    report = {
+        "audio_seconds": round(duration, 1),
+        "sample_rate": sample_rate,
+        "frames": len(frames),
+        "forwarded_frames": len(forwarded),
+        "skipped_ratio": round(1 - len(forwarded) / len(frames), 3) if frames else 0.0,
+        "gate_us_per_audio_second": round(min(run["elapsed"] for run in gate_runs) / duration * 1e6, 1),
+        "gate_summary": gate_runs[0]["summary"],
+    }
+    if truth is not None:
+        report["speech_frames_forwarded"] = round(ground_truth_recall(truth, forwarded, args.frame_ms), 4)
+
+    if args.silero:
+        from livekit.plugins import silero
+        vad_model = silero.VAD.vad()
+        reference = await run_silero(vad_model, frames)
+        gated = await run_silero(vad_model, [frames[index] for index in forwarded])
+
+        all_positions = np.arange(len(frames)) * samples_per_frame
+        gated_positions = np.array(forwarded, dtype=np.int64) * samples_per_frame
+        report["silero_cpu_seconds"] = {"all_frames": round(reference["cpu"], 3), "gated": round(gated["cpu"], 3)}
+        report["silero_cpu_saved_ratio"] = round(1 - gated["cpu"] / reference["cpu"], 3) if reference["cpu"] else 0.0
+        report["segments"] = compare_segments(
+            to_segments(reference["events"], all_positions, samples_per_frame, sample_rate),
+            to_segments(gated["events"], gated_positions, samples_per_frame, sample_rate) if forwarded else []
+        )
+
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Audio: {report['audio_seconds']}s à {report['sample_rate']}Hz, {report['frames']} trames")
+    print(f"Pré-filtre: {report['gate_summary']}, {report['gate_us_per_audio_second']}µs par seconde d'audio")
+    if "speech_frames_forwarded" in report:
+        print(f"Trames de parole transmises (vérité terrain): {report['speech_frames_forwarded']:.2%}")
+    if "segments" in report:
+        cpu = report["silero_cpu_seconds"]
+        segments = report["segments"]
+        print(f"CPU Silero: {cpu['all_frames']}s -> {cpu['gated']}s ({report['silero_cpu_saved_ratio']:.0%} économisés)")
+        print(
+            f"Régions de parole: {segments['reference_segments']} -> {segments['gated_segments']} "
+            f"({segments['missed']} manquées), écart début moy {segments['start_delta_ms']['mean']}ms "
+            f"max {segments['start_delta_ms']['max']}ms, écart fin moy {segments['end_delta_ms']['mean']}ms "
+            f"max {segments['end_delta_ms']['max']}ms"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pré-filtre d'énergie du VAD")
+    parser.add_argument("--audio", type=str, help="Enregistrement d'appel SIP (WAV PCM 16 bits mono, 8kHz); appel synthétique sinon")
+    parser.add_argument("--duration", type=float, default=120.0, help="Durée de l'appel synthétique (secondes)")
+    parser.add_argument("--frame-ms", type=int, default=20, help="Durée des trames")
+    parser.add_argument("--threshold-db", type=float, help="Seuil au-dessus du bruit de fond (AGENT_VAD_GATE_THRESHOLD_DB)")
+    parser.add_argument("--hangover-ms", type=float, help="Prolongation après la parole (AGENT_VAD_GATE_HANGOVER_MS)")
+    parser.add_argument("--preroll-ms", type=float, help="Audio transmis avant l'ouverture (AGENT_VAD_GATE_PREROLL_MS)")
+    parser.add_argument("--block-ms", type=float, help="Bloc analysé porte fermée (AGENT_VAD_GATE_BLOCK_MS)")
+    parser.add_argument("--repeat", type=int, default=5, help="Répétitions de la mesure du pré-filtre")
+    parser.add_argument("--no-silero", dest="silero", action="store_false", help="Ne pas comparer avec Silero")
+    parser.add_argument("--output", type=str, help="Fichier JSON où écrire les résultats")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    report = asyncio.run(run_bench(args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Dict, List
+from app.services.xano_outbox import XanoOutbox
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = ""
+
+class FakeXanoClient:
+    """
+    Client HTTP de test: enregistre les corps postés, dans l'ordre de leur réception
+    """
+
+    def __init__(self):
+        self.bodies: List[Dict[str, Any]] = []
+
+    async def post(self, url: str, json: Dict[str, Any]) -> FakeResponse:
+        await asyncio.sleep(0.01)
+        self.bodies.append(json)
+        return FakeResponse(200)
+
+    async def aclose(self) -> None:
+        pass
+
+def make_outbox(batch_max_events: int, senders: int) -> XanoOutbox:
+    outbox = XanoOutbox()
+    outbox.webhook_url = outbox.batch_webhook_url = "http://xano.test/call-events"
+    outbox.api_key = "test"
+    outbox.batch_max_events = batch_max_events
+    outbox.batch_linger = 0.2
+    outbox.sender_count = senders
+    outbox.client = FakeXanoClient()
+    return outbox
+
+def posted_events(client: FakeXanoClient) -> List[Dict[str, Any]]:
+    events = []
+    for body in client.bodies:
+        events.extend(body["events"] if "events" in body else [body])
+    return events
+
+def test_interleaved_calls_across_senders_are_all_posted_in_order():
+    """
+    Deux tâches d'envoi qui prennent X1 puis Y2 et Y1 puis X2 ne doivent pas
+    s'attendre mutuellement
+    """
+    async def scenario():
+        outbox = make_outbox(batch_max_events=10, senders=2)
+        client = outbox.client
+        await outbox.start()
+        await asyncio.sleep(0.01)
+
+        for call_id, seq in [("X", 1), ("Y", 1), ("Y", 2), ("X", 2)]:
+            assert outbox.enqueue({"call_id": call_id, "status": f"s{seq}", "seq": seq})
+            # Laisser la tâche d'envoi en attente prendre l'événement
+            await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(outbox.queue.join(), timeout=5)
+        await outbox.stop()
+        return posted_events(client), outbox
+
+    events, outbox = asyncio.run(scenario())
+
+    assert len(events) == 4
+    for call_id in ("X", "Y"):
+        assert [event["seq"] for event in events if event["call_id"] == call_id] == [1, 2]
+    assert outbox._call_tails == {}
+
+def test_events_of_one_call_keep_their_order_with_many_senders():
+    async def scenario():
+        outbox = make_outbox(batch_max_events=5, senders=4)
+        client = outbox.client
+        await outbox.start()
+
+        for seq in range(60):
+            assert outbox.enqueue({"call_id": f"call-{seq % 6}", "status": "s", "seq": seq})
+            if seq % 7 == 0:
+                await asyncio.sleep(0.005)
+
+        await asyncio.wait_for(outbox.queue.join(), timeout=10)
+        await outbox.stop()
+        return posted_events(client)
+
+    events = asyncio.run(scenario())
+
+    assert len(events) == 60
+    for index in range(6):
+        seqs = [event["seq"] for event in events if event["call_id"] == f"call-{index}"]
+        assert seqs == sorted(seqs)